@@ -0,0 +1,3 @@
+"""
+性能基准测试（python -m benchmarks.<模块名> 运行）
+"""
@@ -0,0 +1,137 @@
+"""
+generate_sketch_code 边连接的微基准测试：网格哈希索引 vs 逐条扫描（原实现）
+
+构造边数很多的Wire（直线与圆弧交替、边的顺序打乱），分别用两种方式生成草图代码，
+检查生成的代码完全一致并比较耗时。
+
+运行：python -m benchmarks.edge_chaining_benchmark --sizes 50 200 800
+"""
+import argparse
+import math
+import random
+import time
+
+import cadquery as cq
+from OCP.BRep import BRep_Builder
+from OCP.TopoDS import TopoDS_Wire
+
+from generators import sketch_code_generator
+from generators.sketch_record import SketchRecord
+
+
+class NaiveEndpointIndex:
+    """原实现：每一步扫描所有未使用的边，计算到起点和终点的距离（含开方）"""
+
+    def __init__(self, edge_info_list, tolerance=sketch_code_generator.CONNECT_TOLERANCE):
+        self.edge_info_list = edge_info_list
+        self.tolerance = tolerance
+
+    def take_nearest(self, last_pt):
+        next_edge_info = None
+        min_dist = float('inf')
+        reverse_next = False
+        for edge_info in self.edge_info_list:
+            if edge_info['used']:
+                continue
+            dist_to_start = math.sqrt((edge_info['start'][0] - last_pt[0])**2 +
+                                      (edge_info['start'][1] - last_pt[1])**2)
+            dist_to_end = math.sqrt((edge_info['end'][0] - last_pt[0])**2 +
+                                    (edge_info['end'][1] - last_pt[1])**2)
+            if dist_to_start < min_dist:
+                min_dist = dist_to_start
+                next_edge_info = edge_info
+                reverse_next = False
+            if dist_to_end < min_dist:
+                min_dist = dist_to_end
+                next_edge_info = edge_info
+                reverse_next = True
+        if next_edge_info is None or min_dist > self.tolerance:
+            return None, False
+        return next_edge_info, reverse_next
+
+
+def build_large_wire(edge_count, rng):
+    """
+    构造一个有edge_count条边的闭合Wire：顶点位于0.25网格上的近似圆周，直线与圆弧交替，
+    边按打乱后的顺序加入Wire（与布尔运算结果中边的顺序类似，不一定首尾相接）
+    """
+    radius = max(10.0, edge_count / 4)
+    points = []
+    for i in range(edge_count):
+        angle = 2 * math.pi * i / edge_count
+        points.append(cq.Vector(round(radius * math.cos(angle) * 4) / 4,
+                                round(radius * math.sin(angle) * 4) / 4, 0))
+
+    edges = []
+    for i in range(edge_count):
+        start, end = points[i], points[(i + 1) % edge_count]
+        if i % 2:
+            # 圆弧：中点沿法向向外偏移
+            mid = (start + end) * 0.5
+            mid = mid + mid.normalized() * 0.1
+            edges.append(cq.Edge.makeThreePointArc(start, mid, end))
+        else:
+            edges.append(cq.Edge.makeLine(start, end))
+    rng.shuffle(edges)
+
+    builder = BRep_Builder()
+    wire = TopoDS_Wire()
+    builder.MakeWire(wire)
+    for edge in edges:
+        builder.Add(wire, edge.wrapped)
+    wire.Closed(True)
+    return cq.Wire(wire)
+
+
+def time_generate_sketch_code(sketch, index_class, repeat):
+    """使用指定的端点索引实现生成草图代码，返回(代码, 平均耗时秒数)"""
+    original = sketch_code_generator._EndpointIndex
+    sketch_code_generator._EndpointIndex = index_class
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            code = sketch_code_generator.generate_sketch_code(sketch)
+        elapsed = (time.perf_counter() - start) / repeat
+    finally:
+        sketch_code_generator._EndpointIndex = original
+    return code, elapsed
+
+
+def run_benchmark(sizes, repeat=3, seed=0):
+    """
+    对每种边数运行一次对比
+
+    Returns:
+        list: 每种边数的结果 {'edges', 'naive_ms', 'indexed_ms', 'speedup'}
+    """
+    rng = random.Random(seed)
+    results = []
+    for edge_count in sizes:
+        # 边信息只读取一次，计时只包含生成代码（主要是边连接）的部分
+        sketch = SketchRecord.from_wires([build_large_wire(edge_count, rng)])
+        naive_code, naive_time = time_generate_sketch_code(sketch, NaiveEndpointIndex, repeat)
+        indexed_code, indexed_time = time_generate_sketch_code(
+            sketch, sketch_code_generator._EndpointIndex, repeat)
+        if naive_code != indexed_code:
+            raise AssertionError(f"边数为{edge_count}时两种实现生成的代码不一致")
+        results.append({
+            'edges': edge_count,
+            'naive_ms': naive_time * 1000,
+            'indexed_ms': indexed_time * 1000,
+            'speedup': naive_time / indexed_time,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='generate_sketch_code 边连接微基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 800],
+                        help='Wire的边数（默认50 200 800）')
+    parser.add_argument('--repeat', type=int, default=3, help='每种边数重复次数（默认3）')
+    parser.add_argument('--seed', type=int, default=0, help='打乱边顺序的随机种子（默认0）')
+    args = parser.parse_args()
+
+    print(f"{'边数':>8} {'逐条扫描(ms)':>14} {'哈希索引(ms)':>14} {'加速比':>8}")
+    for result in run_benchmark(args.sizes, args.repeat, args.seed):
+        print(f"{result['edges']:>8} {result['naive_ms']:>14.2f} {result['indexed_ms']:>14.2f} "
+              f"{result['speedup']:>7.1f}x")
@@ -0,0 +1,310 @@
+"""
+生成流程的基准测试：各阶段的微基准及端到端吞吐量
+
+所有输入都由种子决定（草图、样本代码均按固定种子生成），同一种子、同一数量的两次运行
+测量的是完全相同的工作量，可以直接比较。只使用CPU，不需要网络。
+
+测量的阶段：
+- sketch：generate_2d_sketch
+- sketch_code：generate_sketch_code（输入为预先读取的SketchRecord）
+- extrude_code：generate_extruded_cq_code
+- validate：validate_code_volume_change（完整样本代码，经验证进程池执行）
+- save_sequence：save_cq_code_sequence（写入临时目录）
+- end_to_end：按种子生成样本并经后台写入线程写入，与generate_training_dataset的生成循环相同
+  （每个样本的耗时为总耗时除以样本数，包括最后等待写入线程写完的时间）
+
+运行：
+    python -m benchmarks.pipeline_benchmark --count 20 --output bench.json
+    python -m benchmarks.pipeline_benchmark --count 20 --compare bench.json --threshold 0.15
+比较模式下，任一阶段的中位耗时比基准慢超过阈值时以非零状态退出。
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import cadquery as cq
+
+from generators.sketch_generator import generate_2d_sketch
+from generators.sketch_code_generator import generate_sketch_code
+from generators.sketch_record import SketchRecord
+from generators.extrude_code_generator import generate_extruded_cq_code
+from generators.code_validator import validate_code_volume_change
+from processors.dataset_generator import save_cq_code_sequence
+from processors.index_allocator import FileIndexAllocator
+from processors.output_backends import create_output_backend
+from processors.sample_stream import generate_seeded_sample, iter_samples
+from processors.sample_writer import AsyncSampleWriter
+
+
+BENCHMARKS = ('sketch', 'sketch_code', 'extrude_code', 'validate', 'save_sequence', 'end_to_end')
+RESULT_VERSION = 1
+MICRO_REPEAT = 20  # 只生成代码字符串的阶段每次调用不到1ms，重复多次取平均以减小计时误差
+
+
+@contextlib.contextmanager
+def _quiet():
+    """计时期间丢弃生成过程中的输出"""
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _summarize(durations, errors=0):
+    """将每次调用的耗时（秒）汇总为统计结果"""
+    if not durations:
+        return {'count': 0, 'errors': errors}
+    total = sum(durations)
+    return {
+        'count': len(durations),
+        'errors': errors,
+        'total_s': total,
+        'mean_ms': total / len(durations) * 1000,
+        'median_ms': statistics.median(durations) * 1000,
+        'min_ms': min(durations) * 1000,
+        'max_ms': max(durations) * 1000,
+        'per_sec': len(durations) / total if total > 0 else None,
+    }
+
+
+def _time_calls(func, args_list, warmup=1, repeat=1):
+    """
+    依次以args_list中的参数调用func并计时
+
+    先用前warmup组参数预热（不计时，例如启动验证进程）；调用出错的参数组计入errors，不计时。
+    耗时很短的阶段可指定repeat，每组参数连续调用repeat次，取平均耗时。
+    """
+    with _quiet():
+        for args in args_list[:warmup]:
+            try:
+                func(*args)
+            except Exception:
+                pass
+        durations = []
+        errors = 0
+        for args in args_list:
+            start = time.perf_counter()
+            try:
+                for _ in range(repeat):
+                    func(*args)
+            except Exception:
+                errors += 1
+                continue
+            durations.append((time.perf_counter() - start) / repeat)
+    return _summarize(durations, errors)
+
+
+def prepare_inputs(seed, count):
+    """
+    按种子生成各阶段的输入
+
+    Returns:
+        dict: {'sketch_seeds': 每次生成草图使用的种子字符串,
+               'records': SketchRecord列表, 'codes': 完整样本代码列表}
+    """
+    sketch_seeds = [f"benchmark:{seed}:sketch:{i}" for i in range(count)]
+    records = []
+    codes = []
+    with _quiet():
+        for sketch_seed in sketch_seeds:
+            try:
+                regions = generate_2d_sketch(rng=random.Random(sketch_seed))
+            except Exception:
+                continue
+            records.extend(SketchRecord.from_wires(wires) for wires in regions)
+        for index in range(count):
+            record = generate_seeded_sample(seed, index)
+            if record is not None:
+                codes.append(record['code'])
+    return {'sketch_seeds': sketch_seeds, 'records': records[:count], 'codes': codes}
+
+
+def bench_sketch(inputs):
+    return _time_calls(lambda sketch_seed: generate_2d_sketch(rng=random.Random(sketch_seed)),
+                       [(s,) for s in inputs['sketch_seeds']])
+
+
+def bench_sketch_code(inputs):
+    return _time_calls(generate_sketch_code, [(record,) for record in inputs['records']], repeat=MICRO_REPEAT)
+
+
+def bench_extrude_code(inputs):
+    planes = ['XY', 'YZ', 'XZ', "'XY', origin=(0.0, 0.0, 12.50)"]
+    args_list = [
+        (i + 1, planes[i % len(planes)], record, round(10.0 + i % 7, 2))
+        for i, record in enumerate(inputs['records'])
+    ]
+    return _time_calls(generate_extruded_cq_code, args_list, repeat=MICRO_REPEAT)
+
+
+def bench_validate(inputs):
+    return _time_calls(validate_code_volume_change, [(code,) for code in inputs['codes']])
+
+
+def bench_save_sequence(inputs):
+    with tempfile.TemporaryDirectory(prefix="cq_bench_") as base_dir:
+        allocator = FileIndexAllocator(base_dir)
+        return _time_calls(lambda code: save_cq_code_sequence(code, base_dir, allocator=allocator),
+                           [(code,) for code in inputs['codes']], warmup=0)
+
+
+def bench_end_to_end(seed, count, workers=0, output_format='dir', layout='sequence'):
+    """
+    按种子生成count个样本并写入临时目录
+
+    Returns:
+        dict: 汇总结果，另含 'steps'（写入的步数）和 'steps_per_sec'
+    """
+    with tempfile.TemporaryDirectory(prefix="cq_bench_") as base_dir, _quiet():
+        backend = create_output_backend(output_format, base_dir, layout=layout)
+        writer = AsyncSampleWriter(backend)
+        samples = iter_samples(count, workers=workers, seed=seed, on_error=lambda message: None)
+        produced = 0
+        steps = 0
+        start = time.perf_counter()
+        try:
+            for record in samples:
+                steps += writer.submit(record)
+                produced += 1
+        finally:
+            samples.close()
+            writer.close()
+            backend.close()
+        elapsed = time.perf_counter() - start
+
+    result = _summarize([elapsed / produced] * produced if produced else [], count - produced)
+    result['steps'] = steps
+    result['steps_per_sec'] = steps / elapsed if elapsed > 0 else None
+    return result
+
+
+def run_suite(seed=0, count=20, workers=0, benchmarks=BENCHMARKS):
+    """
+    运行基准测试
+
+    Args:
+        seed: 输入的种子
+        count: 每个阶段的输入数（端到端为样本数）
+        workers: 端到端测试的并行进程数（0表示串行）
+        benchmarks: 要运行的阶段（BENCHMARKS的子集）
+
+    Returns:
+        dict: {'version', 'meta': 运行参数与环境, 'results': {阶段: 汇总结果}}
+    """
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"未知的基准测试: {sorted(unknown)}，可选值为 {BENCHMARKS}")
+
+    results = {}
+    micro = [name for name in benchmarks if name != 'end_to_end']
+    if micro:
+        inputs = prepare_inputs(seed, count)
+        for name in micro:
+            results[name] = globals()[f"bench_{name}"](inputs)
+    if 'end_to_end' in benchmarks:
+        results['end_to_end'] = bench_end_to_end(seed, count, workers)
+
+    return {
+        'version': RESULT_VERSION,
+        'meta': {
+            'seed': seed,
+            'count': count,
+            'workers': workers,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cadquery': getattr(cq, '__version__', None),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def compare_results(current, baseline, threshold=0.1, metric='median_ms'):
+    """
+    与基准结果比较
+
+    Args:
+        current, baseline: run_suite的结果
+        threshold: 允许的相对变慢比例，超过时视为性能退化
+        metric: 比较的指标
+
+    Returns:
+        list: 每个阶段的比较结果 {'name', 'baseline', 'current', 'change', 'regression'}，
+            change为相对变化（正数表示变慢）
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base_result = baseline['results'].get(name)
+        if not base_result or result.get(metric) is None or not base_result.get(metric):
+            continue
+        change = result[metric] / base_result[metric] - 1
+        rows.append({
+            'name': name,
+            'baseline': base_result[metric],
+            'current': result[metric],
+            'change': change,
+            'regression': change > threshold,
+        })
+    return rows
+
+
+def _print_results(suite):
+    print(f"{'阶段':<14} {'次数':>6} {'中位(ms)':>10} {'平均(ms)':>10} {'每秒':>10}")
+    for name, result in suite['results'].items():
+        if not result['count']:
+            print(f"{name:<14} {0:>6} {'-':>10} {'-':>10} {'-':>10}")
+            continue
+        print(f"{name:<14} {result['count']:>6} {result['median_ms']:>10.2f} "
+              f"{result['mean_ms']:>10.2f} {result['per_sec']:>10.2f}")
+
+
+def _print_comparison(rows, threshold):
+    print(f"\n{'阶段':<14} {'基准(ms)':>10} {'当前(ms)':>10} {'变化':>9}")
+    for row in rows:
+        flag = "  退化" if row['regression'] else ""
+        print(f"{row['name']:<14} {row['baseline']:>10.2f} {row['current']:>10.2f} "
+              f"{row['change'] * 100:>+8.1f}%{flag}")
+    regressions = [row['name'] for row in rows if row['regression']]
+    if regressions:
+        print(f"\n性能退化（超过{threshold * 100:.0f}%）：{', '.join(regressions)}")
+    else:
+        print(f"\n没有超过{threshold * 100:.0f}%的性能退化")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成流程基准测试')
+    parser.add_argument('--seed', type=int, default=0, help='输入的种子（默认0）')
+    parser.add_argument('--count', type=int, default=20, help='每个阶段的输入数（默认20）')
+    parser.add_argument('--workers', type=int, default=0, help='端到端测试的并行进程数（默认0，即串行）')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help='只运行指定的阶段')
+    parser.add_argument('--output', default=None, help='结果JSON文件路径')
+    parser.add_argument('--compare', default=None, help='基准结果JSON文件路径，与之比较')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='比较时允许的相对变慢比例（默认0.1，即10%%）')
+    args = parser.parse_args()
+
+    suite = run_suite(args.seed, args.count, args.workers, args.only)
+    _print_results(suite)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(suite, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ('seed', 'count', 'workers'):
+            if baseline['meta'].get(key) != suite['meta'][key]:
+                print(f"警告：基准结果的{key}为{baseline['meta'].get(key)}，与当前运行（{suite['meta'][key]}）不同")
+        rows = compare_results(suite, baseline, args.threshold)
+        _print_comparison(rows, args.threshold)
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
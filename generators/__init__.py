@@ -5,13 +5,37 @@ CAD训练数据生成核心模块
 from .code_generator import CADCodeGenerator
 from .sketch_generator import generate_2d_sketch
 from .sketch_code_generator import generate_sketch_code
+from .sketch_record import SketchRecord
 from .extrude_code_generator import generate_extruded_cq_code
-from .code_validator import validate_code_volume_change
+from .code_validator import (validate_code_volume_change, ValidatorPool, get_validator_pool, GEOMETRY_FORMATS,
+                             SpeculativeSession)
+from .sketch_library import SketchLibrary, build_sketch_library, configure_sketch_library
+from .step_prefilter import StepPrefilter
+from .metrics import StageMetrics, MetricsWriter, get_metrics, configure_logging
+from .point_cloud import parse_stl, sample_point_cloud
+from .adaptive_sampler import AdaptiveSampler, configure_adaptive_sampler
 
 __all__ = [
     'CADCodeGenerator',
     'generate_2d_sketch',
     'generate_sketch_code',
+    'SketchRecord',
     'generate_extruded_cq_code',
-    'validate_code_volume_change'
+    'validate_code_volume_change',
+    'ValidatorPool',
+    'get_validator_pool',
+    'GEOMETRY_FORMATS',
+    'SpeculativeSession',
+    'SketchLibrary',
+    'build_sketch_library',
+    'configure_sketch_library',
+    'StepPrefilter',
+    'StageMetrics',
+    'MetricsWriter',
+    'get_metrics',
+    'configure_logging',
+    'parse_stl',
+    'sample_point_cloud',
+    'AdaptiveSampler',
+    'configure_adaptive_sampler'
 ]
\ No newline at end of file
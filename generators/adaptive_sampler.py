@@ -0,0 +1,217 @@
+"""
+根据在线的验证拒绝统计自适应调整生成步骤的抽样权重
+
+CADCodeGenerator默认均匀抽取平面（合并后的候选列表）、拉伸高度（uniform(-100, 100)）和布尔运算（cut/union各半），
+不考虑哪些选择总是被验证拒绝。AdaptiveSampler按三个维度分别统计每个取值（臂）的接受率：
+- 'plane'：平面类型，'base'（XY/YZ/XZ）、'bbox'（包围盒偏移平面）、'face'（Face:选择器）
+- 'boolean'：'cut'、'union'（首步没有布尔运算，不计入）
+- 'height'：拉伸高度分桶，HEIGHT_RANGE等分为HEIGHT_BUCKETS个区间
+
+抽样时先按权重选择类型/分桶，再在其内部均匀抽取（该类型中的具体平面、分桶内的高度）。每个臂的概率为
+    min_share × 先验_i + (1 - min_share) × 先验_i × 接受率_i / Σ(先验_j × 接受率_j)
+先验为均匀抽样时该臂的概率：平面类型为该类型的候选平面数 / 候选平面总数，布尔运算和高度分桶为 1 / 臂数，
+因此min_share为1或各臂接受率相同时与均匀抽样（rng.choice(候选平面)、uniform(-100, 100)）的分布完全一致。
+接受率取Beta(1, 1)先验下的后验均值 (接受数 + 1) / (验证数 + 2)，验证次数很少时接近均匀；
+min_share是多样性下限：每个臂至少保留min_share倍的均匀概率，任何类型都不会因接受率低而从数据集中消失。
+
+只统计提交验证的步骤（被预筛选排除的步骤不占用OCC验证，不计入），推测式验证中可接受但未被选中的候选计为接受。
+统计在进程内跨样本累计，并行生成时每个工作进程各自学习；各臂的验证/接受次数同时计入指标
+'sampler.<维度>.<臂>.accepted/rejected'，可在指标文件中查看。
+开启后抽样结果依赖进程内之前样本的统计，因此默认关闭；按种子生成（generate_seeded_sample、VirtualCADDataset）
+时以CADCodeGenerator(sampler=False)强制均匀抽样，样本仍只由(种子, 编号)决定。
+"""
+import os
+import threading
+
+from .metrics import get_metrics
+
+
+PLANE_KINDS = ('base', 'bbox', 'face')
+BOOLEAN_OPS = ('cut', 'union')
+HEIGHT_RANGE = (-100.0, 100.0)
+HEIGHT_BUCKETS = 10
+
+# 多样性下限的默认值：每个臂至少保留一半的均匀概率
+DEFAULT_MIN_SHARE = 0.5
+
+# 通过环境变量开启默认的自适应抽样（值为min_share），使spawn方式启动的工作进程同样开启
+ADAPTIVE_SAMPLING_ENV = "CQ_ADAPTIVE_SAMPLING"
+
+
+def plane_kind(plane):
+    """平面字符串的类型：'base'、'bbox'或'face'"""
+    if plane.startswith("Face:"):
+        return 'face'
+    if "origin=" in plane:
+        return 'bbox'
+    return 'base'
+
+
+def height_bucket(height):
+    """拉伸高度所在的分桶序号"""
+    low, high = HEIGHT_RANGE
+    bucket = int((height - low) / (high - low) * HEIGHT_BUCKETS)
+    return min(max(bucket, 0), HEIGHT_BUCKETS - 1)
+
+
+class AdaptiveSampler:
+    """
+    按各臂的接受率加权抽取平面类型、布尔运算和高度分桶（线程安全）
+
+    用法：
+        sampler = AdaptiveSampler()
+        plane = sampler.choose_plane(rng, combined_planes)
+        height = sampler.choose_height(rng)
+        boolean_op = sampler.choose_boolean(rng)
+        ...
+        sampler.record(plane, boolean_op, height, accepted)
+    """
+
+    def __init__(self, min_share=DEFAULT_MIN_SHARE):
+        """
+        Args:
+            min_share: 多样性下限（0~1），为1时退化为均匀抽样（与不使用抽样器时的分布相同），为0时完全按接受率分配
+        """
+        if not 0.0 <= min_share <= 1.0:
+            raise ValueError(f"min_share必须在0到1之间，当前为{min_share}")
+        self.min_share = min_share
+        self._lock = threading.Lock()
+        # 维度 -> 臂 -> [验证数, 接受数]
+        self.stats = {
+            'plane': {kind: [0, 0] for kind in PLANE_KINDS},
+            'boolean': {op: [0, 0] for op in BOOLEAN_OPS},
+            'height': {bucket: [0, 0] for bucket in range(HEIGHT_BUCKETS)},
+        }
+
+    def weights(self, dimension, arms=None, sizes=None):
+        """
+        当前的抽样概率
+
+        Args:
+            dimension: 'plane'、'boolean'或'height'
+            arms: 参与抽样的臂（如当前有候选平面的类型），默认为该维度的全部臂
+            sizes: 每个臂包含的候选数（如各类型的候选平面数），均匀抽样时各臂的概率与之成正比，默认各臂相同
+
+        Returns:
+            list: 与arms顺序一致的概率
+        """
+        stats = self.stats[dimension]
+        if arms is None:
+            arms = list(stats)
+        if sizes is None:
+            sizes = [1] * len(arms)
+        total_size = sum(sizes)
+        priors = [size / total_size for size in sizes]
+        with self._lock:
+            rates = [(stats[arm][1] + 1) / (stats[arm][0] + 2) for arm in arms]
+        total = sum(prior * rate for prior, rate in zip(priors, rates))
+        return [self.min_share * prior + (1.0 - self.min_share) * prior * rate / total
+                for prior, rate in zip(priors, rates)]
+
+    def plane_probabilities(self, planes):
+        """每个候选平面被choose_plane选中的概率 {平面: 概率}"""
+        by_kind = self._planes_by_kind(planes)
+        kinds = list(by_kind)
+        weights = self.weights('plane', kinds, [len(by_kind[kind]) for kind in kinds])
+        return {plane: weight / len(by_kind[kind])
+                for kind, weight in zip(kinds, weights) for plane in by_kind[kind]}
+
+    @staticmethod
+    def _planes_by_kind(planes):
+        by_kind = {}
+        for plane in planes:
+            by_kind.setdefault(plane_kind(plane), []).append(plane)
+        return {kind: by_kind[kind] for kind in PLANE_KINDS if kind in by_kind}
+
+    def choose_plane(self, rng, planes):
+        """先按权重选择平面类型（先验为各类型的候选平面数），再在该类型的候选平面中均匀抽取"""
+        by_kind = self._planes_by_kind(planes)
+        kinds = list(by_kind)
+        weights = self.weights('plane', kinds, [len(by_kind[kind]) for kind in kinds])
+        kind = rng.choices(kinds, weights=weights)[0]
+        return rng.choice(by_kind[kind])
+
+    def choose_boolean(self, rng):
+        return rng.choices(BOOLEAN_OPS, weights=self.weights('boolean', BOOLEAN_OPS))[0]
+
+    def choose_height(self, rng):
+        """先按权重选择高度分桶，再在分桶内均匀抽取（保留两位小数）"""
+        bucket = rng.choices(range(HEIGHT_BUCKETS), weights=self.weights('height'))[0]
+        low, high = HEIGHT_RANGE
+        width = (high - low) / HEIGHT_BUCKETS
+        return round(rng.uniform(low + bucket * width, low + (bucket + 1) * width), 2)
+
+    def record(self, plane, boolean_op, height, accepted):
+        """
+        记录一个提交验证的步骤的结果
+
+        Args:
+            plane: 平面字符串
+            boolean_op: 'cut'、'union'，首步为None（不计入布尔运算的统计）
+            height: 拉伸高度
+            accepted: 验证结果是否可接受
+        """
+        arms = [('plane', plane_kind(plane)), ('height', height_bucket(height))]
+        if boolean_op is not None:
+            arms.append(('boolean', boolean_op))
+        metrics = get_metrics()
+        outcome = 'accepted' if accepted else 'rejected'
+        with self._lock:
+            for dimension, arm in arms:
+                counts = self.stats[dimension][arm]
+                counts[0] += 1
+                counts[1] += int(accepted)
+        for dimension, arm in arms:
+            metrics.count(f'sampler.{dimension}.{arm}.{outcome}')
+
+    def summary(self):
+        """各维度各臂的 (验证数, 接受率, 当前抽样概率)"""
+        result = {}
+        for dimension, stats in self.stats.items():
+            weights = self.weights(dimension)
+            with self._lock:
+                result[dimension] = {
+                    arm: (tried, accepted / tried if tried else None, round(weight, 4))
+                    for (arm, (tried, accepted)), weight in zip(stats.items(), weights)
+                }
+        return result
+
+
+# 默认自适应抽样器（未开启时为None，即均匀抽样）
+_default_sampler = None
+_default_sampler_loaded = False
+_default_sampler_lock = threading.Lock()
+
+
+def get_adaptive_sampler():
+    """获取默认自适应抽样器：首次调用时按环境变量 CQ_ADAPTIVE_SAMPLING 创建，未设置时返回None"""
+    global _default_sampler, _default_sampler_loaded
+    with _default_sampler_lock:
+        if not _default_sampler_loaded:
+            min_share = os.environ.get(ADAPTIVE_SAMPLING_ENV)
+            if min_share:
+                _default_sampler = AdaptiveSampler(float(min_share))
+            _default_sampler_loaded = True
+        return _default_sampler
+
+
+def configure_adaptive_sampler(min_share=DEFAULT_MIN_SHARE):
+    """
+    开启或关闭默认自适应抽样（同时写入环境变量，之后启动的工作进程使用相同设置）
+
+    Args:
+        min_share: 多样性下限，为None时关闭（恢复均匀抽样）
+
+    Returns:
+        AdaptiveSampler or None: 新的默认抽样器（统计从零开始）
+    """
+    global _default_sampler, _default_sampler_loaded
+    with _default_sampler_lock:
+        if min_share is None:
+            os.environ.pop(ADAPTIVE_SAMPLING_ENV, None)
+            _default_sampler = None
+        else:
+            _default_sampler = AdaptiveSampler(min_share)
+            os.environ[ADAPTIVE_SAMPLING_ENV] = repr(float(min_share))
+        _default_sampler_loaded = True
+        return _default_sampler
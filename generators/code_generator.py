@@ -1,34 +1,98 @@
+import logging
 import random
 import sys
-import cadquery as cq  # 补充导入，用于生成包围盒平面
-from OCP.BRepAdaptor import BRepAdaptor_Curve
-from OCP.GeomAbs import GeomAbs_Line
 
+import numpy as np
 
 from .sketch_generator import generate_2d_sketch
+from .sketch_record import SketchRecord
+from .sketch_library import get_sketch_library
+from .adaptive_sampler import get_adaptive_sampler
 from .extrude_code_generator import generate_extruded_cq_code
-from .code_validator import validate_code_volume_change
+from .code_validator import (GEOMETRY_FORMATS, SpeculativeSession, get_validator_pool,
+                             validate_fragment_volume_change, validate_fragments_volume_change)
+from .step_prefilter import REJECT_REASONS, StepPrefilter
+from .metrics import get_metrics
+from .point_cloud import parse_stl, sample_point_cloud
+
+
+logger = logging.getLogger(__name__)
+
+# 推测式验证中候选的选择方式
+CANDIDATE_SELECTIONS = ('first', 'max_change')
 
 
 class CADCodeGenerator:
-    def __init__(self, min_opera_cnt=0, max_opera_cnt=30):
+    def __init__(self, min_opera_cnt=0, max_opera_cnt=30, validator_pool=None, rng=None, sketch_library=None,
+                 prefilter=True, geometry_format=None, geometry_steps=False, point_count=None, candidates=1,
+                 candidate_select='first', sampler=None):
+        """
+        Args:
+            min_opera_cnt, max_opera_cnt: 拉伸次数范围
+            validator_pool: 验证进程池，为None时使用默认验证进程池
+            rng: 随机数生成器（random.Random），为None时使用全局random模块；
+                传入带种子的生成器时，生成的代码只由种子（及所用草图库）决定
+            sketch_library: 预生成的草图库（SketchLibrary），为None时使用默认草图库，
+                未配置默认草图库时在线调用generate_2d_sketch
+            prefilter: 是否在验证前用包围盒排除必定无效的步骤（见generators.step_prefilter），
+                排除的步骤不执行验证，按原因计入 self.prefilter.rejections
+            geometry_format: 几何导出格式（'step'、'stl'或'brep'），指定时由验证工作进程直接导出最终result
+                （见ValidationSession.export），结果保存在 self.final_geometry，无需再执行一遍程序
+            geometry_steps: 同时导出每个被接受步骤的result，保存在 self.step_geometries
+            point_count: 指定时在验证工作进程中对最终result剖分一次（二进制STL），
+                再在当前进程中按面积采样point_count个表面点及法向（见generators.point_cloud），
+                结果 (points, normals) 保存在 self.point_cloud
+            candidates: 每次循环提出的候选步骤数，大于1时使用推测式验证（见SpeculativeSession）：
+                所有候选的随机数一次取完，由多个验证工作进程同时验证，每次循环最多接受一个候选；
+                使用默认验证进程池时按candidates扩大进程池，传入的validator_pool较小时按其大小分轮验证
+            candidate_select: 候选的选择方式，'first'为按顺序第一个可接受的候选（之后的轮次不再验证），
+                'max_change'为验证全部候选后选择体积变化最大的
+            sampler: 自适应抽样器（AdaptiveSampler），按各类平面、布尔运算和高度分桶的接受率调整抽样权重；
+                为None时使用默认抽样器（见configure_adaptive_sampler，未开启时均匀抽样），
+                为False时始终均匀抽样（按种子生成时使用，结果不受进程内已学习的统计影响）
+        """
+        if geometry_format is not None and geometry_format not in GEOMETRY_FORMATS:
+            raise ValueError(f"未知的几何格式: {geometry_format}，可选值为 {GEOMETRY_FORMATS}")
+        if candidates < 1:
+            raise ValueError(f"候选步骤数必须大于0，当前为{candidates}")
+        if candidate_select not in CANDIDATE_SELECTIONS:
+            raise ValueError(f"未知的候选选择方式: {candidate_select}，可选值为 {CANDIDATE_SELECTIONS}")
         self.plane_candidates = ['XY', 'YZ', 'XZ']  # 原始候选平面（固定不变）
         self.latest_bbox_planes = []  # 新增：存储最新的包围盒平面
-        self.sketch_pool = []
+        self.sketch_pool = []  # 待使用的草图（SketchRecord）
         self.used_sketches = []
         self.next_sketch_id = 1
         self.generated_extrudes = []
         self.next_extrude_id = 1
         self.min_opera_cnt = min_opera_cnt
         self.max_opera_cnt = max_opera_cnt
+        self.validator_pool = validator_pool  # 为None时使用默认验证进程池
+        self.accepted_steps = []  # 每个被接受步骤的元数据（平面、高度、布尔运算及验证得到的实体指标）
+        self.rng = rng if rng is not None else random
+        self.sketch_library = sketch_library if sketch_library is not None else get_sketch_library()
+        if sampler is None:
+            sampler = get_adaptive_sampler()
+        self.sampler = sampler or None  # False：强制均匀抽样
+        self.prefilter = StepPrefilter() if prefilter else None
+        self.result_bbox = None  # 当前结果的包围盒（最近一次被接受步骤的验证结果）
+        self.geometry_format = geometry_format
+        self.geometry_steps = geometry_steps and geometry_format is not None
+        self.final_geometry = None  # 最终result的几何文件内容（bytes），导出失败时为None
+        self.step_geometries = []  # 每个被接受步骤的几何文件内容（仅geometry_steps时）
+        self.point_count = point_count
+        self.point_cloud = None  # 最终result的表面点云 (points, normals)，采样失败时为None
+        self.candidates = candidates
+        self.candidate_select = candidate_select
 
     def get_random_cad_plane(self):
         """组合原始候选平面和最新包围盒平面，随机选择一个"""
-        # 合并原始平面和最新包围盒平面（去重）
-        combined_planes = list(set(self.plane_candidates + self.latest_bbox_planes))
+        # 合并原始平面和最新包围盒平面（去重，保持顺序，使选择结果不受字符串哈希随机化影响）
+        combined_planes = list(dict.fromkeys(self.plane_candidates + self.latest_bbox_planes))
         if not combined_planes:
             raise ValueError("候选平面集合为空")
-        return random.choice(combined_planes)
+        if self.sampler is not None:
+            return self.sampler.choose_plane(self.rng, combined_planes)
+        return self.rng.choice(combined_planes)
 
     def get_sketch_from_pool(self, reuse_prob=0.3):
         """
@@ -36,18 +100,26 @@ class CADCodeGenerator:
         :param reuse_prob: 从已使用草图中选择的概率（0~1之间）
         """
         # 先判断是否有已使用的草图，且触发复用概率
-        if self.used_sketches and random.random() < reuse_prob:
+        if self.used_sketches and self.rng.random() < reuse_prob:
             # 从已使用草图中随机选择一个
-            selected_item = random.choice(self.used_sketches)
+            selected_item = self.rng.choice(self.used_sketches)
             selected_sketch = selected_item['sketch']
             # 为复用的草图分配新ID（保持ID唯一性）
             current_sketch_id = self.next_sketch_id
             # 注意：这里不再增加next_sketch_id，由调用者在确认使用后增加
             return selected_sketch, current_sketch_id
 
-        # 从草图池中获取或生成新草图
+        # 从草图池中获取或生成新草图（配置了草图库时直接从库中抽取一个区域）
         if not self.sketch_pool:
-            self.sketch_pool = generate_2d_sketch()
+            with get_metrics().timer('sketch'):
+                if self.sketch_library is not None:
+                    region_index = self.sketch_library.sample(self.rng)
+                    self.sketch_pool = [self.sketch_library.region_record(region_index)]
+                else:
+                    # 每个区域只读取一次边信息，之后生成代码和面标识都不再访问OCC对象
+                    self.sketch_pool = [
+                        SketchRecord.from_wires(wires) for wires in generate_2d_sketch(rng=self.rng)
+                    ]
 
         if self.sketch_pool:
             # 从池中随机选择一个草图
@@ -56,9 +128,9 @@ class CADCodeGenerator:
             # 注意：这里不再增加next_sketch_id，由调用者在确认使用后增加
         else:
             # 极端情况：池为空也无复用，则创建简单矩形草图
-            simple_sketch = [[
+            simple_sketch = SketchRecord.from_polygons([[
                 (-5, -5), (5, -5), (5, 5), (-5, 5)
-            ]]
+            ]])
             selected_sketch = simple_sketch
             current_sketch_id = self.next_sketch_id
             # 注意：这里不再增加next_sketch_id，由调用者在确认使用后增加
@@ -78,27 +150,18 @@ class CADCodeGenerator:
         return None
 
     def calculate_sketch_edges(self, sketch):
-        total_edges = 0
-        for wire in sketch:
-            total_edges += len(wire.Edges())
-        return total_edges
+        return sketch.edge_count
 
     def generate_face_identifiers(self, extrude_id, sketch_id, sketch):
-        total_edges = self.calculate_sketch_edges(sketch)
         face_identifiers = [
             f"Face:(Extrude.{extrude_id};1)",
             f"Face:(Extrude.{extrude_id};2)"
         ]
-        cumulative_edge_num = 0
-        for wire in sketch:
-            edges = wire.Edges()
-            for edge in edges:
-                cumulative_edge_num += 1
-                adaptor = BRepAdaptor_Curve(edge.wrapped)
-                if adaptor.GetType() == GeomAbs_Line:
-                    # 修复：确保面选择器格式正确，添加缺失的内部括号
-                    side_face_id = f"Face:(Extrude.{extrude_id};0:(Wire:(Sketch.{sketch_id};{cumulative_edge_num})))"
-                    face_identifiers.append(side_face_id)
+        # 边编号按草图中所有Wire的原始边顺序累计，只有直线边生成侧面标识
+        for cumulative_edge_num in sketch.line_edge_numbers():
+            # 修复：确保面选择器格式正确，添加缺失的内部括号
+            side_face_id = f"Face:(Extrude.{extrude_id};0:(Wire:(Sketch.{sketch_id};{cumulative_edge_num})))"
+            face_identifiers.append(side_face_id)
         return face_identifiers
 
     @staticmethod
@@ -111,31 +174,42 @@ class CADCodeGenerator:
                 return []  # 返回空列表而不是抛出异常
                 
             bbox = shape.BoundingBox()
-            x_min, x_max = bbox.xmin, bbox.xmax
-            y_min, y_max = bbox.ymin, bbox.ymax
-            z_min, z_max = bbox.zmin, bbox.zmax
-            return [
-                f"'XY', origin=(0.0, 0.0, {z_max:.2f})",
-                f"'XY', origin=(0.0, 0.0, {z_min:.2f})",
-                f"'YZ', origin=({x_max:.2f}, 0.0, 0.0)",
-                f"'YZ', origin=({x_min:.2f}, 0.0, 0.0)",
-                f"'XZ', origin=(0.0, {y_max:.2f}, 0.0)",
-                f"'XZ', origin=(0.0, {y_min:.2f}, 0.0)",
-            ]
+            return CADCodeGenerator.bbox_plane_strings_from_bounds(
+                (bbox.xmin, bbox.ymin, bbox.zmin, bbox.xmax, bbox.ymax, bbox.zmax)
+            )
         except Exception as e:
             # 发生任何异常时返回空列表
             return []
 
+    @staticmethod
+    def bbox_plane_strings_from_bounds(bbox):
+        """根据包围盒坐标(xmin, ymin, zmin, xmax, ymax, zmax)生成包围盒平面字符串"""
+        if not bbox:
+            return []
+        x_min, y_min, z_min, x_max, y_max, z_max = bbox
+        return [
+            f"'XY', origin=(0.0, 0.0, {z_max:.2f})",
+            f"'XY', origin=(0.0, 0.0, {z_min:.2f})",
+            f"'YZ', origin=({x_max:.2f}, 0.0, 0.0)",
+            f"'YZ', origin=({x_min:.2f}, 0.0, 0.0)",
+            f"'XZ', origin=(0.0, {y_max:.2f}, 0.0)",
+            f"'XZ', origin=(0.0, {y_min:.2f}, 0.0)",
+        ]
+
     def generate_and_record_extrude(self, sketch, sketch_id, plane):
         current_extrude_id = self.next_extrude_id
         # 注意：这里不再增加next_extrude_id，由调用者在确认使用后增加
-        extrude_height = round(random.uniform(-100, 100), 2)
-        code = generate_extruded_cq_code(
-            extrude_id=current_extrude_id,
-            plane=plane,
-            wires_for_one_region=sketch,
-            extrude_height=extrude_height,
-        )
+        if self.sampler is not None:
+            extrude_height = self.sampler.choose_height(self.rng)
+        else:
+            extrude_height = round(self.rng.uniform(-100, 100), 2)
+        with get_metrics().timer('emit'):
+            code = generate_extruded_cq_code(
+                extrude_id=current_extrude_id,
+                plane=plane,
+                wires_for_one_region=sketch,
+                extrude_height=extrude_height,
+            )
         self.generated_extrudes.append({
             'id': current_extrude_id,
             'code': code,
@@ -157,92 +231,265 @@ class CADCodeGenerator:
             "tracker = create_tracker()\n\n"
         )
 
-        loop_count = random.randint(self.min_opera_cnt, self.max_opera_cnt)
+        loop_count = self.rng.randint(self.min_opera_cnt, self.max_opera_cnt)
         if loop_count == 0:
-            print("生成0次拉伸，返回基础代码")
+            logger.debug("生成0次拉伸，返回基础代码")
             return full_code
 
-        # 记录上一次的实体属性（用于重复判断）
-        last_volume = None  # 上一次有效实体的体积
         valid_code_fragments = []  # 仅保存有效的代码片段
 
-        for i in range(loop_count):
-            # 1. 选择平面
-            plane = self.get_random_cad_plane()
-            # 2. 获取草图并生成拉伸代码
-            sketch, sketch_id = self.get_sketch_from_pool()
-            extrude_var, current_code, new_face_identifiers = self.generate_and_record_extrude(
-                sketch=sketch,
-                sketch_id=sketch_id,
-                plane=plane
-            )
-            # 3. 生成布尔运算代码
-            if not valid_code_fragments:  # 首次有效操作
-                boolean_code = f"result = {extrude_var}"
+        # 增量验证会话：工作进程中保留已接受的result，每次只执行新步骤
+        pool = self.validator_pool or get_validator_pool(min_size=self.candidates)
+        if self.candidates > 1:
+            session = SpeculativeSession(pool, full_code, min(self.candidates, pool.size))
+        else:
+            session = pool.session(full_code)
+        with session:
+            self._run_generation_loop(session, loop_count, valid_code_fragments)
+            if self.geometry_format is not None and valid_code_fragments:
+                if self.geometry_steps:
+                    self.final_geometry = self.step_geometries[-1]
+                else:
+                    self.final_geometry = self._export_geometry(session)
+            if self.point_count and valid_code_fragments:
+                self.point_cloud = self._sample_point_cloud(session)
+
+        # 拼接最终有效代码
+        full_code += "\n".join(valid_code_fragments)
+        logger.debug("完成%d次循环，有效代码共%d段", loop_count, len(valid_code_fragments))
+        if self.prefilter is not None and self.prefilter.total_rejections:
+            logger.debug("预筛选跳过%d次验证：%s", self.prefilter.total_rejections, self.prefilter.summary())
+        return full_code
+
+    def _export_geometry(self, session):
+        """导出会话中已提交的result，失败时计入指标'geometry.error'并返回None"""
+        metrics = get_metrics()
+        with metrics.timer('export'):
+            success, data, error_msg = session.export(self.geometry_format)
+        if not success:
+            logger.debug("导出几何失败：%s", error_msg)
+            metrics.count('geometry.error')
+            return None
+        return data
+
+    def _sample_point_cloud(self, session):
+        """对会话中已提交的result采样点云，已导出STL几何时直接使用，失败时计入指标'point_cloud.error'"""
+        metrics = get_metrics()
+        with metrics.timer('point_cloud'):
+            if self.geometry_format == 'stl' and self.final_geometry is not None:
+                stl_data = self.final_geometry
             else:
-                boolean_op = random.choice(['cut', 'union'])
-                boolean_code = f"result = result.{boolean_op}({extrude_var})"
+                success, stl_data, error_msg = session.export('stl')
+                if not success:
+                    logger.debug("剖分最终结果失败：%s", error_msg)
+                    metrics.count('point_cloud.error')
+                    return None
+            # 采样的随机数由生成器的随机数派生，按种子生成时点云同样可复现
+            rng = np.random.default_rng(self.rng.getrandbits(64))
+            try:
+                points, normals = sample_point_cloud(parse_stl(stl_data), self.point_count, rng)
+            except ValueError as e:
+                logger.debug("采样点云失败：%s", e)
+                metrics.count('point_cloud.error')
+                return None
+        return points.astype(np.float32), normals.astype(np.float32)
 
-            # 4. 临时拼接当前循环代码，用于执行判断
-            current_loop_code = f"{current_code}{boolean_code}\n"
-            temp_full_code = full_code + "".join(valid_code_fragments) + current_loop_code
+    def _propose_candidate(self, first_step):
+        """依次取平面、草图、拉伸高度和布尔运算的随机数，生成一个候选步骤（拉伸记录在被接受时才加入）"""
+        # 1. 选择平面
+        plane = self.get_random_cad_plane()
+        # 2. 获取草图并生成拉伸代码
+        sketch, sketch_id = self.get_sketch_from_pool()
+        extrude_var, current_code, new_face_identifiers = self.generate_and_record_extrude(
+            sketch=sketch,
+            sketch_id=sketch_id,
+            plane=plane
+        )
+        extrude = self.generated_extrudes.pop()
+        # 3. 生成布尔运算代码
+        if first_step:  # 首次有效操作
+            boolean_op = None
+            boolean_code = f"result = {extrude_var}"
+        else:
+            if self.sampler is not None:
+                boolean_op = self.sampler.choose_boolean(self.rng)
+            else:
+                boolean_op = self.rng.choice(['cut', 'union'])
+            boolean_code = f"result = result.{boolean_op}({extrude_var})"
 
-            # 5. 使用子进程验证代码，判断结果是否变化
-            is_valid, is_changed, current_volume, error_msg = validate_code_volume_change(
-                temp_full_code, 
-                last_volume
+        return {
+            'plane': plane,
+            'sketch': sketch,
+            'sketch_id': sketch_id,
+            'extrude': extrude,
+            'boolean_op': boolean_op,
+            # 4. 当前循环代码片段
+            'code': f"{current_code}{boolean_code}\n",
+            'face_identifiers': new_face_identifiers,
+        }
+
+    def _prefilter_rejects(self, loop_index, candidate):
+        """必定无效的候选不提交验证，返回是否被排除"""
+        if self.prefilter is None:
+            return False
+        metrics = get_metrics()
+        with metrics.timer('bbox'):
+            reject_reason = self.prefilter.check(
+                candidate['sketch'], candidate['plane'], candidate['extrude']['height'],
+                candidate['boolean_op'], self.result_bbox
             )
-            
-            if is_valid:
-                # 检查体积是否为0或接近0（说明实体被完全消除）
-                if current_volume is not None and abs(current_volume) < 1e-6:
-                    print(f"第{i + 1}次循环：体积为0，实体被完全消除，跳过此次代码")
-                    # 移除生成的extrude记录
-                    if self.generated_extrudes:
-                        self.generated_extrudes.pop()
-                elif is_changed:
-                    valid_code_fragments.append(current_loop_code)
-                    last_volume = current_volume
-                    print(f"第{i + 1}次循环：结果有变化，保留代码（体积={current_volume:.6f}）")
-                    # 只有成功拼接才更新 next_id
-                    self.next_sketch_id += 1
-                    self.next_extrude_id += 1
-                    
-                    # 只有在操作成功时才添加面标识符到候选列表
-                    for face_id in new_face_identifiers:
-                        if face_id not in self.plane_candidates:
-                            self.plane_candidates.append(face_id)
-                    
-                    # 更新包围盒平面（需要在主进程中执行以获取workplane）
-                    try:
-                        # 在主进程中执行代码以获取result用于计算包围盒
-                        exec_globals = {'cq': cq, 'cadquery': cq}
-                        local_vars = {}
-                        exec(temp_full_code, exec_globals, local_vars)
-                        current_result = local_vars.get('result')
-                        if current_result:
-                            bbox_planes = self.generate_bbox_plane_strings(current_result)
-                            if bbox_planes:
-                                self.latest_bbox_planes = bbox_planes
-                    except:
-                        # 如果包围盒计算失败，不影响主流程
-                        pass
-                else:
-                    print(f"第{i + 1}次循环：结果未变化，跳过此次代码（体积={current_volume:.6f}）")
-                    # 移除生成的extrude记录（面标识符未添加，无需清除）
-                    if self.generated_extrudes:
-                        self.generated_extrudes.pop()
+        if reject_reason is None:
+            return False
+        logger.debug("第%d次循环：预筛选判定无效（%s），跳过此次代码", loop_index + 1, REJECT_REASONS[reject_reason])
+        metrics.count(f'step.rejected.prefilter.{reject_reason}')
+        return True
+
+    @staticmethod
+    def _rejection_reason(loop_index, validation):
+        """
+        判断验证结果能否接受
+
+        Returns:
+            str or None: 不能接受时返回原因（'error'、'zero_volume'或'unchanged'），否则返回None
+        """
+        current_volume = validation['volume']
+        if not validation['is_valid']:
+            logger.debug("第%d次循环执行失败：%s，跳过此次代码", loop_index + 1, validation['error'])
+            return 'error'
+        # 检查体积是否为0或接近0（说明实体被完全消除）
+        if current_volume is not None and abs(current_volume) < 1e-6:
+            logger.debug("第%d次循环：体积为0，实体被完全消除，跳过此次代码", loop_index + 1)
+            return 'zero_volume'
+        if not validation['is_changed']:
+            logger.debug("第%d次循环：结果未变化，跳过此次代码（体积=%s）", loop_index + 1, current_volume)
+            return 'unchanged'
+        return None
+
+    def _record_outcome(self, candidate, accepted):
+        """将提交验证的候选的结果计入自适应抽样器的统计"""
+        if self.sampler is not None:
+            self.sampler.record(candidate['plane'], candidate['boolean_op'], candidate['extrude']['height'], accepted)
+
+    def _accept_candidate(self, session, loop_index, candidate, validation, valid_code_fragments):
+        """记录已在会话中提交的候选步骤"""
+        metrics = get_metrics()
+        current_volume = validation['volume']
+        valid_code_fragments.append(candidate['code'])
+        self.generated_extrudes.append(candidate['extrude'])
+        logger.debug("第%d次循环：结果有变化，保留代码（体积=%.6f）", loop_index + 1, current_volume)
+        metrics.count('step.accepted')
+        self.accepted_steps.append({
+            'extrude_id': self.next_extrude_id,
+            'sketch_id': candidate['sketch_id'],
+            'plane': candidate['plane'],
+            'height': candidate['extrude']['height'],
+            'boolean_op': candidate['boolean_op'],
+            'volume': current_volume,
+            'bbox': validation['bbox'],
+            'solid_count': validation['solid_count'],
+            'face_count': validation['face_count'],
+        })
+        self.result_bbox = validation['bbox']
+        if self.geometry_steps:
+            self.step_geometries.append(self._export_geometry(session))
+        # 只有成功拼接才更新 next_id
+        self.next_sketch_id += 1
+        self.next_extrude_id += 1
+
+        # 只有在操作成功时才添加面标识符到候选列表
+        for face_id in candidate['face_identifiers']:
+            if face_id not in self.plane_candidates:
+                self.plane_candidates.append(face_id)
+
+        # 更新包围盒平面（直接使用验证时得到的包围盒，无需在主进程中重新执行代码）
+        if validation['shape_valid'] is not False:
+            with metrics.timer('bbox'):
+                bbox_planes = self.bbox_plane_strings_from_bounds(validation['bbox'])
+            if bbox_planes:
+                self.latest_bbox_planes = bbox_planes
+
+    def _run_generation_loop(self, session, loop_count, valid_code_fragments):
+        """执行生成循环，将有效代码片段追加到valid_code_fragments"""
+        if self.candidates > 1:
+            self._run_speculative_loop(session, loop_count, valid_code_fragments)
+            return
+        # 记录上一次的实体属性（用于重复判断）
+        last_volume = None  # 上一次有效实体的体积
+        metrics = get_metrics()
+
+        for i in range(loop_count):
+            candidate = self._propose_candidate(not valid_code_fragments)
+            # 必定无效的步骤不提交验证（随机数已全部取完，不影响后续步骤的生成）
+            if self._prefilter_rejects(i, candidate):
+                continue
+
+            # 5. 在验证会话中只执行新片段，判断结果是否变化
+            with metrics.timer('validate'):
+                validation = validate_fragment_volume_change(
+                    session,
+                    candidate['code'],
+                    last_volume
+                )
+            reason = self._rejection_reason(i, validation)
+            self._record_outcome(candidate, reason is None)
+            if reason is None:
+                session.commit()
+                self._accept_candidate(session, i, candidate, validation, valid_code_fragments)
+                last_volume = validation['volume']
             else:
-                # 验证失败
-                print(f"第{i + 1}次循环执行失败：{error_msg}，跳过此次代码")
-                # 移除可能已添加的extrude记录（面标识符未添加，无需清除）
-                if self.generated_extrudes:
-                    self.generated_extrudes.pop()
+                metrics.count(f'step.rejected.{reason}')
+                session.rollback()
 
-        # 拼接最终有效代码
-        full_code += "\n".join(valid_code_fragments)
-        print(f"完成{loop_count}次循环，有效代码共{len(valid_code_fragments)}段")
-        return full_code
+    def _run_speculative_loop(self, session, loop_count, valid_code_fragments):
+        """
+        推测式生成循环：每次循环提出self.candidates个候选，按session.width个一轮同时验证，最多接受一个
+
+        所有候选的随机数在验证前一次取完，生成结果与验证通道数无关（只由随机数和candidate_select决定）。
+        """
+        last_volume = None
+        metrics = get_metrics()
+
+        for i in range(loop_count):
+            first_step = not valid_code_fragments
+            candidates = [self._propose_candidate(first_step) for _ in range(self.candidates)]
+            candidates = [candidate for candidate in candidates if not self._prefilter_rejects(i, candidate)]
+
+            best = None  # (体积变化, 轮次, 轮内序号, 候选, 验证结果)
+            acceptable_count = 0
+            round_index = -1
+            for round_index, start in enumerate(range(0, len(candidates), session.width)):
+                batch = candidates[start:start + session.width]
+                with metrics.timer('validate'):
+                    validations = validate_fragments_volume_change(
+                        session, [candidate['code'] for candidate in batch], last_volume
+                    )
+                for j, (candidate, validation) in enumerate(zip(batch, validations)):
+                    reason = self._rejection_reason(i, validation)
+                    self._record_outcome(candidate, reason is None)
+                    if reason is not None:
+                        metrics.count(f'step.rejected.{reason}')
+                        continue
+                    acceptable_count += 1
+                    change = abs(validation['volume'] - (last_volume or 0.0))
+                    if best is None or (self.candidate_select == 'max_change' and change > best[0]):
+                        best = (change, round_index, j, candidate, validation)
+                if best is not None and self.candidate_select == 'first':
+                    break
+
+            if best is None:
+                session.rollback()
+                continue
+            _, best_round, best_index, candidate, validation = best
+            if acceptable_count > 1:
+                metrics.count('step.rejected.not_selected', acceptable_count - 1)
+            if best_round == round_index:
+                session.commit(best_index)
+            else:
+                # 选中的候选属于较早的轮次，各通道中已是之后轮次的候选，全部通道补执行该片段
+                session.rollback()
+                session.apply(candidate['code'])
+            self._accept_candidate(session, i, candidate, validation, valid_code_fragments)
+            last_volume = validation['volume']
 
 # 测试部分
 if __name__ == "__main__":
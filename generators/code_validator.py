@@ -5,6 +5,29 @@ import sys
 import subprocess
 import tempfile
 import os
+import io
+import copy
+import types
+import importlib
+import atexit
+import queue
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 项目根目录（工作进程需要将其加入sys.path以导入cadquery_tracker等模块）
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 验证会话可直接导出的几何格式：STEP、二进制STL、二进制BREP（OCC BinTools格式）
+GEOMETRY_FORMATS = ('step', 'stl', 'brep')
+
+# 工作进程中没有会话状态时的回复（会话未开始，或同步片段执行失败后状态已丢弃）
+_SESSION_NOT_READY = "验证会话未初始化"
+
+# 追踪器模块的数据无法深拷贝时的会话标记：候选步骤改为在新命名空间中重放已提交代码后执行
+_UNFORKABLE = object()
 
 
 def validate_code_in_subprocess(code_to_validate):
@@ -18,7 +41,7 @@ def validate_code_in_subprocess(code_to_validate):
         tuple: (success: bool, volume: float or None, error_message: str or None)
     """
     # 获取项目根目录路径
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    project_root = PROJECT_ROOT
     
     # 创建临时文件来存储要执行的代码
     with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
@@ -110,7 +133,868 @@ except Exception as e:
             pass
 
 
-def validate_code_volume_change(code_to_validate, last_volume=None, relative_threshold=0.001):
+# 生成的程序通过 from cadquery_tracker import create_tracker 创建追踪器；
+# 常驻工作进程在多个任务之间复用该模块，其模块级数据（注册表、计数器等）在每个任务开始时恢复为导入时的状态
+TRACKER_MODULE = 'cadquery_tracker'
+_tracker_module = None
+_tracker_pristine_state = None
+
+
+def _capture_tracker_state():
+    """
+    复制追踪器模块的模块级数据（不含函数、类和子模块），模块未加载时返回None
+
+    Raises:
+        TypeError等: 模块级数据无法深拷贝时由copy.deepcopy抛出
+    """
+    if _tracker_module is None:
+        return None
+    return copy.deepcopy({
+        name: value for name, value in vars(_tracker_module).items()
+        if not name.startswith('__') and not callable(value) and not isinstance(value, types.ModuleType)
+    })
+
+
+def _restore_tracker_state(state):
+    """将追踪器模块的模块级数据恢复为state（之后新增的数据被删除）"""
+    if _tracker_module is None or state is None:
+        return
+    module_vars = vars(_tracker_module)
+    for name, value in list(module_vars.items()):
+        if (name not in state and not name.startswith('__') and not callable(value)
+                and not isinstance(value, types.ModuleType)):
+            del module_vars[name]
+    module_vars.update(copy.deepcopy(state))
+
+
+def _load_tracker_module():
+    """工作进程启动时导入追踪器模块并记录其初始状态（导入失败时由具体任务报告错误）"""
+    global _tracker_module, _tracker_pristine_state
+    try:
+        _tracker_module = importlib.import_module(TRACKER_MODULE)
+    except Exception:
+        _tracker_module = None
+        return
+    try:
+        _tracker_pristine_state = _capture_tracker_state()
+    except Exception as e:
+        # 无法记录初始状态时不做恢复（各任务之间可能互相影响），在工作进程的stderr中提示
+        _tracker_module = None
+        print(f"警告：无法复制{TRACKER_MODULE}的模块级数据，任务之间不会重置追踪器状态：{type(e).__name__}: {e}",
+              file=sys.stderr)
+
+
+def _new_validation_namespace():
+    """新的执行命名空间，同时将追踪器模块恢复为导入时的状态，使结果与工作进程之前执行过的任务无关"""
+    _restore_tracker_state(_tracker_pristine_state)
+    return {'__name__': '__cq_validation__'}
+
+
+def _exec_in_namespace(code, namespace):
+    """在给定命名空间中执行代码，成功返回None，失败返回错误信息"""
+    try:
+        exec(compile(code, '<cq_validation>', 'exec'), namespace)
+    except Exception as e:
+        return f"执行错误: {type(e).__name__}: {e}"
+    return None
+
+
+def _measure_result(namespace):
+    """
+    计算命名空间中result实体的体积、包围盒等指标
+
+    Returns:
+        tuple: (success: bool, metrics: dict or None, error_message: str or None)
+        metrics包含：volume、bbox(xmin, ymin, zmin, xmax, ymax, zmax)、
+        solid_count、face_count、shape_valid
+    """
+    try:
+        if 'result' not in namespace:
+            return False, None, "未生成有效的实体result"
+        result = namespace['result']
+        current_solid = result.val()
+        if not hasattr(current_solid, 'Volume'):
+            return False, None, "实体不支持Volume()方法"
+        metrics = {'volume': current_solid.Volume()}
+    except Exception as e:
+        return False, None, f"{type(e).__name__}: {e}"
+
+    # 以下指标计算失败时记为None，不影响体积判断
+    try:
+        bbox = current_solid.BoundingBox()
+        metrics['bbox'] = (bbox.xmin, bbox.ymin, bbox.zmin, bbox.xmax, bbox.ymax, bbox.zmax)
+    except Exception:
+        metrics['bbox'] = None
+    try:
+        # result.val()只返回栈上第一个对象，实体数需要统计栈上所有对象
+        metrics['solid_count'] = sum(
+            len(obj.Solids()) for obj in result.vals() if hasattr(obj, 'Solids')
+        )
+    except Exception:
+        metrics['solid_count'] = None
+    try:
+        metrics['face_count'] = len(current_solid.Faces())
+    except Exception:
+        metrics['face_count'] = None
+    try:
+        metrics['shape_valid'] = bool(current_solid.isValid())
+    except Exception:
+        metrics['shape_valid'] = None
+    return True, metrics, None
+
+
+def _export_result(namespace, geometry_format):
+    """
+    将命名空间中的result导出为几何文件内容
+
+    Returns:
+        tuple: (success: bool, data: bytes or None, error_message: str or None)
+    """
+    if geometry_format not in GEOMETRY_FORMATS:
+        return False, None, f"未知的几何格式: {geometry_format}，可选值为 {GEOMETRY_FORMATS}"
+    try:
+        import cadquery as cq
+        if 'result' not in namespace:
+            return False, None, "未生成有效的实体result"
+        shapes = [obj for obj in namespace['result'].vals() if isinstance(obj, cq.Shape)]
+        if not shapes:
+            return False, None, "result中没有可导出的实体"
+        shape = shapes[0] if len(shapes) == 1 else cq.Compound.makeCompound(shapes)
+        if geometry_format == 'brep':
+            stream = io.BytesIO()
+            shape.exportBin(stream)
+            return True, stream.getvalue(), None
+        # STEP/STL写出器只接受文件路径，先写入临时文件再读回
+        fd, temp_path = tempfile.mkstemp(suffix=f".{geometry_format}")
+        os.close(fd)
+        try:
+            if geometry_format == 'step':
+                shape.exportStep(temp_path)
+            else:
+                shape.exportStl(temp_path)
+            with open(temp_path, "rb") as f:
+                return True, f.read(), None
+        finally:
+            os.unlink(temp_path)
+    except Exception as e:
+        return False, None, f"导出几何失败: {type(e).__name__}: {e}"
+
+
+def _execute_validation_code(code_to_validate):
+    """
+    在当前进程中执行代码并返回实体指标（由常驻工作进程调用）
+
+    Args:
+        code_to_validate: 要验证的完整代码字符串
+
+    Returns:
+        tuple: (success: bool, metrics: dict or None, error_message: str or None)
+    """
+    # 每个任务使用独立的命名空间，避免不同任务之间的变量互相污染
+    namespace = _new_validation_namespace()
+    error_msg = _exec_in_namespace(code_to_validate, namespace)
+    if error_msg:
+        return False, None, error_msg
+    return _measure_result(namespace)
+
+
+def _fork_session(namespace, tracker_state):
+    """
+    从已提交状态派生候选步骤的执行命名空间
+
+    追踪器模块的数据恢复为提交时的状态，命名空间中的追踪器对象深拷贝，其余变量共享
+    （CadQuery的布尔运算返回新对象，不会修改已提交的result），被拒绝的片段不会在已提交状态中留下记录。
+
+    Returns:
+        dict or None: 命名空间，追踪器无法深拷贝时返回None（调用者改为重放已提交代码）
+    """
+    try:
+        _restore_tracker_state(tracker_state)
+        forked = dict(namespace)
+        memo = {}
+        for name, value in namespace.items():
+            if name == 'tracker' or type(value).__module__ == TRACKER_MODULE:
+                forked[name] = copy.deepcopy(value, memo)
+        return forked
+    except Exception:
+        return None
+
+
+def _replay_session(session_code):
+    """在新的命名空间中重新执行已提交的全部代码，返回 (命名空间 or None, 错误信息 or None)"""
+    namespace = _new_validation_namespace()
+    error_msg = _exec_in_namespace("".join(session_code), namespace)
+    if error_msg:
+        return None, error_msg
+    return namespace, None
+
+
+def _validator_worker_main(conn, project_root):
+    """常驻验证工作进程的主循环：预加载cadquery后循环接收并执行验证任务"""
+    # Ctrl+C 由主进程统一处理，工作进程忽略SIGINT，避免中断时输出大量异常
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    try:
+        # 预加载cadquery/OCP，后续任务无需重复导入
+        import cadquery  # noqa: F401
+    except Exception:
+        # 导入失败时不退出，由具体任务返回错误信息
+        pass
+    _load_tracker_module()
+
+    # 增量验证会话状态：session_namespace保存最近一次提交的result等变量，session_code为已提交的代码，
+    # session_tracker_state为提交时追踪器模块的数据（无法复制时为_UNFORKABLE，候选步骤改为重放已提交代码后执行）；
+    # pending_namespace/pending_fragment保存尚未提交的候选步骤
+    session_namespace = None
+    session_code = []
+    session_tracker_state = None
+    pending_namespace = None
+    pending_fragment = None
+
+    def capture_state():
+        try:
+            return _capture_tracker_state()
+        except Exception:
+            return _UNFORKABLE
+
+    def fork_pending():
+        """派生候选步骤的命名空间，返回 (命名空间 or None, 错误信息 or None)"""
+        if session_tracker_state is not _UNFORKABLE:
+            namespace = _fork_session(session_namespace, session_tracker_state)
+            if namespace is not None:
+                return namespace, None
+        return _replay_session(session_code)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        command, payload = message
+        if command == 'run':
+            reply = _execute_validation_code(payload)
+        elif command == 'session_begin':
+            # 执行会话的基础代码（文件头以及已接受的步骤）
+            session_namespace = _new_validation_namespace()
+            pending_namespace = pending_fragment = None
+            error_msg = _exec_in_namespace(payload, session_namespace)
+            if error_msg:
+                session_namespace = None
+                reply = (False, None, error_msg)
+            else:
+                session_code = [payload]
+                session_tracker_state = capture_state()
+                reply = (True, None, None)
+        elif command == 'session_try':
+            # 只执行新片段：在由已提交状态派生的命名空间中执行
+            pending_namespace = pending_fragment = None
+            if session_namespace is None:
+                reply = (False, None, _SESSION_NOT_READY)
+            else:
+                namespace, error_msg = fork_pending()
+                if error_msg is None:
+                    error_msg = _exec_in_namespace(payload, namespace)
+                if error_msg:
+                    reply = (False, None, error_msg)
+                else:
+                    pending_namespace, pending_fragment = namespace, payload
+                    reply = _measure_result(pending_namespace)
+        elif command == 'session_commit':
+            # 提交前没有执行其他代码，追踪器模块中仍是候选步骤执行后的数据
+            if pending_namespace is not None:
+                session_namespace = pending_namespace
+                session_code.append(pending_fragment)
+                session_tracker_state = capture_state()
+            pending_namespace = pending_fragment = None
+            continue  # 提交/回滚不回复，减少一次往返
+        elif command == 'session_rollback':
+            pending_namespace = pending_fragment = None
+            continue
+        elif command == 'session_apply':
+            # 直接执行并提交已在其他工作进程中验证通过的片段（推测式验证中同步各通道的状态），不回复；
+            # 执行失败时丢弃会话状态，下一次请求回复_SESSION_NOT_READY，由主进程重放恢复
+            pending_namespace = pending_fragment = None
+            if session_namespace is not None:
+                namespace, error_msg = fork_pending()
+                if error_msg is None:
+                    error_msg = _exec_in_namespace(payload, namespace)
+                if error_msg:
+                    session_namespace = None
+                else:
+                    session_namespace = namespace
+                    session_code.append(payload)
+                    session_tracker_state = capture_state()
+            continue
+        elif command == 'session_export':
+            # 导出最近一次提交的result（提交消息先于导出请求到达，顺序由管道保证）
+            if session_namespace is None:
+                reply = (False, None, _SESSION_NOT_READY)
+            else:
+                reply = _export_result(session_namespace, payload)
+        elif command == 'session_end':
+            session_namespace = None
+            session_code = []
+            pending_namespace = pending_fragment = None
+            continue
+        else:
+            reply = (False, None, f"未知的验证命令: {command}")
+
+        try:
+            conn.send(reply)
+        except (BrokenPipeError, OSError):
+            break
+
+
+class _ValidatorWorker:
+    """单个常驻验证工作进程及其通信管道"""
+
+    def __init__(self, context, project_root):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_validator_worker_main,
+            args=(child_conn, project_root),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.task_count = 0
+        self.queued_tasks = 0  # 已发送、不等待回复、在下一个请求之前执行的任务数（见queue）
+
+    def request(self, message, timeout):
+        """
+        发送一个任务并等待结果
+
+        管道中排在该任务之前的queued_tasks个任务各自另计timeout秒，不占用该任务的超时时间。
+
+        Raises:
+            TimeoutError: 超过timeout秒未返回结果
+            EOFError / OSError: 工作进程崩溃或管道断开
+        """
+        self.task_count += 1
+        deadline = timeout * (1 + self.queued_tasks)
+        self.queued_tasks = 0
+        self.conn.send(message)
+        if not self.conn.poll(deadline):
+            raise TimeoutError(f"验证任务超过{deadline}秒未完成")
+        return self.conn.recv()
+
+    def notify(self, message):
+        """发送不需要回复、不执行代码的消息（如会话提交/回滚）"""
+        self.conn.send(message)
+
+    def queue(self, message):
+        """发送需要执行代码但不等待回复的任务（如session_apply），其执行时间计入下一个请求的等待时间"""
+        self.task_count += 1
+        self.queued_tasks += 1
+        self.conn.send(message)
+
+    def kill(self):
+        """强制终止工作进程（用于超时或崩溃后的清理）"""
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def stop(self, timeout=5):
+        """正常关闭工作进程，超时未退出则强制终止"""
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+
+class ValidatorPool:
+    """
+    常驻验证工作进程池
+
+    工作进程启动时预加载cadquery，之后反复执行验证任务，避免每次验证都冷启动解释器。
+    保持与子进程方案相同的隔离性：
+    - 任务超时或工作进程崩溃时，强制终止该进程，下一次任务自动创建新进程替换
+    - 每个工作进程执行max_tasks_per_worker个任务后回收重建，防止OCC对象和内存累积
+
+    每个任务（及每个验证会话）开始时，追踪器模块（cadquery_tracker）的模块级数据恢复为导入时的状态，
+    create_tracker()在同一进程中重复调用也不会累积状态，结果与任务由哪个工作进程执行、之前执行过什么无关。
+
+    线程安全：多个线程可同时调用run()，最多同时使用size个工作进程。
+    """
+
+    def __init__(self, size=1, timeout=10, max_tasks_per_worker=200, start_method='spawn'):
+        """
+        Args:
+            size: 工作进程数量上限
+            timeout: 单个验证任务的超时时间（秒）
+            max_tasks_per_worker: 每个工作进程执行多少个任务后回收重建
+            start_method: multiprocessing启动方式（默认spawn，避免继承主进程中的OCC状态）
+        """
+        if size < 1:
+            raise ValueError(f"工作进程数量必须大于0，当前为{size}")
+        self.size = size
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        self._idle_workers = queue.LifoQueue()
+        self._worker_count = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.restart_count = 0  # 因超时/崩溃而重建的工作进程数
+
+    def _acquire_worker(self):
+        """获取一个空闲工作进程，必要时创建新进程；达到上限时阻塞等待"""
+        while True:
+            if self._closed:
+                raise RuntimeError("验证进程池已关闭")
+            try:
+                return self._idle_workers.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                if self._worker_count < self.size:
+                    self._worker_count += 1
+                    create_new = True
+                else:
+                    create_new = False
+
+            if create_new:
+                try:
+                    return _ValidatorWorker(self._context, PROJECT_ROOT)
+                except Exception:
+                    with self._lock:
+                        self._worker_count -= 1
+                    raise
+
+            try:
+                return self._idle_workers.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _release_worker(self, worker):
+        """归还工作进程；达到任务数上限或进程池已关闭时回收该进程"""
+        if self._closed or worker.task_count >= self.max_tasks_per_worker:
+            worker.stop()
+            self._discard_worker()
+        else:
+            self._idle_workers.put(worker)
+
+    def _discard_worker(self):
+        with self._lock:
+            self._worker_count -= 1
+
+    def _request(self, worker, message):
+        """
+        在指定工作进程上执行一个请求
+
+        Returns:
+            tuple: (alive: bool, reply or None, error_message: str or None)
+            alive为False时该工作进程已被终止，不能再归还到进程池
+        """
+        try:
+            return True, worker.request(message, self.timeout), None
+        except TimeoutError:
+            worker.kill()
+            self.restart_count += 1
+            return False, None, "代码执行超时（工作进程已终止并重建）"
+        except (EOFError, OSError) as e:
+            worker.kill()
+            self.restart_count += 1
+            return False, None, f"验证工作进程异常退出: {type(e).__name__}: {e}"
+
+    def run(self, code_to_validate):
+        """
+        在工作进程中执行代码并返回实体指标
+
+        Args:
+            code_to_validate: 要验证的完整代码字符串
+
+        Returns:
+            tuple: (success: bool, metrics: dict or None, error_message: str or None)
+        """
+        worker = self._acquire_worker()
+        alive, reply, error_msg = self._request(worker, ('run', code_to_validate))
+        if not alive:
+            self._discard_worker()
+            return False, None, error_msg
+        self._release_worker(worker)
+        return reply
+
+    def session(self, base_code):
+        """
+        创建增量验证会话
+
+        Args:
+            base_code: 会话的基础代码（如import语句和追踪器初始化）
+
+        Returns:
+            ValidationSession: 绑定到本进程池的验证会话
+        """
+        return ValidationSession(self, base_code)
+
+    def close(self):
+        """关闭所有空闲工作进程（正在使用的工作进程在归还时关闭）"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle_workers.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            self._discard_worker()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ValidationSession:
+    """
+    增量验证会话
+
+    会话独占一个工作进程，并在其中保存最近一次提交的result实体。
+    每次只执行新的候选代码片段，根据验证结果调用commit()或rollback()，
+    使每一步的验证成本与程序长度无关。
+    候选片段在已提交状态的副本中执行，其中的追踪器对象及追踪器模块的数据为提交时状态的深拷贝，
+    被回滚的片段不会影响之后的步骤，已提交的状态与在新进程中执行self.code得到的状态一致。
+
+    工作进程超时或崩溃时会被终止，下一次执行片段前在新的工作进程中
+    重放已提交的代码恢复状态；工作进程达到任务数上限时同样以重放方式回收重建。
+    """
+
+    def __init__(self, pool, base_code):
+        self._pool = pool
+        self.base_code = base_code
+        self.accepted_fragments = []  # 已提交的代码片段（用于重放恢复）
+        self._worker = None
+        self._pending_fragment = None
+        self.replay_count = 0  # 重放恢复的次数
+
+    @property
+    def code(self):
+        """当前已提交的完整代码"""
+        return self.base_code + "".join(self.accepted_fragments)
+
+    def _ensure_worker(self):
+        """确保会话绑定了可用的工作进程，必要时重放已提交代码恢复状态"""
+        if self._worker is not None and self._worker.task_count >= self._pool.max_tasks_per_worker:
+            self._release()
+        if self._worker is not None:
+            return True, None
+
+        worker = self._pool._acquire_worker()
+        if self.accepted_fragments:
+            self.replay_count += 1
+        alive, reply, error_msg = self._pool._request(worker, ('session_begin', self.code))
+        if not alive:
+            self._pool._discard_worker()
+            return False, error_msg
+        success, _, error_msg = reply
+        if not success:
+            self._pool._release_worker(worker)
+            return False, f"会话初始化失败: {error_msg}"
+        self._worker = worker
+        return True, None
+
+    def try_fragment(self, fragment):
+        """
+        在已提交状态上执行候选代码片段并返回实体指标
+
+        Args:
+            fragment: 候选步骤的代码片段
+
+        Returns:
+            tuple: (success: bool, metrics: dict or None, error_message: str or None)
+        """
+        self._pending_fragment = None
+        ready, error_msg = self._ensure_worker()
+        if not ready:
+            return False, None, error_msg
+
+        alive, reply, error_msg = self._pool._request(self._worker, ('session_try', fragment))
+        if alive and reply[2] == _SESSION_NOT_READY and self._recover():
+            alive, reply, error_msg = self._pool._request(self._worker, ('session_try', fragment))
+        if not alive:
+            self._worker = None
+            self._pool._discard_worker()
+            return False, None, error_msg
+        if reply[0]:
+            # 执行失败的片段在工作进程中没有候选状态，不能提交
+            self._pending_fragment = fragment
+        return reply
+
+    def _recover(self):
+        """工作进程中的会话状态已丢失时，归还该进程并在新进程中重放已提交代码，返回是否恢复成功"""
+        self._release()
+        ready, _ = self._ensure_worker()
+        return ready
+
+    def export(self, geometry_format):
+        """
+        在工作进程中将已提交的result导出为几何文件内容（不重新执行代码）
+
+        Args:
+            geometry_format: 几何格式，GEOMETRY_FORMATS之一
+
+        Returns:
+            tuple: (success: bool, data: bytes or None, error_message: str or None)
+        """
+        ready, error_msg = self._ensure_worker()
+        if not ready:
+            return False, None, error_msg
+        alive, reply, error_msg = self._pool._request(self._worker, ('session_export', geometry_format))
+        if not alive:
+            self._worker = None
+            self._pool._discard_worker()
+            return False, None, error_msg
+        return reply
+
+    def _notify(self, message, queued=False):
+        if self._worker is None:
+            return
+        try:
+            if queued:
+                self._worker.queue(message)
+            else:
+                self._worker.notify(message)
+        except (BrokenPipeError, OSError):
+            # 工作进程已退出，下一次执行片段时重放恢复
+            self._worker.kill()
+            self._worker = None
+            self._pool._discard_worker()
+
+    def commit(self):
+        """
+        提交最近一次执行成功的候选片段
+
+        Raises:
+            RuntimeError: 没有执行成功且尚未提交或回滚的候选片段
+        """
+        if self._pending_fragment is None:
+            raise RuntimeError("没有可提交的候选片段")
+        self.accepted_fragments.append(self._pending_fragment)
+        self._pending_fragment = None
+        self._notify(('session_commit', None))
+
+    def rollback(self):
+        """丢弃最近一次执行的候选片段"""
+        self._pending_fragment = None
+        self._notify(('session_rollback', None))
+
+    def apply(self, fragment):
+        """
+        丢弃最近一次执行的候选片段，直接提交另一个已验证通过的片段
+
+        片段在工作进程中执行但不等待结果，与之后的请求在管道中排队（见SpeculativeSession）；
+        下一个请求的等待时间加上一个超时时间，较慢但有效的片段不会使下一个候选被判为超时。
+        """
+        self._pending_fragment = None
+        self.accepted_fragments.append(fragment)
+        self._notify(('session_apply', fragment), queued=True)
+
+    def _release(self):
+        worker = self._worker
+        self._worker = None
+        try:
+            worker.notify(('session_end', None))
+        except (BrokenPipeError, OSError):
+            worker.kill()
+            self._pool._discard_worker()
+            return
+        self._pool._release_worker(worker)
+
+    def close(self):
+        """结束会话并归还工作进程"""
+        self._pending_fragment = None
+        if self._worker is not None:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SpeculativeSession:
+    """
+    推测式验证会话：多个增量验证会话（通道）保持相同的已提交状态，
+    每一步将多个候选片段分给各个通道，在各自的工作进程中同时执行
+
+    提交其中一个候选后，其余通道通过ValidationSession.apply()在各自的工作进程中补执行该片段，
+    不等待回复，与下一步的候选在管道中排队，因此每一步只有一次往返的等待时间。
+    每个通道独占进程池中的一个工作进程，width不能超过进程池的工作进程数。
+    """
+
+    def __init__(self, pool, base_code, width):
+        """
+        Args:
+            pool: ValidatorPool
+            base_code: 会话的基础代码
+            width: 通道数，即每轮同时执行的候选片段数
+        """
+        if not 1 <= width <= pool.size:
+            raise ValueError(f"推测式验证的通道数必须在1到进程池大小{pool.size}之间，当前为{width}")
+        self.lanes = [ValidationSession(pool, base_code) for _ in range(width)]
+        # 第一个通道在调用线程中执行，其余通道各用一个线程等待工作进程的回复
+        self._executor = ThreadPoolExecutor(max_workers=width - 1) if width > 1 else None
+        self._fragments = []
+
+    @property
+    def width(self):
+        return len(self.lanes)
+
+    @property
+    def code(self):
+        """当前已提交的完整代码"""
+        return self.lanes[0].code
+
+    @property
+    def replay_count(self):
+        return sum(lane.replay_count for lane in self.lanes)
+
+    def try_fragments(self, fragments):
+        """
+        在已提交状态上同时执行多个候选片段（不超过width个）
+
+        Returns:
+            list: 每个片段的 (success: bool, metrics: dict or None, error_message: str or None)
+        """
+        if not 1 <= len(fragments) <= self.width:
+            raise ValueError(f"每轮候选片段数必须在1到{self.width}之间，当前为{len(fragments)}")
+        self._fragments = list(fragments)
+        futures = [self._executor.submit(lane.try_fragment, fragment)
+                   for lane, fragment in zip(self.lanes[1:], fragments[1:])]
+        replies = [self.lanes[0].try_fragment(fragments[0])]
+        replies.extend(future.result() for future in futures)
+        return replies
+
+    def commit(self, index):
+        """提交最近一轮中第index个候选片段，其余通道补执行该片段"""
+        if not 0 <= index < len(self._fragments):
+            raise RuntimeError("没有可提交的候选片段")
+        fragment = self._fragments[index]
+        self._fragments = []
+        for i, lane in enumerate(self.lanes):
+            if i == index:
+                lane.commit()
+            else:
+                lane.apply(fragment)
+
+    def rollback(self):
+        """丢弃最近一轮的所有候选片段"""
+        self._fragments = []
+        for lane in self.lanes:
+            lane.rollback()
+
+    def apply(self, fragment):
+        """所有通道直接提交一个已验证通过的片段（如较早轮次中的候选，见ValidationSession.apply）"""
+        self._fragments = []
+        for lane in self.lanes:
+            lane.apply(fragment)
+
+    def export(self, geometry_format):
+        """导出已提交的result（见ValidationSession.export）"""
+        return self.lanes[0].export(geometry_format)
+
+    def close(self):
+        """结束所有通道并归还工作进程"""
+        for lane in self.lanes:
+            lane.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# 进程内默认共享的验证进程池（首次使用时创建）
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_validator_pool(min_size=1):
+    """
+    获取默认验证进程池，首次调用时创建
+
+    Args:
+        min_size: 需要的最少工作进程数，默认进程池更小时按原有设置重建（如推测式验证需要多个通道）
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ValidatorPool(size=min_size)
+        elif _default_pool.size < min_size:
+            previous = _default_pool
+            previous.close()
+            _default_pool = ValidatorPool(size=min_size, timeout=previous.timeout,
+                                          max_tasks_per_worker=previous.max_tasks_per_worker,
+                                          start_method=previous.start_method)
+        return _default_pool
+
+
+def configure_validator_pool(**pool_kwargs):
+    """
+    按给定参数重建默认验证进程池（例如调整进程数、超时或回收周期）
+
+    Args:
+        **pool_kwargs: 传给ValidatorPool的参数
+
+    Returns:
+        ValidatorPool: 新的默认进程池
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+        _default_pool = ValidatorPool(**pool_kwargs)
+        return _default_pool
+
+
+@atexit.register
+def _close_default_pool():
+    if _default_pool is not None:
+        _default_pool.close()
+
+
+def validate_code_in_pool(code_to_validate, pool=None):
+    """
+    在常驻工作进程中执行代码并返回实体指标
+
+    Args:
+        code_to_validate: 要验证的完整代码字符串
+        pool: 使用的ValidatorPool，默认使用进程内共享的默认进程池
+
+    Returns:
+        tuple: (success: bool, metrics: dict or None, error_message: str or None)
+    """
+    if pool is None:
+        pool = get_validator_pool()
+    return pool.run(code_to_validate)
+
+
+def validate_code_volume_change(code_to_validate, last_volume=None, relative_threshold=0.001, pool=None,
+                                allow_multi_solid=False):
     """
     验证代码并判断体积是否发生变化
     
@@ -118,27 +1002,108 @@ def validate_code_volume_change(code_to_validate, last_volume=None, relative_thr
         code_to_validate: 要验证的完整代码
         last_volume: 上一次的体积值
         relative_threshold: 相对变化阈值（默认0.1%）
+        pool: 执行验证的ValidatorPool，默认使用进程内共享的默认进程池
+        allow_multi_solid: 是否允许结果包含多个实体（默认不允许，视为验证失败）
         
     Returns:
-        tuple: (is_valid: bool, is_changed: bool, current_volume: float or None, error_message: str or None)
+        dict: 验证结果，见_build_validation_result
+    """
+    success, metrics, error_msg = validate_code_in_pool(code_to_validate, pool)
+    return _build_validation_result(success, metrics, error_msg, last_volume, relative_threshold, allow_multi_solid)
+
+
+def validate_fragment_volume_change(session, fragment, last_volume=None, relative_threshold=0.001,
+                                    allow_multi_solid=False):
     """
-    success, current_volume, error_msg = validate_code_in_subprocess(code_to_validate)
+    在增量验证会话中只执行新片段，并判断体积是否发生变化
     
-    if not success:
-        return False, False, None, error_msg
+    调用者需根据返回结果调用session.commit()或session.rollback()。
+    
+    Args:
+        session: ValidationSession实例
+        fragment: 候选步骤的代码片段
+        last_volume: 上一次的体积值
+        relative_threshold: 相对变化阈值（默认0.1%）
+        allow_multi_solid: 是否允许结果包含多个实体（默认不允许，视为验证失败）
+        
+    Returns:
+        dict: 验证结果，见_build_validation_result
+    """
+    success, metrics, error_msg = session.try_fragment(fragment)
+    return _build_validation_result(success, metrics, error_msg, last_volume, relative_threshold, allow_multi_solid)
+
+
+def validate_fragments_volume_change(session, fragments, last_volume=None, relative_threshold=0.001,
+                                     allow_multi_solid=False):
+    """
+    在推测式验证会话中同时执行多个候选片段，并分别判断体积是否发生变化
+
+    调用者需根据返回结果调用session.commit(index)或session.rollback()。
+
+    Args:
+        session: SpeculativeSession实例
+        fragments: 候选步骤的代码片段（不超过session.width个）
+        其余参数同validate_fragment_volume_change
+
+    Returns:
+        list: 每个片段的验证结果，见_build_validation_result
+    """
+    return [
+        _build_validation_result(success, metrics, error_msg, last_volume, relative_threshold, allow_multi_solid)
+        for success, metrics, error_msg in session.try_fragments(fragments)
+    ]
+
+
+def _build_validation_result(success, metrics, error_msg, last_volume, relative_threshold, allow_multi_solid):
+    """
+    将工作进程返回的指标整理为结构化验证结果
     
-    # 判断体积是否变化
+    Returns:
+        dict: {
+            'is_valid': 代码是否执行成功并得到合法结果,
+            'is_changed': 体积相对上一次是否变化,
+            'volume': 体积,
+            'bbox': 包围盒(xmin, ymin, zmin, xmax, ymax, zmax),
+            'solid_count': 实体数量,
+            'face_count': 面数量,
+            'shape_valid': 实体是否通过OCC几何有效性检查,
+            'error': 错误信息
+        }
+    """
+    validation = {
+        'is_valid': False,
+        'is_changed': False,
+        'volume': None,
+        'bbox': None,
+        'solid_count': None,
+        'face_count': None,
+        'shape_valid': None,
+        'error': error_msg,
+    }
+    if not success:
+        return validation
+
+    validation.update(metrics)
+    solid_count = metrics.get('solid_count')
+    if not allow_multi_solid and solid_count is not None and solid_count > 1:
+        # result.val()只统计第一个实体的体积，多实体结果直接判为无效
+        validation['error'] = f"结果包含{solid_count}个实体"
+        return validation
+
+    validation['is_valid'] = True
+    validation['is_changed'] = _is_volume_changed(metrics['volume'], last_volume, relative_threshold)
+    return validation
+
+
+def _is_volume_changed(current_volume, last_volume, relative_threshold):
+    """判断体积相对上一次是否发生变化"""
     if last_volume is None:
         # 首次验证，认为有变化
-        is_changed = True
-    else:
-        # 使用相对误差判断
-        if abs(last_volume) < 1e-10:
-            # 上一次体积接近零，使用绝对误差
-            is_changed = abs(current_volume) > 1e-6
-        else:
-            # 使用相对误差
-            relative_change = abs(current_volume - last_volume) / abs(last_volume)
-            is_changed = relative_change > relative_threshold
-    
-    return True, is_changed, current_volume, None
+        return True
+    # 使用相对误差判断
+    if abs(last_volume) < 1e-10:
+        # 上一次体积接近零，使用绝对误差
+        return abs(current_volume) > 1e-6
+    # 使用相对误差
+    relative_change = abs(current_volume - last_volume) / abs(last_volume)
+    return relative_change > relative_threshold
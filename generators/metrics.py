@@ -0,0 +1,203 @@
+"""
+生成流程的日志配置、分阶段计数器与计时器
+
+各模块通过 logging.getLogger(__name__) 输出日志（逐循环的信息为DEBUG级别），
+通过 get_metrics() 记录各阶段的耗时和步骤被接受/拒绝的原因：
+
+    metrics = get_metrics()
+    with metrics.timer('validate'):
+        ...
+    metrics.count('step.accepted')
+    metrics.gauge('writer.queue_depth', depth)
+
+并行生成时每个工作进程有自己的计数，随样本返回主进程后合并（见processors.sample_stream）。
+MetricsWriter 定期将累计结果以JSON行追加到指标文件。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 日志级别通过环境变量传给spawn启动的工作进程（工作进程初始化时调用configure_logging()读取）
+LOG_LEVEL_ENV = "CQ_LOG_LEVEL"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(level=None):
+    """
+    配置日志输出
+
+    Args:
+        level: 日志级别（如'INFO'、'DEBUG'、logging.ERROR），为None时读取环境变量CQ_LOG_LEVEL（默认INFO）；
+            指定时同时写入环境变量，之后启动的工作进程使用相同级别
+    """
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV, "INFO")
+    if isinstance(level, int):
+        level = logging.getLevelName(level)
+    level = level.upper()
+    os.environ[LOG_LEVEL_ENV] = level
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.getLogger().setLevel(level)
+
+
+class StageMetrics:
+    """
+    分阶段的计数器与计时器（线程安全）
+
+    - counters：名称 -> 次数
+    - timers：名称 -> [次数, 总耗时(秒), 最大耗时(秒)]
+    - gauges：名称 -> [最近一次的值, 最大值]（如队列深度）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+
+    def count(self, name, n=1):
+        """计数器name增加n"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds, count=1):
+        """计时器name增加一次（或count次）耗时"""
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [count, seconds, seconds]
+            else:
+                timer[0] += count
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def gauge(self, name, value):
+        """记录gauge name的当前值"""
+        with self._lock:
+            item = self.gauges.get(name)
+            if item is None:
+                self.gauges[name] = [value, value]
+            else:
+                item[0] = value
+                item[1] = max(item[1], value)
+
+    @contextmanager
+    def timer(self, name):
+        """对with块计时（块内抛出异常时同样计入）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """当前累计结果（可JSON序列化，可通过merge合并到其他进程的计数中）"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {
+                    name: {'count': count, 'total_s': total, 'max_s': max_seconds}
+                    for name, (count, total, max_seconds) in self.timers.items()
+                },
+                'gauges': {name: {'value': value, 'max': max_value}
+                           for name, (value, max_value) in self.gauges.items()},
+            }
+
+    def merge(self, snapshot):
+        """合并另一个进程的snapshot()结果"""
+        with self._lock:
+            for name, n in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for name, item in snapshot['timers'].items():
+                timer = self.timers.get(name)
+                if timer is None:
+                    self.timers[name] = [item['count'], item['total_s'], item['max_s']]
+                else:
+                    timer[0] += item['count']
+                    timer[1] += item['total_s']
+                    timer[2] = max(timer[2], item['max_s'])
+            for name, item in snapshot.get('gauges', {}).items():
+                gauge = self.gauges.get(name)
+                if gauge is None:
+                    self.gauges[name] = [item['value'], item['max']]
+                else:
+                    gauge[0] = item['value']
+                    gauge[1] = max(gauge[1], item['max'])
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.gauges.clear()
+
+
+_metrics = StageMetrics()
+
+
+def get_metrics():
+    """进程内共享的StageMetrics"""
+    return _metrics
+
+
+class MetricsWriter:
+    """
+    定期将累计指标写入JSON行文件
+
+    每行包含写入时间、自创建以来的秒数、计数器、gauge（当前值和最大值），
+    以及每个计时器的次数、总耗时、平均和最大耗时（毫秒）。
+    在生成循环中调用maybe_write()，距上次写入超过interval秒时才写入；close()时写入最后一行。
+    """
+
+    def __init__(self, path, interval=10.0, metrics=None):
+        """
+        Args:
+            path: 指标文件路径（追加写入）
+            interval: 两次写入的最小间隔（秒）
+            metrics: 写入的StageMetrics，默认使用get_metrics()
+        """
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self._start = time.monotonic()
+        self._last_write = self._start
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def maybe_write(self):
+        """距上次写入超过interval秒时写入一行"""
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        now = time.monotonic()
+        snapshot = self.metrics.snapshot()
+        line = {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'elapsed_s': round(now - self._start, 3),
+            'counters': snapshot['counters'],
+            'timers': {
+                name: {
+                    'count': item['count'],
+                    'total_s': round(item['total_s'], 6),
+                    'mean_ms': round(item['total_s'] / item['count'] * 1000, 3) if item['count'] else None,
+                    'max_ms': round(item['max_s'] * 1000, 3),
+                }
+                for name, item in snapshot['timers'].items()
+            },
+            'gauges': snapshot['gauges'],
+        }
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._last_write = now
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.write()
+        self._file.close()
@@ -0,0 +1,93 @@
+"""
+表面点云采样：对最终result只做一次三角剖分，再用numpy在三角形数组上按面积加权批量采样点及法向
+
+三角剖分借用二进制STL导出（验证工作进程中的ValidationSession.export('stl')，或当前进程中的shape_stl_bytes），
+STL数据用np.frombuffer直接解析为 (三角形数, 3, 3) 数组，整个过程没有逐面、逐点的Python循环。
+法向为所在三角形的法向（由顶点顺序确定，STL写出器已按面的朝向调整为指向实体外侧）。
+
+用法：
+    triangles = parse_stl(stl_bytes)
+    points, normals = sample_point_cloud(triangles, 2048, rng=np.random.default_rng(0))
+"""
+import os
+import tempfile
+
+import numpy as np
+
+
+DEFAULT_POINT_COUNT = 2048
+
+_STL_HEADER_SIZE = 84  # 80字节文件头 + 三角形数（uint32）
+_STL_TRIANGLE_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2'),
+])
+
+
+def parse_stl(data):
+    """
+    解析二进制STL
+
+    Args:
+        data: 二进制STL文件内容（bytes）
+
+    Returns:
+        np.ndarray: (三角形数, 3, 3) float64，每个三角形的三个顶点
+    """
+    if len(data) < _STL_HEADER_SIZE:
+        raise ValueError("STL数据过短")
+    triangle_count = int(np.frombuffer(data, dtype='<u4', count=1, offset=80)[0])
+    if len(data) < _STL_HEADER_SIZE + triangle_count * _STL_TRIANGLE_DTYPE.itemsize:
+        raise ValueError(f"STL数据不完整（应有{triangle_count}个三角形），可能不是二进制STL")
+    records = np.frombuffer(data, dtype=_STL_TRIANGLE_DTYPE, count=triangle_count, offset=_STL_HEADER_SIZE)
+    return records['vertices'].astype(np.float64)
+
+
+def shape_stl_bytes(shape):
+    """在当前进程中将cadquery Shape剖分并导出为二进制STL（离线处理已保存的BREP/STEP几何时使用）"""
+    fd, temp_path = tempfile.mkstemp(suffix=".stl")
+    os.close(fd)
+    try:
+        shape.exportStl(temp_path)
+        with open(temp_path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(temp_path)
+
+
+def sample_point_cloud(triangles, point_count=DEFAULT_POINT_COUNT, rng=None):
+    """
+    在三角形表面上按面积均匀采样点
+
+    Args:
+        triangles: (三角形数, 3, 3) 顶点数组（见parse_stl）
+        point_count: 采样点数
+        rng: numpy随机数生成器（np.random.Generator），为None时新建一个不带种子的生成器
+
+    Returns:
+        tuple: (points (point_count, 3) float64, normals (point_count, 3) float64 单位法向)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    cross = np.cross(b - a, c - a)
+    double_areas = np.linalg.norm(cross, axis=1)
+    total = double_areas.sum()
+    if not total > 0:
+        raise ValueError("表面积为0，无法采样点云")
+
+    # 按面积选择三角形：在累积面积上二分查找
+    cumulative = np.cumsum(double_areas)
+    chosen = np.searchsorted(cumulative, rng.random(point_count) * cumulative[-1], side='right')
+    chosen = np.minimum(chosen, len(triangles) - 1)
+
+    # 三角形内均匀分布的重心坐标
+    r1 = np.sqrt(rng.random(point_count))
+    r2 = rng.random(point_count)
+    u = (1.0 - r1)[:, None]
+    v = (r1 * (1.0 - r2))[:, None]
+    w = (r1 * r2)[:, None]
+    points = u * a[chosen] + v * b[chosen] + w * c[chosen]
+    normals = cross[chosen] / double_areas[chosen][:, None]
+    return points, normals
@@ -1,119 +1,138 @@
 import cadquery as cq
-from OCP.BRepAdaptor import BRepAdaptor_Curve
-from OCP.GeomAbs import GeomAbs_Line, GeomAbs_Circle, GeomAbs_Ellipse
 import math
 
-def generate_sketch_code(wires):
+from .sketch_record import SketchRecord, EDGE_LINE, EDGE_CIRCLE
+
+# 端点连接容差：下一条边的端点与当前点的距离不超过该值时视为相连
+CONNECT_TOLERANCE = 1e-3
+
+
+class _EndpointIndex:
+    """
+    边端点的网格哈希索引，用于按端点连接边
+
+    端点按2倍CONNECT_TOLERANCE大小的网格量化，与查询点距离不超过容差的端点一定位于
+    查询点所在网格及其8个相邻网格中（网格大于容差，除法的舍入误差不会使其落到更远的网格），
+    因此每次查找只需检查少量候选端点，整个Wire的连接为O(E)而不是逐条扫描所有未使用边的O(E²)。
+
+    选择规则与逐条扫描完全相同：按开方后的距离比较，距离最近者优先，距离相同时边序号小者优先，
+    同一条边的起点优先于终点（平方距离不同的两个端点开方后可能相同，因此不能只比较平方距离）。
+    """
+
+    def __init__(self, edge_info_list, tolerance=CONNECT_TOLERANCE):
+        self.edge_info_list = edge_info_list
+        self.tolerance = tolerance
+        self.cell_size = 2 * tolerance
+        self.cells = {}
+        for edge_idx, edge_info in enumerate(edge_info_list):
+            for is_end, (x, y) in ((False, edge_info['start']), (True, edge_info['end'])):
+                self.cells.setdefault(self._cell(x, y), []).append((edge_idx, is_end, x, y))
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def take_nearest(self, pt):
+        """
+        查找与pt=(x, y)最近的未使用边的端点（不标记为已使用）
+
+        Returns:
+            tuple: (edge_info, reverse)，reverse为True表示终点与pt相连；
+            容差范围内没有未使用边时返回(None, False)
+        """
+        px, py = pt
+        cell_x, cell_y = self._cell(px, py)
+        best = None  # (距离, 边序号, 是否终点)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for edge_idx, is_end, x, y in self.cells.get((cell_x + dx, cell_y + dy), ()):
+                    if self.edge_info_list[edge_idx]['used']:
+                        continue
+                    candidate = (math.sqrt((x - px) ** 2 + (y - py) ** 2), edge_idx, is_end)
+                    if best is None or candidate < best:
+                        best = candidate
+        if best is None or best[0] > self.tolerance:
+            return None, False
+        return self.edge_info_list[best[1]], best[2]
+
+
+def _arc_or_line_code(start_pt, mid_pt, end_pt):
+    """圆弧边的代码：三点共线时退化为直线"""
+    # 检查三点是否共线
+    v1_x = mid_pt[0] - start_pt[0]
+    v1_y = mid_pt[1] - start_pt[1]
+    v2_x = end_pt[0] - start_pt[0]
+    v2_y = end_pt[1] - start_pt[1]
+    cross_product = abs(v1_x * v2_y - v1_y * v2_x)
+    if cross_product < 1e-10:
+        return f"    .lineTo({round(end_pt[0], 2):.2f}, {round(end_pt[1], 2):.2f})"
+    return (
+        f"    .threePointArc(({round(mid_pt[0], 2):.2f}, {round(mid_pt[1], 2):.2f}), "
+        f"({round(end_pt[0], 2):.2f}, {round(end_pt[1], 2):.2f}))"
+    )
+
+
+def generate_sketch_code(sketch):
     """
-    根据输入的Wire列表生成Workplane代码
-    :param wires: 包含多个Wire对象的列表（每个Wire是一个闭合环）
+    根据输入的草图生成Workplane代码
+    :param sketch: SketchRecord，或包含多个Wire对象的列表（每个Wire是一个闭合环）
     :return: 生成的CadQuery Workplane代码字符串
     """
-    if not wires:
+    if not sketch:
         return "result = cq.Workplane('XY')"
+    if not isinstance(sketch, SketchRecord):
+        sketch = SketchRecord.from_wires(sketch)
 
     lines = ["result = (", "    cq.Workplane('XY')"]
 
-    for wire_idx, wire in enumerate(wires):
-        edges = wire.Edges()
-        if not edges:
+    for wire_start, wire_end in sketch.iter_wire_ranges():
+        if wire_start == wire_end:
             continue
 
         # 检查是否是单个边的完整圆
-        if len(edges) == 1:
-            edge = edges[0]
-            adaptor = BRepAdaptor_Curve(edge.wrapped)
-            curve_type = adaptor.GetType()
-            if curve_type == GeomAbs_Circle:
-                # 检查是否是完整圆：参数范围是否为 2π
-                u1 = adaptor.FirstParameter()
-                u2 = adaptor.LastParameter()
-                if abs((u2 - u1) - 2 * math.pi) < 1e-5: # 允许微小误差
-                    # 是完整圆
-                    geom_circle = adaptor.Circle()
-                    radius = geom_circle.Radius()
-                    center = geom_circle.Location()
-                    # Workplane.circle 从当前点为圆心画圆，或用 moveTo 移动到圆心
-                    # 为了与路径一致，我们先 moveTo 圆心
-                    lines.append(f"    .moveTo({round(center.X(), 2):.2f}, {round(center.Y(), 2):.2f})")
-                    lines.append(f"    .circle({round(radius, 2):.2f})")
-                    continue # 处理完完整圆就跳过下面的常规处理
+        if wire_end - wire_start == 1:
+            circle = sketch.full_circle(wire_start)
+            if circle is not None:
+                center_x, center_y, radius = circle
+                # Workplane.circle 从当前点为圆心画圆，或用 moveTo 移动到圆心
+                # 为了与路径一致，我们先 moveTo 圆心
+                lines.append(f"    .moveTo({round(center_x, 2):.2f}, {round(center_y, 2):.2f})")
+                lines.append(f"    .circle({round(radius, 2):.2f})")
+                continue # 处理完完整圆就跳过下面的常规处理
 
         # 非完整圆的通用处理 - 需要重新排序边以形成连续路径
         # 首先收集所有边的信息
         edge_info_list = []
-        for edge in edges:
-            start_pt = edge.startPoint()
-            end_pt = edge.endPoint()
-            adaptor = BRepAdaptor_Curve(edge.wrapped)
-            curve_type = adaptor.GetType()
+        for edge_idx in range(wire_start, wire_end):
+            start_pt, mid_pt, end_pt = sketch.edge_points(edge_idx)
             edge_info_list.append({
-                'edge': edge,
                 'start': start_pt,
+                'mid': mid_pt,
                 'end': end_pt,
-                'adaptor': adaptor,
-                'curve_type': curve_type,
+                'curve_type': sketch.edge_types[edge_idx],
                 'used': False
             })
-        
-        # 从第一条边开始，构建连续路径
-        if not edge_info_list:
-            continue
-            
+
         # 选择第一条边
         current_edge_info = edge_info_list[0]
         current_edge_info['used'] = True
         first_pt = current_edge_info['start']
         last_pt = current_edge_info['end']
         
-        lines.append(f"    .moveTo({round(first_pt.x, 2):.2f}, {round(first_pt.y, 2):.2f})")
+        lines.append(f"    .moveTo({round(first_pt[0], 2):.2f}, {round(first_pt[1], 2):.2f})")
         
         # 生成第一条边的代码
-        if current_edge_info['curve_type'] == GeomAbs_Line:
-            lines.append(f"    .lineTo({round(last_pt.x, 2):.2f}, {round(last_pt.y, 2):.2f})")
-        elif current_edge_info['curve_type'] == GeomAbs_Circle:
-            mid_pt = current_edge_info['edge'].positionAt(0.5)
-            v1_x = mid_pt.x - first_pt.x
-            v1_y = mid_pt.y - first_pt.y
-            v2_x = last_pt.x - first_pt.x
-            v2_y = last_pt.y - first_pt.y
-            cross_product = abs(v1_x * v2_y - v1_y * v2_x)
-            if cross_product < 1e-10:
-                lines.append(f"    .lineTo({round(last_pt.x, 2):.2f}, {round(last_pt.y, 2):.2f})")
-            else:
-                lines.append(
-                    f"    .threePointArc(({round(mid_pt.x, 2):.2f}, {round(mid_pt.y, 2):.2f}), "
-                    f"({round(last_pt.x, 2):.2f}, {round(last_pt.y, 2):.2f}))"
-                )
+        if current_edge_info['curve_type'] == EDGE_LINE:
+            lines.append(f"    .lineTo({round(last_pt[0], 2):.2f}, {round(last_pt[1], 2):.2f})")
+        elif current_edge_info['curve_type'] == EDGE_CIRCLE:
+            lines.append(_arc_or_line_code(first_pt, current_edge_info['mid'], last_pt))
         
         # 处理剩余的边
+        endpoint_index = _EndpointIndex(edge_info_list)
         for _ in range(len(edge_info_list) - 1):
-            # 找到下一条连接的边
-            next_edge_info = None
-            min_dist = float('inf')
-            reverse_next = False
-            
-            for edge_info in edge_info_list:
-                if edge_info['used']:
-                    continue
-                
-                # 检查这条边的起点或终点是否接近last_pt
-                dist_to_start = math.sqrt((edge_info['start'].x - last_pt.x)**2 + 
-                                         (edge_info['start'].y - last_pt.y)**2)
-                dist_to_end = math.sqrt((edge_info['end'].x - last_pt.x)**2 + 
-                                       (edge_info['end'].y - last_pt.y)**2)
-                
-                if dist_to_start < min_dist:
-                    min_dist = dist_to_start
-                    next_edge_info = edge_info
-                    reverse_next = False
-                
-                if dist_to_end < min_dist:
-                    min_dist = dist_to_end
-                    next_edge_info = edge_info
-                    reverse_next = True
-            
-            if next_edge_info is None or min_dist > 1e-3:
+            # 找到下一条连接的边（起点或终点与last_pt的距离不超过容差）
+            next_edge_info, reverse_next = endpoint_index.take_nearest(last_pt)
+
+            if next_edge_info is None:
                 # 找不到连接的边，可能是断开的路径
                 break
             
@@ -128,8 +147,8 @@ def generate_sketch_code(wires):
                 end_pt = next_edge_info['end']
             
             # 检查是否是重复点或回到起点的边
-            edge_length = math.sqrt((end_pt.x - last_pt.x)**2 + (end_pt.y - last_pt.y)**2)
-            distance_to_start = math.sqrt((end_pt.x - first_pt.x)**2 + (end_pt.y - first_pt.y)**2)
+            edge_length = math.sqrt((end_pt[0] - last_pt[0])**2 + (end_pt[1] - last_pt[1])**2)
+            distance_to_start = math.sqrt((end_pt[0] - first_pt[0])**2 + (end_pt[1] - first_pt[1])**2)
             
             # 如果这条边长度为0，跳过
             if edge_length < 1e-6:
@@ -143,37 +162,12 @@ def generate_sketch_code(wires):
             last_pt = end_pt
             
             # 生成代码
-            if next_edge_info['curve_type'] == GeomAbs_Line:
-                lines.append(f"    .lineTo({round(end_pt.x, 2):.2f}, {round(end_pt.y, 2):.2f})")
-
-            elif next_edge_info['curve_type'] == GeomAbs_Circle:
-                # 对于圆弧，需要根据方向获取正确的中点
-                edge = next_edge_info['edge']
-                if reverse_next:
-                    # 边是反向的，需要反向获取中点
-                    mid_pt = edge.positionAt(0.5)
-                    # 重新计算三点，确保顺序正确
-                    actual_start = start_pt
-                    actual_end = end_pt
-                else:
-                    mid_pt = edge.positionAt(0.5)
-                    actual_start = start_pt
-                    actual_end = end_pt
-                
-                # 检查三点是否共线
-                v1_x = mid_pt.x - actual_start.x
-                v1_y = mid_pt.y - actual_start.y
-                v2_x = actual_end.x - actual_start.x
-                v2_y = actual_end.y - actual_start.y
-                cross_product = abs(v1_x * v2_y - v1_y * v2_x)
-                
-                if cross_product < 1e-10:
-                    lines.append(f"    .lineTo({round(actual_end.x, 2):.2f}, {round(actual_end.y, 2):.2f})")
-                else:
-                    lines.append(
-                        f"    .threePointArc(({round(mid_pt.x, 2):.2f}, {round(mid_pt.y, 2):.2f}), "
-                        f"({round(actual_end.x, 2):.2f}, {round(actual_end.y, 2):.2f}))"
-                    )
+            if next_edge_info['curve_type'] == EDGE_LINE:
+                lines.append(f"    .lineTo({round(end_pt[0], 2):.2f}, {round(end_pt[1], 2):.2f})")
+
+            elif next_edge_info['curve_type'] == EDGE_CIRCLE:
+                # 圆弧的中点与方向无关，反向的边只需交换起点和终点
+                lines.append(_arc_or_line_code(start_pt, next_edge_info['mid'], end_pt))
 
         # 始终添加 close()，CadQuery 需要它来创建 wire
         lines.append("    .close()")
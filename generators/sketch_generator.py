@@ -1,12 +1,131 @@
 # generate_2d_sketch.py
-import cadquery as cq
+import logging
 import random
 
-def generate_2d_sketch(retry_count=0, max_retries=5):
-    """生成 2D 草图并执行布尔操作（通过 extrude 成薄片实现），然后提取所有底面的边界 Wires，并按面分组返回"""
+import cadquery as cq
+from OCP.BRep import BRep_Tool
+from OCP.BRepAdaptor import BRepAdaptor_Curve
+from OCP.GeomAbs import GeomAbs_Line
+from OCP.TopAbs import TopAbs_EDGE, TopAbs_FACE, TopAbs_WIRE
+from OCP.TopExp import TopExp, TopExp_Explorer
+from OCP.TopoDS import TopoDS
+
+from .metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+# 草图布尔运算方式：
+# - 'face'：直接对平面Face做二维布尔运算（默认，比拉伸成实体快得多）
+# - 'solid'：原有方式，将图元拉伸成1mm厚的薄片做三维布尔运算，再提取底面
+SKETCH_ENGINES = ('face', 'solid')
+
+
+def _primitive_wire(primitive_type, radius=None, width=None, height=None):
+    """
+    创建与solid方式中被拉伸的轮廓相同的Wire
+
+    solid方式中extrude使用的是Workplane的待处理轮廓（ctx.pendingWires），
+    rotate/translate只变换栈上的对象而不影响待处理轮廓，因此被拉伸的图元始终位于原点且未旋转。
+    这里按Workplane.circle/rect的方式直接创建该轮廓，省去构造Workplane的开销，保证两种方式得到相同的区域。
+    """
+    if primitive_type == "Circle":
+        return cq.Wire.makeCircle(radius, cq.Vector(), cq.Vector(0, 0, 1))
+    points = [
+        cq.Vector(width / -2.0, height / -2.0, 0),
+        cq.Vector(width / 2.0, height / -2.0, 0),
+        cq.Vector(width / 2.0, height / 2.0, 0),
+        cq.Vector(width / -2.0, height / 2.0, 0),
+    ]
+    points.append(points[0])
+    return cq.Wire.makePolygon(points)
+
+
+def _has_faces(shape):
+    """判断形状中是否有面（比shape.Faces()快，不需要收集全部面）"""
+    return TopExp_Explorer(shape.wrapped, TopAbs_FACE).More()
+
+
+def _is_degenerate_wire(wire):
+    """
+    判断由直线组成的Wire是否不围成面积（如沿同一线段往返的狭缝），
+    按顶点计算多边形的有向面积；含曲线边的Wire不做判断
+
+    Args:
+        wire: TopoDS_Wire
+    """
+    area = 0.0
+    explorer = TopExp_Explorer(wire, TopAbs_EDGE)
+    while explorer.More():
+        edge = TopoDS.Edge_s(explorer.Current())
+        if BRepAdaptor_Curve(edge).GetType() != GeomAbs_Line:
+            return False
+        start = BRep_Tool.Pnt_s(TopExp.FirstVertex_s(edge, True))
+        end = BRep_Tool.Pnt_s(TopExp.LastVertex_s(edge, True))
+        area += start.X() * end.Y() - end.X() * start.Y()
+        explorer.Next()
+    return abs(area) < 1e-9
+
+
+def _remove_degenerate_wires(shape):
+    """
+    移除面中不围成面积的Wire
+
+    面内有退化Wire时，ShapeUpgrade_UnifySameDomain（clean）可能陷入死循环并持续占用内存；
+    退化Wire不改变区域，移除后再合并相邻面。
+    """
+    explorer = TopExp_Explorer(shape.wrapped, TopAbs_WIRE)
+    while explorer.More():
+        if _is_degenerate_wire(explorer.Current()):
+            break
+        explorer.Next()
+    else:
+        return shape
+    kept_faces = []
+    for face in shape.Faces():
+        outer_wire = face.outerWire()
+        if _is_degenerate_wire(outer_wire.wrapped):
+            continue
+        inner_wires = [wire for wire in face.innerWires() if not _is_degenerate_wire(wire.wrapped)]
+        kept_faces.append(cq.Face.makeFromWires(outer_wire, inner_wires))
+    return cq.Compound.makeCompound(kept_faces)
+
+
+def _face_boolean(composite_face, primitive_face, boolean_op):
+    """对平面Face做二维布尔运算，并合并同一平面上的相邻面（与Workplane.union等的clean一致）"""
+    if boolean_op == "Union":
+        result = composite_face.fuse(primitive_face)
+    elif boolean_op == "Cut":
+        result = composite_face.cut(primitive_face)
+    else:
+        result = composite_face.intersect(primitive_face)
+    return _remove_degenerate_wires(result).clean()
+
+
+def generate_2d_sketch(retry_count=0, max_retries=5, rng=None, engine='face'):
+    """
+    生成 2D 草图并执行布尔操作，然后提取结果区域的边界 Wires，并按面分组返回
+
+    Args:
+        retry_count: 当前重试次数
+        max_retries: 最大重试次数
+        rng: 随机数生成器（random.Random），为None时使用全局random模块；
+            传入带种子的生成器时，结果只由种子决定
+        engine: 布尔运算方式，'face'（二维Face布尔运算，默认）或'solid'（拉伸成薄片后做三维布尔运算）；
+            'solid'是原有的实现，作为参考，'face'按相同的顺序抽取随机数并复现其语义。同一种子通常得到相同的区域，
+            但Wire的方向和边的顺序可能不同（'solid'取自法向朝下的底面）；在退化或极薄（sliver）的情况下，
+            两者的布尔运算容差不同，区域数和面积可能不同（如种子30、51，见tests/test_sketch_engines.py）
+    """
+    if engine not in SKETCH_ENGINES:
+        raise ValueError(f"未知的草图布尔运算方式: {engine}，可选值为 {SKETCH_ENGINES}")
+    if rng is None:
+        rng = random
+    if retry_count:
+        get_metrics().count('sketch.retry')
     if retry_count >= max_retries:
         # 达到最大重试次数，返回简单的矩形草图
-        print(f"警告：达到最大重试次数 {max_retries}，返回简单矩形草图")
+        logger.warning("达到最大重试次数 %d，返回简单矩形草图", max_retries)
+        get_metrics().count('sketch.fallback')
         try:
             simple_rect = cq.Workplane("XY").rect(10, 10).extrude(-1)
             simple_wires = []
@@ -16,73 +135,94 @@ def generate_2d_sketch(retry_count=0, max_retries=5):
                     simple_wires.append(face_wires)
             return simple_wires
         except Exception as e:
-            print(f"生成简单矩形草图失败：{e}")
+            logger.error("生成简单矩形草图失败：%s", e)
             return []  # 返回空列表作为最后的备选方案
     
-    numPrimitives = random.randint(3, 8)
-    composite_shape = None  # 3D Solid
+    numPrimitives = rng.randint(3, 8)
+    composite_shape = None  # 平面Face（face方式）或 3D Solid（solid方式）
+    last_nonempty_face = None  # face方式中最近一次非空的布尔运算结果
+    composite_is_empty = False
     
     # 定义小数部分列表
     decimal_parts = [0.00, 0.25, 0.50, 0.75]
 
     for i in range(numPrimitives):
-        primitive_type = random.choice(["Circle", "RotatedRectangle"])
-        boolean_op = random.choice(["Union", "Cut", "Intersection"])
+        primitive_type = rng.choice(["Circle", "RotatedRectangle"])
+        boolean_op = rng.choice(["Union", "Cut", "Intersection"])
 
         if primitive_type == "Circle":
             # 随机选择整数部分和小数部分，然后组合成半径
-            integer_part = random.randint(0, 100)  # 0到100的整数
-            decimal_part = random.choice(decimal_parts)  # 从指定的小数中选择
+            integer_part = rng.randint(0, 100)  # 0到100的整数
+            decimal_part = rng.choice(decimal_parts)  # 从指定的小数中选择
             radius = round(integer_part + decimal_part, 2)
             # 为坐标也使用同样的方法
-            center_x_integer = random.randint(-100, 100)
-            center_x_decimal = random.choice(decimal_parts)
-            center_y_integer = random.randint(-100, 100)
-            center_y_decimal = random.choice(decimal_parts)
+            center_x_integer = rng.randint(-100, 100)
+            center_x_decimal = rng.choice(decimal_parts)
+            center_y_integer = rng.randint(-100, 100)
+            center_y_decimal = rng.choice(decimal_parts)
             center = (round(center_x_integer + center_x_decimal, 2), round(center_y_integer + center_y_decimal, 2))
             # 1. 创建 2D Face (Workplane 对象)
-            primitive_2d = cq.Workplane("XY").circle(radius).translate(center)
+            if engine == 'face':
+                primitive_2d = _primitive_wire("Circle", radius=radius)
+            else:
+                primitive_2d = cq.Workplane("XY").circle(radius).translate(center)
         else:
             # 矩形的宽度和高度也使用同样方法
-            width_integer = random.randint(0, 10)
-            width_decimal = random.choice(decimal_parts)
+            width_integer = rng.randint(0, 10)
+            width_decimal = rng.choice(decimal_parts)
             width = round(width_integer + width_decimal, 2)
             
-            height_integer = random.randint(0, 10)
-            height_decimal = random.choice(decimal_parts)
+            height_integer = rng.randint(0, 10)
+            height_decimal = rng.choice(decimal_parts)
             height = round(height_integer + height_decimal, 2)
             
-            rotation = random.randint(0, 90)  # 角度为整数
+            rotation = rng.randint(0, 90)  # 角度为整数
             
             # 为坐标也使用同样的方法
-            center_x_integer = random.randint(-100, 100)
-            center_x_decimal = random.choice(decimal_parts)
-            center_y_integer = random.randint(-100, 100)
-            center_y_decimal = random.choice(decimal_parts)
+            center_x_integer = rng.randint(-100, 100)
+            center_x_decimal = rng.choice(decimal_parts)
+            center_y_integer = rng.randint(-100, 100)
+            center_y_decimal = rng.choice(decimal_parts)
             center = (round(center_x_integer + center_x_decimal, 2), round(center_y_integer + center_y_decimal, 2))
             # 1. 创建 2D Face (Workplane 对象)
-            primitive_2d = (
-                cq.Workplane("XY")
-                .rect(width, height)
-                .rotate((0, 0, 0), (0, 0, 1), rotation)
-                .translate(center)
-            )
-
-        # 2. 将 2D Face 拉伸成一个非常薄的 3D Solid
-        # 这样就可以进行布尔运算了
+            if engine == 'face':
+                primitive_2d = _primitive_wire("RotatedRectangle", width=width, height=height)
+            else:
+                primitive_2d = (
+                    cq.Workplane("XY")
+                    .rect(width, height)
+                    .rotate((0, 0, 0), (0, 0, 1), rotation)
+                    .translate(center)
+                )
+
+        # 2. 'face'方式直接由轮廓创建平面Face；
+        # 'solid'方式将 2D Face 拉伸成一个非常薄的 3D Solid，这样就可以进行布尔运算了
         # 使用一个很小的正数高度，确保 Z=0 是底面
         try:
             #print_edge_points(primitive_2d)
-            primitive = primitive_2d.extrude(-1)
+            if engine == 'face':
+                primitive = cq.Face.makeFromWires(primitive_2d)
+            else:
+                primitive = primitive_2d.extrude(-1)
         except Exception as e:
-            print(f"拉伸图元失败：{e}，跳过此图元")
+            logger.debug("拉伸图元失败：%s，跳过此图元", e)
+            get_metrics().count('sketch.primitive_failed')
             continue
 
         if composite_shape is None:
             composite_shape = primitive
+            last_nonempty_face = primitive
         else:
             try:
-                if boolean_op == "Union":
+                if engine == 'face':
+                    # solid方式中，结果为空后Workplane的布尔运算会沿父对象找到最近的非空实体继续运算，
+                    # 这里保持一致
+                    base_face = last_nonempty_face if composite_is_empty else composite_shape
+                    composite_shape = _face_boolean(base_face, primitive, boolean_op)
+                    composite_is_empty = not _has_faces(composite_shape)
+                    if not composite_is_empty:
+                        last_nonempty_face = composite_shape
+                elif boolean_op == "Union":
                     # 3D Solid 与 3D Solid 进行 union
                     composite_shape = composite_shape.union(primitive)
                 elif boolean_op == "Cut":  # "Cut"
@@ -91,7 +231,8 @@ def generate_2d_sketch(retry_count=0, max_retries=5):
                 else:
                     composite_shape = composite_shape.intersect(primitive)
             except Exception as e:
-                print(f"布尔运算 {boolean_op} 失败：{e}，跳过此操作")
+                logger.debug("布尔运算 %s 失败：%s，跳过此操作", boolean_op, e)
+                get_metrics().count('sketch.boolean_failed')
                 # 布尔运算失败时保持原有形状
                 continue
 
@@ -99,18 +240,23 @@ def generate_2d_sketch(retry_count=0, max_retries=5):
     grouped_boundary_wires = []  # 最终结果：列表的列表
     if composite_shape is not None:
         try:
-            # 使用 .faces() 选择器来获取 Z 方向最小（最靠近 Z=0 或 Z 最小）的所有面
-            try :
-                bottom_faces_cq = composite_shape.faces('<Z')
-            except Exception as e:
-                face_list =composite_shape.faces().vals()
-                bottom_faces_cq = composite_shape.faces('>Z')
-            
+            if engine == 'face':
+                # 二维布尔运算的结果中所有面都在同一平面上
+                face_list = composite_shape.Faces()
+            else:
+                # 使用 .faces() 选择器来获取 Z 方向最小（最靠近 Z=0 或 Z 最小）的所有面
+                try :
+                    bottom_faces_cq = composite_shape.faces('<Z')
+                except Exception as e:
+                    face_list =composite_shape.faces().vals()
+                    bottom_faces_cq = composite_shape.faces('>Z')
+
+                face_list = bottom_faces_cq.vals()
+
             # 检查是否找到了任何面
-            face_list = bottom_faces_cq.vals()
             if not face_list:
-                print(f"警告：未找到底面，重试生成 (尝试 {retry_count + 1}/{max_retries})")
-                return generate_2d_sketch(retry_count + 1, max_retries)
+                logger.debug("未找到底面，重试生成 (尝试 %d/%d)", retry_count + 1, max_retries)
+                return generate_2d_sketch(retry_count + 1, max_retries, rng, engine)
 
             # 遍历所有选中的底面
             for face in face_list:  # .vals() 获取 CQ 对象中的所有 Face 对象列表
@@ -131,7 +277,8 @@ def generate_2d_sketch(retry_count=0, max_retries=5):
                             # 检查wire是否退化（只有一条边且起点终点相同，或者边数为0）
                             edges = cq_wire.Edges()
                             if len(edges) == 0:
-                                print(f"跳过退化的Wire：没有边")
+                                logger.debug("跳过退化的Wire：没有边")
+                                get_metrics().count('sketch.degenerate_wire')
                                 continue
                             
                             # 检查是否是单边往返（起点和终点相同的单条边）
@@ -143,27 +290,28 @@ def generate_2d_sketch(retry_count=0, max_retries=5):
                                           (end_pt.y - start_pt.y)**2 + 
                                           (end_pt.z - start_pt.z)**2)**0.5
                                 if distance < 1e-6:
-                                    print(f"跳过退化的Wire：单边往返（起点和终点相同）")
+                                    logger.debug("跳过退化的Wire：单边往返（起点和终点相同）")
+                                    get_metrics().count('sketch.degenerate_wire')
                                     continue
                             
                             face_wires.append(cq_wire)  # 将 Wire 添加到当前面的列表中
                         except Exception as e:
-                            print(f"包装Wire对象时出错: {e}，跳过该Wire")
+                            logger.debug("包装Wire对象时出错: %s，跳过该Wire", e)
                             continue
 
                     # 将当前面的所有 Wire 组成的列表添加到最终结果列表中
                     if face_wires:  # 只添加非空的Wire列表
                         grouped_boundary_wires.append(face_wires)
                 except Exception as e:
-                    print(f"处理单个面时出错：{e}，跳过该面")
+                    logger.debug("处理单个面时出错：%s，跳过该面", e)
                     continue
         except Exception as e:
-            return generate_2d_sketch(retry_count + 1, max_retries)
+            return generate_2d_sketch(retry_count + 1, max_retries, rng, engine)
 
     # 4. 验证生成的草图
     if not grouped_boundary_wires:
         # 递归重试，带重试计数
-        return generate_2d_sketch(retry_count + 1, max_retries)
+        return generate_2d_sketch(retry_count + 1, max_retries, rng, engine)
     
     # 5. 返回分组的 Wire 列表：[[wire1_face1, wire2_face1, ...], [wire1_face2, wire2_face2, ...], ...]
     return grouped_boundary_wires
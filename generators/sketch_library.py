@@ -0,0 +1,378 @@
+"""
+预生成的草图库：离线批量调用generate_2d_sketch，将有效的草图区域保存为紧凑的numpy数组，
+生成样本时直接从库中抽取，草图生成不再出现在每个样本的生成过程中
+
+库目录结构（均可通过mmap只读加载）：
+- edges.npy：(边数, 6) float64，每条边的起点、中点、终点坐标 (sx, sy, mx, my, ex, ey)
+- edge_types.npy：(边数,) int8，EDGE_LINE 或 EDGE_CIRCLE
+- wire_offsets.npy：(Wire数+1,) int64，第i个Wire的边为 edges[wire_offsets[i]:wire_offsets[i+1]]
+- region_offsets.npy：(区域数+1,) int64，第i个区域的Wire为 wire_offsets中的[region_offsets[i], region_offsets[i+1])
+- region_edge_counts.npy：(区域数,) int32，每个区域的总边数
+- region_areas.npy：(区域数,) float64，每个区域的面积（用于分层抽样）
+- meta.json：版本、区域数、生成种子、草图布尔运算方式
+
+坐标只保存XY（草图位于底面，生成代码时也只使用XY），重建的Wire位于Z=0平面。
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import cadquery as cq
+import numpy as np
+from OCP.BRep import BRep_Builder
+from OCP.BRepAdaptor import BRepAdaptor_Curve
+from OCP.GeomAbs import GeomAbs_Line, GeomAbs_Circle
+from OCP.TopoDS import TopoDS_Wire
+
+from .metrics import configure_logging
+from .sketch_generator import SKETCH_ENGINES, generate_2d_sketch
+from .sketch_record import SketchRecord, EDGE_LINE, EDGE_CIRCLE
+
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_VERSION = 1
+STRATIFY_MODES = ('edges', 'area')
+
+# 通过环境变量指定默认草图库，使spawn方式启动的工作进程也能使用同一个库
+SKETCH_LIBRARY_ENV = "CQ_SKETCH_LIBRARY"
+SKETCH_LIBRARY_STRATIFY_ENV = "CQ_SKETCH_LIBRARY_STRATIFY"
+
+
+def extract_region_arrays(wires):
+    """
+    将一个区域的Wire列表转换为数组表示
+
+    Returns:
+        tuple or None: (edges: list, edge_types: list, wire_edge_counts: list)，
+        区域中含有直线和圆弧以外的边时返回None
+    """
+    edges = []
+    edge_types = []
+    wire_edge_counts = []
+    for wire in wires:
+        wire_edges = wire.Edges()
+        for edge in wire_edges:
+            curve_type = BRepAdaptor_Curve(edge.wrapped).GetType()
+            if curve_type == GeomAbs_Line:
+                edge_types.append(EDGE_LINE)
+            elif curve_type == GeomAbs_Circle:
+                edge_types.append(EDGE_CIRCLE)
+            else:
+                return None
+            start_pt = edge.startPoint()
+            mid_pt = edge.positionAt(0.5)
+            end_pt = edge.endPoint()
+            edges.append((start_pt.x, start_pt.y, mid_pt.x, mid_pt.y, end_pt.x, end_pt.y))
+        wire_edge_counts.append(len(wire_edges))
+    return edges, edge_types, wire_edge_counts
+
+
+def _region_area(wires):
+    """区域面积：包围盒最大的Wire为外边界，其余为内孔；无法成面时使用外边界包围盒面积"""
+    outer = max(wires, key=lambda w: w.BoundingBox().DiagonalLength)
+    inners = [w for w in wires if w is not outer]
+    try:
+        return cq.Face.makeFromWires(outer, inners).Area()
+    except Exception:
+        bbox = outer.BoundingBox()
+        return bbox.xlen * bbox.ylen
+
+
+def _extract_sketch_regions(seed, sketch_index, engine='face'):
+    """生成第sketch_index个草图并提取其中所有区域的数组表示"""
+    rng = random.Random(f"sketch-library:{seed}:{sketch_index}")
+    regions = []
+    for wires in generate_2d_sketch(rng=rng, engine=engine):
+        arrays = extract_region_arrays(wires)
+        if arrays is None:
+            continue
+        regions.append(arrays + (_region_area(wires),))
+    return regions
+
+
+def _extract_sketch_regions_batch(seed, sketch_indices, engine='face'):
+    return [_extract_sketch_regions(seed, sketch_index, engine) for sketch_index in sketch_indices]
+
+
+def _init_library_worker():
+    # generate_2d_sketch逐图元的输出在离线构建时没有意义
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+
+
+def build_sketch_library(path, count, seed=0, workers=1, chunk_size=16, engine='face'):
+    """
+    离线构建草图库
+
+    草图按编号依次生成（第k个草图的随机种子只由(seed, k)决定），
+    依次收集其中的区域直到满足count个，因此结果与进程数无关。
+
+    Args:
+        path: 草图库目录（已存在时被替换）
+        count: 区域数
+        seed: 生成种子
+        workers: 并行生成的进程数
+        chunk_size: 每个任务生成的草图数
+        engine: generate_2d_sketch的布尔运算方式，'face'或'solid'
+
+    Returns:
+        SketchLibrary: 构建好的草图库
+    """
+    regions = []
+    next_sketch = 0
+    if workers > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_library_worker) as executor:
+            while len(regions) < count:
+                batches = [range(next_sketch + i * chunk_size, next_sketch + (i + 1) * chunk_size)
+                           for i in range(workers)]
+                next_sketch += workers * chunk_size
+                # map按提交顺序返回结果，保证区域顺序与串行构建一致
+                for batch_regions in executor.map(_extract_sketch_regions_batch,
+                                                  [seed] * len(batches), batches, [engine] * len(batches)):
+                    for sketch_regions in batch_regions:
+                        regions.extend(sketch_regions)
+                logger.info("草图库构建中：%d/%d", min(len(regions), count), count)
+    else:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull:
+            while len(regions) < count:
+                with contextlib.redirect_stdout(devnull):
+                    regions.extend(_extract_sketch_regions(seed, next_sketch, engine))
+                next_sketch += 1
+    regions = regions[:count]
+
+    _save_library_arrays(path, regions, {"seed": seed, "engine": engine})
+    return SketchLibrary(path)
+
+
+def _save_library_arrays(path, regions, build_params):
+    """将区域列表写为库目录（先写入临时目录再替换）"""
+    edges = []
+    edge_types = []
+    wire_offsets = [0]
+    region_offsets = [0]
+    region_edge_counts = []
+    region_areas = []
+    for region_edges, region_edge_types, wire_edge_counts, area in regions:
+        edges.extend(region_edges)
+        edge_types.extend(region_edge_types)
+        for edge_count in wire_edge_counts:
+            wire_offsets.append(wire_offsets[-1] + edge_count)
+        region_offsets.append(region_offsets[-1] + len(wire_edge_counts))
+        region_edge_counts.append(len(region_edges))
+        region_areas.append(area)
+
+    temp_path = f"{path}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    np.save(os.path.join(temp_path, "edges.npy"), np.asarray(edges, dtype=np.float64).reshape(-1, 6))
+    np.save(os.path.join(temp_path, "edge_types.npy"), np.asarray(edge_types, dtype=np.int8))
+    np.save(os.path.join(temp_path, "wire_offsets.npy"), np.asarray(wire_offsets, dtype=np.int64))
+    np.save(os.path.join(temp_path, "region_offsets.npy"), np.asarray(region_offsets, dtype=np.int64))
+    np.save(os.path.join(temp_path, "region_edge_counts.npy"), np.asarray(region_edge_counts, dtype=np.int32))
+    np.save(os.path.join(temp_path, "region_areas.npy"), np.asarray(region_areas, dtype=np.float64))
+    with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": LIBRARY_VERSION, "region_count": len(regions), **build_params}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+
+
+class SketchLibrary:
+    """
+    只读草图库（数组通过mmap加载，多个进程共享页缓存）
+
+    用法：
+        library = SketchLibrary("sketch_library")
+        region_index = library.sample(rng, stratify='edges')
+        sketch = library.region_record(region_index)
+    """
+
+    def __init__(self, path, stratify=None, area_bins=8):
+        """
+        Args:
+            path: 草图库目录
+            stratify: 默认的分层抽样方式，None（均匀抽样）、'edges'（按边数）或'area'（按面积分位数）
+            area_bins: 按面积分层时的分位数区间数
+        """
+        if stratify is not None and stratify not in STRATIFY_MODES:
+            raise ValueError(f"未知的分层方式: {stratify}，可选值为 {STRATIFY_MODES}")
+        with open(os.path.join(path, "meta.json"), "rb") as f:
+            meta_bytes = f.read()
+        self.meta = json.loads(meta_bytes)
+        # meta.json的哈希（含生成种子和参数），用于确认重建数据集时使用的是同一个库
+        self.meta_hash = hashlib.sha256(meta_bytes).hexdigest()
+        if self.meta["version"] != LIBRARY_VERSION:
+            raise ValueError(f"不支持的草图库版本: {self.meta['version']}")
+        if self.meta["region_count"] == 0:
+            raise ValueError(f"草图库 {path} 为空")
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+
+        self.path = path
+        self.stratify = stratify
+        self.area_bins = area_bins
+        self.edges = load("edges")
+        self.edge_types = load("edge_types")
+        self.wire_offsets = load("wire_offsets")
+        self.region_offsets = load("region_offsets")
+        self.region_edge_counts = load("region_edge_counts")
+        self.region_areas = load("region_areas")
+        self._strata = {}
+
+    def __len__(self):
+        return self.meta["region_count"]
+
+    def _get_strata(self, stratify):
+        """各层包含的区域编号（首次使用时计算）"""
+        if stratify not in self._strata:
+            if stratify == 'edges':
+                keys = np.asarray(self.region_edge_counts)
+            elif stratify == 'area':
+                areas = np.asarray(self.region_areas)
+                edges = np.quantile(areas, np.linspace(0, 1, self.area_bins + 1)[1:-1])
+                keys = np.digitize(areas, edges)
+            else:
+                raise ValueError(f"未知的分层方式: {stratify}，可选值为 {STRATIFY_MODES}")
+            self._strata[stratify] = [np.flatnonzero(keys == key) for key in np.unique(keys)]
+        return self._strata[stratify]
+
+    def sample(self, rng=None, stratify=None):
+        """
+        随机抽取一个区域
+
+        Args:
+            rng: 随机数生成器（random.Random），为None时使用全局random模块
+            stratify: 分层抽样方式（为None时使用构造时指定的方式）：
+                先均匀选择一层，再在层内均匀选择，使稀有的边数/面积区间也能被充分抽到
+
+        Returns:
+            int: 区域编号
+        """
+        if rng is None:
+            rng = random
+        stratify = stratify or self.stratify
+        if stratify is None:
+            return rng.randrange(len(self))
+        strata = self._get_strata(stratify)
+        stratum = strata[rng.randrange(len(strata))]
+        return int(stratum[rng.randrange(len(stratum))])
+
+    def region_arrays(self, index):
+        """
+        区域的数组表示
+
+        Returns:
+            tuple: (edges: ndarray (n, 6), edge_types: ndarray (n,), wire_offsets: ndarray)
+            wire_offsets相对于该区域的第一条边
+        """
+        wire_start, wire_end = self.region_offsets[index], self.region_offsets[index + 1]
+        wire_offsets = np.asarray(self.wire_offsets[wire_start:wire_end + 1])
+        edge_start, edge_end = wire_offsets[0], wire_offsets[-1]
+        return (
+            np.asarray(self.edges[edge_start:edge_end]),
+            np.asarray(self.edge_types[edge_start:edge_end]),
+            wire_offsets - edge_start,
+        )
+
+    def region_record(self, index):
+        """区域的SketchRecord（直接由数组创建，不构造OCC对象）"""
+        return SketchRecord.from_arrays(*self.region_arrays(index))
+
+    def region_wires(self, index):
+        """将区域重建为cq.Wire列表（边的顺序和方向与构建时一致）"""
+        edges, edge_types, wire_offsets = self.region_arrays(index)
+        wires = []
+        for i in range(len(wire_offsets) - 1):
+            # 按保存的顺序逐条加入边（assembleEdges会重新排序，改变Edges()的顺序及面标识中的边编号）
+            builder = BRep_Builder()
+            wire = TopoDS_Wire()
+            builder.MakeWire(wire)
+            for j in range(wire_offsets[i], wire_offsets[i + 1]):
+                builder.Add(wire, _make_edge(edges[j], edge_types[j]).wrapped)
+            wire.Closed(True)
+            wires.append(cq.Wire(wire))
+        return wires
+
+
+def _make_edge(points, edge_type):
+    sx, sy, mx, my, ex, ey = (float(v) for v in points)
+    start = cq.Vector(sx, sy, 0)
+    end = cq.Vector(ex, ey, 0)
+    if edge_type == EDGE_LINE:
+        return cq.Edge.makeLine(start, end)
+    if abs(sx - ex) < 1e-9 and abs(sy - ey) < 1e-9:
+        # 完整的圆：起点与中点为直径的两端
+        center = cq.Vector((sx + mx) / 2, (sy + my) / 2, 0)
+        radius = ((mx - sx) ** 2 + (my - sy) ** 2) ** 0.5 / 2
+        return cq.Edge.makeCircle(radius, center)
+    return cq.Edge.makeThreePointArc(start, cq.Vector(mx, my, 0), end)
+
+
+# 默认草图库（未配置时为None，即在线调用generate_2d_sketch）
+_default_library = None
+_default_library_loaded = False
+_default_library_lock = threading.Lock()
+
+
+def get_sketch_library():
+    """获取默认草图库：首次调用时按环境变量 CQ_SKETCH_LIBRARY 加载，未设置时返回None"""
+    global _default_library, _default_library_loaded
+    with _default_library_lock:
+        if not _default_library_loaded:
+            path = os.environ.get(SKETCH_LIBRARY_ENV)
+            if path:
+                _default_library = SketchLibrary(path, os.environ.get(SKETCH_LIBRARY_STRATIFY_ENV) or None)
+            _default_library_loaded = True
+        return _default_library
+
+
+def configure_sketch_library(path, stratify=None):
+    """
+    设置默认草图库（同时写入环境变量，之后启动的工作进程使用同一个库）
+
+    Args:
+        path: 草图库目录，为None时恢复为在线生成草图
+        stratify: 分层抽样方式，None、'edges'或'area'
+
+    Returns:
+        SketchLibrary or None: 新的默认草图库
+    """
+    global _default_library, _default_library_loaded
+    with _default_library_lock:
+        if path is None:
+            os.environ.pop(SKETCH_LIBRARY_ENV, None)
+            os.environ.pop(SKETCH_LIBRARY_STRATIFY_ENV, None)
+            _default_library = None
+        else:
+            _default_library = SketchLibrary(path, stratify)
+            os.environ[SKETCH_LIBRARY_ENV] = os.path.abspath(path)
+            os.environ[SKETCH_LIBRARY_STRATIFY_ENV] = stratify or ""
+        _default_library_loaded = True
+        return _default_library
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='离线构建草图库')
+    parser.add_argument('--output', required=True, help='草图库目录')
+    parser.add_argument('--count', type=int, default=100000, help='区域数（默认100000）')
+    parser.add_argument('--seed', type=int, default=0, help='生成种子（默认0）')
+    parser.add_argument('--workers', type=int, default=1, help='并行生成的进程数（默认1）')
+    parser.add_argument('--engine', choices=SKETCH_ENGINES, default='face',
+                        help='草图布尔运算方式：face为二维Face布尔运算（默认），solid为拉伸成薄片后做三维布尔运算')
+    args = parser.parse_args()
+
+    configure_logging()
+    library = build_sketch_library(args.output, args.count, args.seed, args.workers, engine=args.engine)
+    print(f"草图库已保存到 {args.output}，共 {len(library)} 个区域，{len(library.edges)} 条边")
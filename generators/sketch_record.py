@@ -0,0 +1,201 @@
+"""
+草图的紧凑表示：每个草图区域只在创建时读取一次OCC边信息，
+之后生成草图代码（generate_sketch_code）和面标识（generate_face_identifiers）都只读取数组，
+复用草图时不再重复调用 wire.Edges() / BRepAdaptor_Curve
+"""
+import math
+from array import array
+
+from OCP.BRepAdaptor import BRepAdaptor_Curve
+from OCP.GeomAbs import GeomAbs_Line, GeomAbs_Circle
+
+
+EDGE_LINE = 0
+EDGE_CIRCLE = 1
+EDGE_OTHER = 2
+
+
+class SketchRecord:
+    """
+    一个草图区域（若干闭合Wire）的数组表示
+
+    边按各Wire中 wire.Edges() 的原始顺序保存（面标识中的边编号依赖该顺序）：
+    - edge_types：array('b')，每条边的曲线类型（EDGE_LINE / EDGE_CIRCLE / EDGE_OTHER）
+    - points：array('d')，每条边6个值 (起点x, 起点y, 中点x, 中点y, 终点x, 终点y)
+    - circles：array('d')，每条边3个值 (圆心x, 圆心y, 半径)，只对完整的圆有效，其余边半径为-1
+    - wire_edge_counts：array('i')，每个Wire的边数
+    """
+
+    __slots__ = ('edge_types', 'points', 'circles', 'wire_edge_counts', '_line_edge_numbers', '_bounds')
+
+    def __init__(self, edge_types, points, circles, wire_edge_counts):
+        self.edge_types = edge_types
+        self.points = points
+        self.circles = circles
+        self.wire_edge_counts = wire_edge_counts
+        self._line_edge_numbers = None
+        self._bounds = None
+
+    @classmethod
+    def from_wires(cls, wires):
+        """从cq.Wire列表创建（每条边只创建一次BRepAdaptor_Curve）"""
+        edge_types = array('b')
+        points = array('d')
+        circles = array('d')
+        wire_edge_counts = array('i')
+        for wire in wires:
+            edges = wire.Edges()
+            for edge in edges:
+                adaptor = BRepAdaptor_Curve(edge.wrapped)
+                curve_type = adaptor.GetType()
+                start_pt = edge.startPoint()
+                end_pt = edge.endPoint()
+                if curve_type == GeomAbs_Line:
+                    edge_types.append(EDGE_LINE)
+                    mid = (start_pt + end_pt) * 0.5
+                elif curve_type == GeomAbs_Circle:
+                    edge_types.append(EDGE_CIRCLE)
+                    mid = edge.positionAt(0.5)
+                else:
+                    edge_types.append(EDGE_OTHER)
+                    mid = edge.positionAt(0.5)
+                points.extend((start_pt.x, start_pt.y, mid.x, mid.y, end_pt.x, end_pt.y))
+
+                # 单边Wire是否为完整的圆：参数范围是否为 2π
+                if (len(edges) == 1 and curve_type == GeomAbs_Circle
+                        and abs((adaptor.LastParameter() - adaptor.FirstParameter()) - 2 * math.pi) < 1e-5):
+                    geom_circle = adaptor.Circle()
+                    center = geom_circle.Location()
+                    circles.extend((center.X(), center.Y(), geom_circle.Radius()))
+                else:
+                    circles.extend((0.0, 0.0, -1.0))
+            wire_edge_counts.append(len(edges))
+        return cls(edge_types, points, circles, wire_edge_counts)
+
+    @classmethod
+    def from_arrays(cls, edges, edge_types, wire_offsets):
+        """
+        从草图库的数组创建
+
+        Args:
+            edges: (n, 6) 数组，每条边的起点、中点、终点坐标
+            edge_types: (n,) 数组，每条边的曲线类型
+            wire_offsets: 各Wire在edges中的起始位置（最后一个元素为边数）
+        """
+        points = array('d', (float(v) for v in edges.ravel()))
+        types = array('b', (int(t) for t in edge_types))
+        wire_edge_counts = array('i', (int(wire_offsets[i + 1] - wire_offsets[i])
+                                       for i in range(len(wire_offsets) - 1)))
+        circles = array('d')
+        edge_idx = 0
+        for edge_count in wire_edge_counts:
+            for _ in range(edge_count):
+                sx, sy, mx, my, ex, ey = points[edge_idx * 6:edge_idx * 6 + 6]
+                if (edge_count == 1 and types[edge_idx] == EDGE_CIRCLE
+                        and abs(sx - ex) < 1e-9 and abs(sy - ey) < 1e-9):
+                    # 完整的圆：起点与中点为直径的两端
+                    circles.extend(((sx + mx) / 2, (sy + my) / 2, math.hypot(mx - sx, my - sy) / 2))
+                else:
+                    circles.extend((0.0, 0.0, -1.0))
+                edge_idx += 1
+        return cls(types, points, circles, wire_edge_counts)
+
+    @classmethod
+    def from_polygons(cls, polygons):
+        """
+        从多边形顶点列表创建（每个多边形为一个闭合Wire）
+
+        Args:
+            polygons: [[(x, y), ...], ...]
+        """
+        edge_types = array('b')
+        points = array('d')
+        circles = array('d')
+        wire_edge_counts = array('i')
+        for polygon in polygons:
+            for i, (sx, sy) in enumerate(polygon):
+                ex, ey = polygon[(i + 1) % len(polygon)]
+                edge_types.append(EDGE_LINE)
+                points.extend((sx, sy, (sx + ex) / 2, (sy + ey) / 2, ex, ey))
+                circles.extend((0.0, 0.0, -1.0))
+            wire_edge_counts.append(len(polygon))
+        return cls(edge_types, points, circles, wire_edge_counts)
+
+    def __len__(self):
+        """Wire数"""
+        return len(self.wire_edge_counts)
+
+    @property
+    def edge_count(self):
+        """总边数"""
+        return len(self.edge_types)
+
+    def iter_wire_ranges(self):
+        """依次返回每个Wire的边序号范围 (起始, 结束)"""
+        start = 0
+        for edge_count in self.wire_edge_counts:
+            yield start, start + edge_count
+            start += edge_count
+
+    def edge_points(self, edge_idx):
+        """边的 (起点, 中点, 终点)，每个点为 (x, y)"""
+        sx, sy, mx, my, ex, ey = self.points[edge_idx * 6:edge_idx * 6 + 6]
+        return (sx, sy), (mx, my), (ex, ey)
+
+    def full_circle(self, edge_idx):
+        """完整圆的 (圆心x, 圆心y, 半径)，不是完整的圆时返回None"""
+        cx, cy, radius = self.circles[edge_idx * 3:edge_idx * 3 + 3]
+        if radius < 0:
+            return None
+        return cx, cy, radius
+
+    def bounds(self):
+        """
+        草图的二维包围盒 (xmin, ymin, xmax, ymax)，保证包含整个区域（可能偏大）
+
+        直线边取端点；圆弧边取其所在整圆的包围盒（三点近似共线时取三点的包围盒）。
+        没有边，或含有其他曲线边（EDGE_OTHER，如样条、椭圆，只保存了三个采样点，无法保证包含整条边）时返回None，
+        依赖包围盒的检查（如step_prefilter）此时不排除任何步骤。
+        """
+        if self._bounds is None:
+            self._bounds = self._compute_bounds() or ()  # 空元组表示无法确定，避免重复计算
+        return self._bounds or None
+
+    def _compute_bounds(self):
+        if not self.edge_count or EDGE_OTHER in self.edge_types:
+            return None
+        xs = []
+        ys = []
+        for edge_idx, edge_type in enumerate(self.edge_types):
+            sx, sy, mx, my, ex, ey = self.points[edge_idx * 6:edge_idx * 6 + 6]
+            xs.extend((sx, mx, ex))
+            ys.extend((sy, my, ey))
+            if edge_type == EDGE_LINE:
+                continue
+            circle = self.full_circle(edge_idx) or _circle_through(sx, sy, mx, my, ex, ey)
+            if circle is not None:
+                cx, cy, radius = circle
+                xs.extend((cx - radius, cx + radius))
+                ys.extend((cy - radius, cy + radius))
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def line_edge_numbers(self):
+        """所有直线边的编号（从1开始，按所有Wire的边顺序累计），用于生成侧面标识"""
+        if self._line_edge_numbers is None:
+            self._line_edge_numbers = [
+                edge_idx + 1 for edge_idx, edge_type in enumerate(self.edge_types) if edge_type == EDGE_LINE
+            ]
+        return self._line_edge_numbers
+
+
+def _circle_through(x1, y1, x2, y2, x3, y3):
+    """过三点的圆 (圆心x, 圆心y, 半径)，三点近似共线时返回None"""
+    d = 2 * (x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2))
+    if abs(d) < 1e-10:
+        return None
+    s1 = x1 * x1 + y1 * y1
+    s2 = x2 * x2 + y2 * y2
+    s3 = x3 * x3 + y3 * y3
+    cx = (s1 * (y2 - y3) + s2 * (y3 - y1) + s3 * (y1 - y2)) / d
+    cy = (s1 * (x3 - x2) + s2 * (x1 - x3) + s3 * (x2 - x1)) / d
+    return cx, cy, math.hypot(x1 - cx, y1 - cy)
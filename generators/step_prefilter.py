@@ -0,0 +1,162 @@
+"""
+拉伸/布尔步骤的几何预筛选：在提交OCC验证前，用解析方法排除必定无效的步骤
+
+根据草图的二维包围盒、工作平面和拉伸高度直接算出拉伸体的三维包围盒（保证偏大），
+与当前结果的包围盒比较。以下情况下验证必定拒绝该步骤，无需执行代码：
+- 拉伸高度为0或草图在某个方向上没有宽度：拉伸体没有体积
+- cut 的拉伸体与当前结果包围盒不相交：结果不变
+- union 的拉伸体与当前结果包围盒不相交：结果为多个实体
+
+只处理基础平面（XY/YZ/XZ，可带origin），以面为工作平面时无法解析计算，不做预筛选。
+"""
+import re
+
+
+# 各基础平面的 (x方向, y方向, 拉伸方向)，与cq.Plane.named一致
+PLANE_AXES = {
+    'XY': ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    'YZ': ((0, 1, 0), (0, 0, 1), (1, 0, 0)),
+    'XZ': ((1, 0, 0), (0, 0, 1), (0, -1, 0)),
+}
+
+# 包围盒比较的余量：覆盖草图代码中坐标保留两位小数带来的误差及OCC的容差
+PREFILTER_MARGIN = 0.05
+
+REJECT_REASONS = {
+    'zero_height': '拉伸高度为0',
+    'degenerate_sketch': '草图没有面积',
+    'disjoint_cut': '切除体与实体不相交',
+    'disjoint_union': '合并体与实体不相交',
+}
+
+_PLANE_PATTERN = re.compile(
+    r"^'?(XY|YZ|XZ)'?(?:,\s*origin=\(\s*([-\d.eE+]+)\s*,\s*([-\d.eE+]+)\s*,\s*([-\d.eE+]+)\s*\))?$"
+)
+
+
+def parse_plane(plane):
+    """
+    解析平面字符串
+
+    Args:
+        plane: 'XY' 或 "'XZ', origin=(0.0, 1.50, 0.0)" 形式的平面字符串
+
+    Returns:
+        tuple: (平面名称, 原点(x, y, z))，无法解析（如面标识）时返回None
+    """
+    if not isinstance(plane, str):
+        return None
+    match = _PLANE_PATTERN.match(plane.strip())
+    if match is None:
+        return None
+    name = match.group(1)
+    if match.group(2) is None:
+        return name, (0.0, 0.0, 0.0)
+    return name, tuple(float(match.group(k)) for k in (2, 3, 4))
+
+
+def tool_bbox(sketch_bounds, plane, height):
+    """
+    计算拉伸体的三维包围盒
+
+    Args:
+        sketch_bounds: 草图的二维包围盒 (xmin, ymin, xmax, ymax)
+        plane: 平面字符串
+        height: 拉伸高度
+
+    Returns:
+        tuple: (xmin, ymin, zmin, xmax, ymax, zmax)，平面无法解析时返回None
+    """
+    parsed = parse_plane(plane)
+    if parsed is None:
+        return None
+    name, origin = parsed
+    x_dir, y_dir, normal = PLANE_AXES[name]
+    u_min, v_min, u_max, v_max = sketch_bounds
+    w_min, w_max = min(0.0, height), max(0.0, height)
+
+    lower = []
+    upper = []
+    for axis in range(3):
+        lo = hi = origin[axis]
+        for direction, low, high in ((x_dir, u_min, u_max), (y_dir, v_min, v_max), (normal, w_min, w_max)):
+            component = direction[axis]
+            if component > 0:
+                lo += low
+                hi += high
+            elif component < 0:
+                lo -= high
+                hi -= low
+        lower.append(lo)
+        upper.append(hi)
+    return (*lower, *upper)
+
+
+def bboxes_disjoint(bbox_a, bbox_b, margin=PREFILTER_MARGIN):
+    """两个包围盒在某个坐标方向上的间隔大于margin时返回True"""
+    for axis in range(3):
+        if bbox_a[axis] - margin > bbox_b[axis + 3] or bbox_b[axis] - margin > bbox_a[axis + 3]:
+            return True
+    return False
+
+
+class StepPrefilter:
+    """
+    步骤预筛选器，按原因统计被排除的步骤数
+
+    用法：
+        prefilter = StepPrefilter()
+        reason = prefilter.check(sketch, plane, height, boolean_op, result_bbox)
+        if reason is not None:
+            ...  # 跳过该步骤，不执行验证
+    """
+
+    def __init__(self, margin=PREFILTER_MARGIN):
+        self.margin = margin
+        self.rejections = {reason: 0 for reason in REJECT_REASONS}
+
+    def check(self, sketch, plane, height, boolean_op, result_bbox):
+        """
+        判断步骤是否必定无效
+
+        Args:
+            sketch: 草图（SketchRecord）
+            plane: 平面字符串
+            height: 拉伸高度
+            boolean_op: 布尔运算（'cut'、'union'），首个步骤为None
+            result_bbox: 当前结果的包围盒 (xmin, ymin, zmin, xmax, ymax, zmax)，未知时为None
+
+        Returns:
+            str: 排除原因（REJECT_REASONS的键），不能确定无效时返回None
+        """
+        reason = self._reject_reason(sketch, plane, height, boolean_op, result_bbox)
+        if reason is not None:
+            self.rejections[reason] += 1
+        return reason
+
+    def _reject_reason(self, sketch, plane, height, boolean_op, result_bbox):
+        if height == 0:
+            return 'zero_height'
+        sketch_bounds = sketch.bounds()
+        if sketch_bounds is None:
+            return None
+        u_min, v_min, u_max, v_max = sketch_bounds
+        if u_max - u_min < 1e-9 or v_max - v_min < 1e-9:
+            return 'degenerate_sketch'
+
+        if boolean_op is None or not result_bbox:
+            return None
+        bbox = tool_bbox(sketch_bounds, plane, height)
+        if bbox is None or not bboxes_disjoint(bbox, result_bbox, self.margin):
+            return None
+        return 'disjoint_cut' if boolean_op == 'cut' else 'disjoint_union'
+
+    @property
+    def total_rejections(self):
+        return sum(self.rejections.values())
+
+    def summary(self):
+        """各原因的排除数（只包含非零项），如 "切除体与实体不相交2次" """
+        return "，".join(
+            f"{REJECT_REASONS[reason]}{count}次" for reason, count in self.rejections.items() if count
+        )
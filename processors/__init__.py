@@ -3,9 +3,50 @@
 """
 
 from .dataset_generator import generate_training_dataset, save_cq_code_to_file, save_cq_code_sequence
+from .index_allocator import FileIndexAllocator, get_index_allocator
+from .output_backends import DirectoryBackend, ShardBackend, create_output_backend, iter_shard_files
+from .step_sequence import build_program_file, rebuild_step_code, iter_step_codes, read_step_code
+from .sample_stream import generate_sample, generate_seeded_sample, sample_seed, iter_samples
+from .virtual_dataset import VirtualCADDataset
+from .metadata_index import MetadataIndex
+from .sample_writer import SampleWriter, AsyncSampleWriter, SampleWriteError
+from .compression import ProgramCodec, train_dictionary, read_program_text
+from .dedup import SampleDeduplicator, BloomFilter, canonical_program
+from .token_export import export_tokens, TokenDataset, ByteTokenizer
+from .point_cloud_store import PointCloudStore, build_point_clouds
 
 __all__ = [
     'generate_training_dataset',
     'save_cq_code_to_file',
-    'save_cq_code_sequence'
+    'save_cq_code_sequence',
+    'FileIndexAllocator',
+    'get_index_allocator',
+    'DirectoryBackend',
+    'ShardBackend',
+    'create_output_backend',
+    'iter_shard_files',
+    'build_program_file',
+    'rebuild_step_code',
+    'iter_step_codes',
+    'read_step_code',
+    'generate_sample',
+    'generate_seeded_sample',
+    'sample_seed',
+    'iter_samples',
+    'VirtualCADDataset',
+    'MetadataIndex',
+    'SampleWriter',
+    'AsyncSampleWriter',
+    'SampleWriteError',
+    'ProgramCodec',
+    'train_dictionary',
+    'read_program_text',
+    'SampleDeduplicator',
+    'BloomFilter',
+    'canonical_program',
+    'export_tokens',
+    'TokenDataset',
+    'ByteTokenizer',
+    'PointCloudStore',
+    'build_point_clouds'
 ]
\ No newline at end of file
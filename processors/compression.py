@@ -0,0 +1,177 @@
+"""
+使用训练字典的zstd压缩：生成的程序高度重复（相同的文件头、cq.Workplane/moveTo/lineTo/close/extrude写法
+和数字格式），用一批生成的程序训练zstd字典后，每个文件单独压缩也能得到很高的压缩率，
+同时仍可按编号随机读取单个文件。
+
+字典保存在数据集根目录的 zstd_dictionary.bin，同一数据集的所有压缩文件使用同一个字典
+（每个压缩帧中记录字典ID，解压时校验）。压缩文件名为原文件名加 .zst 后缀。
+
+需要安装zstandard（pip install zstandard），未安装时只有使用压缩功能时才报错。
+
+用法：
+    codec = ProgramCodec.load(base_dir)
+    data = codec.encode(code)
+    code = codec.decode(data)
+    code = read_program_text(file_path, codec)  # 按后缀判断是否需要解压
+
+训练字典并查看压缩率：
+    python -m processors.compression --base-dir ../data/SyntheticData --samples 500
+"""
+import os
+import random
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，只在使用压缩时需要
+    zstandard = None
+
+from processors.index_allocator import atomic_write_bytes
+
+
+COMPRESSIONS = ('zstd',)
+DICTIONARY_FILE_NAME = "zstd_dictionary.bin"
+COMPRESSED_SUFFIX = ".zst"
+# 训练数据只有几百个样本时，较小的字典压缩率反而更高（64KB以上的字典对验证集过拟合）
+DEFAULT_DICTIONARY_SIZE = 16 * 1024
+DEFAULT_LEVEL = 19  # 单个文件不到1KB，高压缩级别的耗时依然远小于生成一个样本
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("使用zstd压缩需要安装zstandard：pip install zstandard")
+
+
+def dictionary_path(base_dir):
+    return os.path.join(base_dir, DICTIONARY_FILE_NAME)
+
+
+def train_dictionary(texts, dict_size=DEFAULT_DICTIONARY_SIZE, level=DEFAULT_LEVEL):
+    """
+    用一批文件内容训练zstd字典
+
+    Args:
+        texts: 文件内容（str）列表，通常为几百个样本写出的全部文件
+        dict_size: 字典大小上限（字节）
+        level: 之后压缩使用的级别（训练时据此调整参数）
+
+    Returns:
+        bytes: 字典数据
+    """
+    _require_zstandard()
+    if not texts:
+        raise ValueError("训练字典需要至少一个样本")
+    samples = [text.encode("utf-8") for text in texts]
+    return zstandard.train_dictionary(dict_size, samples, level=level).as_bytes()
+
+
+class ProgramCodec:
+    """使用训练字典压缩/解压单个程序文件（非线程安全，每个线程使用自己的实例）"""
+
+    def __init__(self, dictionary, level=DEFAULT_LEVEL):
+        """
+        Args:
+            dictionary: 字典数据（bytes）
+            level: 压缩级别
+        """
+        _require_zstandard()
+        self.dictionary = dictionary
+        self.level = level
+        dict_data = zstandard.ZstdCompressionDict(dictionary)
+        self.dict_id = dict_data.dict_id()
+        # 压缩后每个文件只有几十字节，不写校验和（4字节）；帧中保留字典ID用于校验
+        self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dict_data, write_checksum=False)
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+    @classmethod
+    def load(cls, base_dir, level=DEFAULT_LEVEL):
+        """读取数据集目录中的字典，字典不存在时返回None"""
+        path = dictionary_path(base_dir)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return cls(f.read(), level)
+
+    def save(self, base_dir):
+        """将字典保存到数据集目录"""
+        atomic_write_bytes(dictionary_path(base_dir), self.dictionary)
+
+    def encode(self, text):
+        return self._compressor.compress(text.encode("utf-8"))
+
+    def decode(self, data):
+        frame_dict_id = zstandard.get_frame_parameters(data).dict_id
+        if frame_dict_id != self.dict_id:
+            raise ValueError(f"压缩数据使用的字典（ID {frame_dict_id}）与当前字典（ID {self.dict_id}）不一致")
+        return self._decompressor.decompress(data).decode("utf-8")
+
+
+def read_program_text(file_path, codec=None):
+    """
+    读取数据集中的文件，文件名以.zst结尾时用codec解压
+
+    Args:
+        file_path: 文件路径
+        codec: ProgramCodec，读取压缩文件时必须指定
+    """
+    if not file_path.endswith(COMPRESSED_SUFFIX):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+    if codec is None:
+        raise ValueError(f"读取压缩文件 {file_path} 需要指定codec（ProgramCodec.load(数据集目录)）")
+    with open(file_path, "rb") as f:
+        return codec.decode(f.read())
+
+
+def measure_compression(codec, texts):
+    """
+    统计压缩效果
+
+    Returns:
+        dict: {'files', 'raw_bytes', 'compressed_bytes', 'ratio'}
+    """
+    raw_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    compressed_bytes = sum(len(codec.encode(text)) for text in texts)
+    return {
+        'files': len(texts),
+        'raw_bytes': raw_bytes,
+        'compressed_bytes': compressed_bytes,
+        'ratio': raw_bytes / compressed_bytes if compressed_bytes else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from generators.metrics import configure_logging
+    from processors.output_backends import LAYOUTS, build_sample_files
+    from processors.sample_stream import iter_samples
+
+    parser = argparse.ArgumentParser(description='训练程序文件的zstd字典并统计压缩率')
+    parser.add_argument('--base-dir', default='../data/SyntheticData', help='数据集目录（字典保存在该目录）')
+    parser.add_argument('--samples', type=int, default=300, help='训练字典使用的样本数（默认300）')
+    parser.add_argument('--holdout', type=int, default=100, help='统计压缩率使用的另一批样本数（默认100）')
+    parser.add_argument('--layout', choices=LAYOUTS, default='sequence', help='样本存储方式（默认sequence）')
+    parser.add_argument('--workers', type=int, default=0, help='生成样本的并行进程数（默认0，即串行）')
+    parser.add_argument('--seed', type=int, default=0, help='生成样本的种子（默认0）')
+    parser.add_argument('--level', type=int, default=DEFAULT_LEVEL, help=f'压缩级别（默认{DEFAULT_LEVEL}）')
+    parser.add_argument('--force', action='store_true', help='字典已存在时重新训练并覆盖（已有压缩文件将无法解压）')
+    args = parser.parse_args()
+    configure_logging('ERROR')
+
+    if ProgramCodec.load(args.base_dir) is not None and not args.force:
+        parser.error(f"{dictionary_path(args.base_dir)} 已存在，如需覆盖请指定--force")
+
+    records = list(iter_samples(args.samples + args.holdout, workers=args.workers, seed=args.seed))
+    random.Random(args.seed).shuffle(records)
+    texts = [build_sample_files(record['code'], args.layout)[0] for record in records]
+    training_texts = [text for sample_texts in texts[args.holdout:] for text in sample_texts]
+    holdout_texts = [text for sample_texts in texts[:args.holdout] for text in sample_texts]
+
+    codec = ProgramCodec(train_dictionary(training_texts, level=args.level), args.level)
+    os.makedirs(args.base_dir, exist_ok=True)
+    codec.save(args.base_dir)
+    print(f"字典已保存到 {dictionary_path(args.base_dir)}（{len(codec.dictionary)} 字节，ID {codec.dict_id}）")
+
+    stats = measure_compression(codec, holdout_texts)
+    print(f"验证集 {stats['files']} 个文件：{stats['raw_bytes']} → {stats['compressed_bytes']} 字节，"
+          f"压缩率 {stats['ratio']:.1f}x")
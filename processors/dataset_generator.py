@@ -1,9 +1,24 @@
 import os
 import shutil
 from tqdm import tqdm  # 用于显示进度条（需安装：pip install tqdm）
-from generators.code_generator import CADCodeGenerator
+from processors.index_allocator import atomic_write_text, get_index_allocator
+from processors.step_sequence import build_step_codes
+from processors.compression import COMPRESSIONS, ProgramCodec, dictionary_path, train_dictionary
+from processors.dedup import DEDUP_FILE_NAME, SampleDeduplicator
+from processors.output_backends import (LAYOUTS, OUTPUT_FORMATS, build_sample_files, create_output_backend,
+                                        write_step_files)
+from processors.metadata_index import METADATA_FILE_NAME, MetadataIndex
+from processors.point_cloud_store import POINT_CLOUD_DIR_NAME, POINT_CLOUD_DTYPES, PointCloudStore
+from processors.sample_writer import AsyncSampleWriter, SampleWriteError, SampleWriter
+from processors.sample_stream import generate_sample, iter_samples
+from generators.code_generator import CANDIDATE_SELECTIONS
+from generators.code_validator import GEOMETRY_FORMATS
+from generators.sketch_library import STRATIFY_MODES, configure_sketch_library
+from generators.adaptive_sampler import DEFAULT_MIN_SHARE, configure_adaptive_sampler
+from generators.metrics import MetricsWriter, configure_logging, get_metrics
 
-def save_cq_code_to_file(code, base_dir="data/SyntheticData", batch_size=10000):
+
+def save_cq_code_to_file(code, base_dir="data/SyntheticData", batch_size=10000, allocator=None):
     """
     将生成的CadQuery代码保存为.py文件，按批次存放
 
@@ -11,39 +26,34 @@ def save_cq_code_to_file(code, base_dir="data/SyntheticData", batch_size=10000):
         code (str): 生成的CAD模型代码
         base_dir (str): 根目录路径
         batch_size (int): 每批文件数量（默认10000）
+        allocator (FileIndexAllocator): 文件编号分配器（为None时使用该目录的共享分配器）
     Returns:
         str: 保存的文件路径
     """
-    # 确保根目录存在
-    os.makedirs(base_dir, exist_ok=True)
+    if allocator is None:
+        allocator = get_index_allocator(base_dir, batch_size)
+
+    # 分配文件编号（无需扫描目录）
+    total_files = allocator.allocate(1)
+    file_path = allocator.file_path(total_files)
 
-    # 计算当前总文件数（用于确定批次和文件名）
-    total_files = 0
-    batch_dirs = [d for d in os.listdir(base_dir) if
-                  os.path.isdir(os.path.join(base_dir, d)) and d.startswith("batch_")]
-    if batch_dirs:
-        # 从最大批次目录中统计已有文件数
-        last_batch = max(batch_dirs, key=lambda x: int(x.split("_")[1]))
-        last_batch_path = os.path.join(base_dir, last_batch)
-        total_files = (int(last_batch.split("_")[1]) * batch_size) + len(os.listdir(last_batch_path))
-    current_batch = total_files // batch_size
-    current_idx = total_files % batch_size
-
-    # 构建批次目录和文件路径
-    batch_dir = os.path.join(base_dir, f"batch_{current_batch}")
-    os.makedirs(batch_dir, exist_ok=True)
-    file_path = os.path.join(batch_dir, f"cad_model_{total_files}.py")
-
-    # 写入代码（添加文件头说明）
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write("# 自动生成的CAD模型训练数据\n")
-        f.write("# 包含随机生成的草图、拉伸及布尔运算\n")
-        f.write(code)
+    # 写入代码（添加文件头说明），先写临时文件再重命名，避免崩溃时留下不完整的文件
+    try:
+        atomic_write_text(
+            file_path,
+            "# 自动生成的CAD模型训练数据\n"
+            "# 包含随机生成的草图、拉伸及布尔运算\n"
+            + code
+        )
+    except BaseException:
+        allocator.release(total_files)
+        raise
+    allocator.commit(total_files)
 
     return file_path
 
 
-def save_cq_code_sequence(cq_code, base_dir="data/SyntheticData", batch_size=10000):
+def save_cq_code_sequence(cq_code, base_dir="data/SyntheticData", batch_size=10000, allocator=None):
     """
     将生成的CadQuery代码拆分成多个文件，每个文件在前一个文件基础上增加一个操作
     
@@ -51,75 +61,32 @@ def save_cq_code_sequence(cq_code, base_dir="data/SyntheticData", batch_size=100
         cq_code (str): 完整的生成CAD模型代码
         base_dir (str): 根目录路径
         batch_size (int): 每批文件数量
+        allocator (FileIndexAllocator): 文件编号分配器（为None时使用该目录的共享分配器）
     
     Returns:
         int: 生成的文件数量
     """
-    # 确保根目录存在
-    os.makedirs(base_dir, exist_ok=True)
-
-    # 计算当前总文件数（用于确定批次和文件名）
-    total_files = 0
-    batch_dirs = [d for d in os.listdir(base_dir) if
-                  os.path.isdir(os.path.join(base_dir, d)) and d.startswith("batch_")]
-    if batch_dirs:
-        # 从最大批次目录中统计已有文件数
-        last_batch = max(batch_dirs, key=lambda x: int(x.split("_")[1]))
-        last_batch_path = os.path.join(base_dir, last_batch)
-        total_files = (int(last_batch.split("_")[1]) * batch_size) + len(os.listdir(last_batch_path))
-    
-    # 按行分割代码
-    lines = cq_code.split('\n')
-    
-    # 分离导入语句和操作代码
-    header_lines = []
-    operation_lines = []
-    
-    for line in lines:
-        if line.startswith("import "):
-            header_lines.append(line)
-        else:
-            operation_lines.append(line)
+    if allocator is None:
+        allocator = get_index_allocator(base_dir, batch_size)
     
-    # 找到所有result=行的索引
-    result_indices = []
-    for i, line in enumerate(operation_lines):
-        if line.strip().startswith("result = "):
-            result_indices.append(i)
+    # 每一步对应一个文件，第i个文件在第i-1个文件基础上增加一个操作
+    step_codes = build_step_codes(cq_code)
     
-    # 如果没有找到result行，将整个代码作为一个文件保存
-    if not result_indices:
-        result_indices = [len(operation_lines) - 1]
+    # 分配文件编号（无需扫描目录）并写入
+    write_step_files(allocator, step_codes)
     
-    # 为每个result=行创建一个文件
-    for i, result_idx in enumerate(result_indices):
-        # 构建当前步骤的代码
-        current_code_lines = header_lines.copy()
-        # 添加到当前result行为止的所有行
-        current_code_lines.extend(operation_lines[:result_idx + 1])
-        
-        current_code = "\n".join(current_code_lines)
-        
-        # 计算批次和文件路径
-        current_total_files = total_files + i
-        current_batch = current_total_files // batch_size
-        current_idx = current_total_files % batch_size
-
-        # 构建批次目录和文件路径
-        batch_dir = os.path.join(base_dir, f"batch_{current_batch}")
-        os.makedirs(batch_dir, exist_ok=True)
-        file_path = os.path.join(batch_dir, f"cad_model_{current_total_files}.py")
-
-        # 写入代码
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write("# 自动生成的CAD模型训练数据\n")
-            f.write(f"# 包含随机生成的草图、拉伸及布尔运算（第{i+1}步，共{len(result_indices)}步）\n")
-            f.write(current_code)
-    
-    return len(result_indices)
+    return len(step_codes)
 
 
-def generate_training_dataset(total_count=1000000, batch_size=10000, clear_existing=False):
+def generate_training_dataset(total_count=1000000, batch_size=10000, clear_existing=False, workers=1,
+                              output_format='dir', shard_size=10000, layout='sequence',
+                              sketch_library=None, sketch_stratify=None, quiet=False,
+                              metrics_file=None, metrics_interval=10.0, metadata_index=True,
+                              async_write=True, write_queue_size=256, compression=None, dictionary_samples=300,
+                              dedup=False, dedup_capacity=10_000_000, dedup_error_rate=1e-4, dedup_save_interval=60.0,
+                              geometry_format=None, geometry_steps=False, point_cloud_points=None,
+                              point_cloud_dtype='float32', candidates=1, candidate_select='first',
+                              adaptive_sampling=False, adaptive_min_share=DEFAULT_MIN_SHARE):
     """
     生成指定数量的CAD模型训练文件
 
@@ -127,8 +94,59 @@ def generate_training_dataset(total_count=1000000, batch_size=10000, clear_exist
         total_count (int): 总文件数（默认100万）
         batch_size (int): 每批文件数量（默认10000）
         clear_existing (bool): 是否清空现有目录（默认False，需要显式指定）
+        workers (int): 并行生成的进程数（默认1，即在当前进程中串行生成）
+        output_format (str): 输出格式，'dir'为每步一个.py文件（默认），'shard'为tar分片
+        shard_size (int): 每个分片最多包含的文件数（仅shard格式使用）
+        layout (str): 样本存储方式，'sequence'为每步一个文件（默认），
+            'program'为每个样本只保存一次完整程序并记录步骤边界（total_count仍按步数计）
+        sketch_library (str): 预生成的草图库目录（见generators.sketch_library），为None时在线生成草图
+        sketch_stratify (str): 从草图库抽样时的分层方式，None、'edges'或'area'
+        quiet (bool): 安静模式，生成循环中不显示进度条，也不输出可恢复的错误（只计入指标）
+        metrics_file (str): 指标文件路径，每隔metrics_interval秒追加一行JSON（见generators.metrics），
+            为None时不写入
+        metrics_interval (float): 写入指标文件的间隔（秒）
+        metadata_index (bool): 是否将每个样本的元数据写入数据集目录下的metadata.sqlite
+            （见processors.metadata_index），可按操作数、体积等条件筛选样本而无需读取代码文件
+        async_write (bool): 是否在后台线程中批量写入文件（见processors.sample_writer），
+            生成循环不等待磁盘I/O；为False时在生成循环中同步写入
+        write_queue_size (int): 后台写入时最多等待写入的样本数，队列满时生成循环等待
+        compression (str): 文件压缩方式，None为不压缩，'zstd'为使用训练字典的zstd压缩（见processors.compression）；
+            数据集目录中已有字典时始终使用压缩
+        dictionary_samples (int): 数据集目录中没有字典时，先生成多少个样本训练字典（这些样本同样写入数据集）
+        dedup (bool): 是否丢弃程序（编号规范化后）或最终几何与已有样本相同的样本（见processors.dedup），
+            已出现的样本保存在数据集目录下的dedup.bloom，续写时继续去重；重复的样本不计入总数
+        dedup_capacity (int): 去重过滤器的预计样本数，超过后误判率逐渐升高（首次创建过滤器时使用）
+        dedup_error_rate (float): 去重过滤器的误判率（不重复的样本被当作重复丢弃的概率）
+        dedup_save_interval (float): 生成过程中保存去重过滤器的间隔（秒），进程被强制终止时最多丢失该间隔内的键
+        geometry_format (str): 同时保存最终几何的格式，'step'、'stl'或'brep'（二进制），为None时不保存；
+            几何由验证工作进程直接从已有的result导出，不再执行一遍程序，
+            文件与对应的程序文件同编号、同目录或同一分片（见processors.output_backends）
+        geometry_steps (bool): 同时保存每一步的几何（仅逐步布局），每个步骤文件对应一个几何文件
+        point_cloud_points (int): 同时为每个样本的最终几何采样多少个表面点（含法向），为None时不采样；
+            点云按样本编号保存在数据集目录下的point_clouds（见processors.point_cloud_store），
+            已有数据集可用 python -m processors.point_cloud_store 离线补充
+        point_cloud_dtype (str): 点云的存储精度，'float16'或'float32'
+        candidates (int): 每次循环提出的候选步骤数，大于1时由多个验证工作进程同时验证，每次循环最多接受一个
+            （推测式验证，见generators.code_generator.CADCodeGenerator）；每个生成进程使用candidates个验证工作进程，
+            共 workers × candidates 个进程，多核机器上两者的乘积以不超过CPU核数为宜
+        candidate_select (str): 候选的选择方式，'first'为按顺序第一个可接受的候选，'max_change'为体积变化最大的候选
+        adaptive_sampling (bool): 按各类平面、布尔运算和拉伸高度分桶的在线接受率调整抽样权重，减少被验证拒绝的步骤
+            （见generators.adaptive_sampler）；只用于本函数的非种子生成，按种子生成（iter_samples(seed=...)、
+            VirtualCADDataset）始终均匀抽样
+        adaptive_min_share (float): 自适应抽样的多样性下限，每类选择至少保留该比例的均匀抽样概率
     """
     base_dir = "../data/SyntheticData"
+    if geometry_format is not None and geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"未知的几何格式: {geometry_format}，可选值为 {GEOMETRY_FORMATS}")
+    if geometry_steps and layout != 'sequence':
+        raise ValueError("每一步的几何只能在逐步布局（layout='sequence'）中保存")
+    if point_cloud_dtype not in POINT_CLOUD_DTYPES:
+        raise ValueError(f"不支持的点云dtype: {point_cloud_dtype}，可选值为 {POINT_CLOUD_DTYPES}")
+    if candidate_select not in CANDIDATE_SELECTIONS:
+        raise ValueError(f"未知的候选选择方式: {candidate_select}，可选值为 {CANDIDATE_SELECTIONS}")
+    sample_options = {'geometry_format': geometry_format, 'geometry_steps': geometry_steps,
+                      'point_count': point_cloud_points, 'candidates': candidates,
+                      'candidate_select': candidate_select}
 
     # 安全的目录清空逻辑
     if os.path.exists(base_dir):
@@ -156,29 +174,187 @@ def generate_training_dataset(total_count=1000000, batch_size=10000, clear_exist
     print(f"确保目录 {base_dir} 存在...")
     os.makedirs(base_dir, exist_ok=True)
 
+    # 同时写入环境变量，并行模式下的工作进程使用相同设置（关闭时清除之前开启的设置）
+    configure_adaptive_sampler(adaptive_min_share if adaptive_sampling else None)
+    if adaptive_sampling:
+        print(f"开启自适应抽样（多样性下限 {adaptive_min_share}）")
+
+    if sketch_library is not None:
+        # 同时写入环境变量，并行模式下的工作进程也从该库中抽取草图
+        library = configure_sketch_library(sketch_library, sketch_stratify)
+        print(f"使用草图库 {sketch_library}（{len(library)} 个区域）")
+
+    if compression is None and os.path.exists(dictionary_path(base_dir)):
+        print("数据集目录中已有zstd字典，继续使用压缩输出")
+        compression = 'zstd'
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"未知的压缩方式: {compression}，可选值为 {COMPRESSIONS}")
+    codec = None
+    training_records = []  # 训练字典时生成的样本，之后同样写入数据集
+    if compression == 'zstd':
+        codec = ProgramCodec.load(base_dir)
+        if codec is None:
+            codec, training_records = _train_codec(base_dir, layout, dictionary_samples, workers, quiet, sample_options)
+
+    # 输出后端内部的文件编号分配器从状态文件恢复，只在首次使用旧目录时扫描一次
+    backend = create_output_backend(output_format, base_dir, batch_size, shard_size, layout, codec, geometry_format)
+    if backend.allocator.recovered_ranges:
+        print(f"检测到上次未完成的写入，已清理 {len(backend.allocator.recovered_ranges)} 个不完整的编号区间")
+    print(f"从文件编号 {backend.allocator.next_index} 继续生成")
+
+    index = None
+    if metadata_index:
+        index = MetadataIndex(os.path.join(base_dir, METADATA_FILE_NAME))
+        # 删除上次运行中未提交（文件已被清理）的样本的索引行
+        pruned = index.prune(backend.allocator.next_index)
+        if pruned:
+            print(f"已从元数据索引中删除 {pruned} 个未完成的样本")
    
+    deduper = None
+    if dedup:
+        deduper = SampleDeduplicator(os.path.join(base_dir, DEDUP_FILE_NAME), dedup_capacity, dedup_error_rate,
+                                     save_interval=dedup_save_interval)
+        print(f"样本去重：已记录 {deduper.bloom.count} 个键，过滤器占用 {deduper.bloom.memory_bytes / 2**20:.1f} MB")
+
+    point_clouds = None
+    if point_cloud_points:
+        point_clouds = PointCloudStore(os.path.join(base_dir, POINT_CLOUD_DIR_NAME), point_cloud_points,
+                                       point_cloud_dtype)
+        print(f"点云：每个样本 {point_clouds.point_count} 个点（{point_clouds.dtype}），已有 {len(point_clouds)} 个样本")
+
     generated = 0  # 已成功生成的模型数
+    metrics_writer = MetricsWriter(metrics_file, metrics_interval) if metrics_file else None
+    if async_write:
+        writer = AsyncSampleWriter(backend, index, metrics_writer, queue_size=write_queue_size,
+                                   point_clouds=point_clouds, deduper=deduper)
+    else:
+        writer = SampleWriter(backend, index, metrics_writer, point_clouds, deduper)
+
+    try:
+        # 训练字典使用的样本先写入，计入总数
+        for record in training_records:
+            if deduper is None or deduper.check(record) is None:
+                generated += writer.submit(record)
+        remaining = total_count - generated
+        if remaining > 0 and workers > 1:
+            generated += _generate_with_workers(remaining, writer, workers, quiet, deduper, sample_options)
+        elif remaining > 0:
+            generated += _generate_serial(remaining, writer, quiet, deduper, sample_options)
+    except SampleWriteError as e:
+        print(f"\n{e}，已停止生成（已写入的样本保留，可修复后继续生成）")
+        raise
+    finally:
+        # 写完队列中的样本、写入未满的分片等收尾工作（包括用户中断时）
+        try:
+            writer.close()
+        finally:
+            backend.close()
+            # 分片布局中最后一个分片在关闭后端时才提交，其中样本的去重键此时才加入过滤器
+            writer.confirm_committed()
+        if index is not None:
+            index.close()
+        if point_clouds is not None:
+            point_clouds.close()
+        if deduper is not None:
+            deduper.close()
+            print(f"样本去重：丢弃程序重复 {deduper.duplicates['program']} 个，几何重复 {deduper.duplicates['geometry']} 个")
+        if metrics_writer is not None:
+            metrics_writer.close()
+
+    print(f"生成完成！总模型数：{generated}，存放于 {base_dir}")
+
+
+def _train_codec(base_dir, layout, sample_count, workers, quiet=False, sample_options=None):
+    """
+    生成sample_count个样本，用它们写出的文件内容训练zstd字典并保存到数据集目录
+
+    Returns:
+        tuple: (ProgramCodec, 训练使用的样本记录列表)
+    """
+    print(f"数据集目录中没有zstd字典，先生成 {sample_count} 个样本训练字典...")
+    records = []
+    samples = iter_samples(sample_count, workers=workers if workers > 1 else 0,
+                           on_error=(lambda message: None) if quiet else None, **(sample_options or {}))
+    try:
+        for record in tqdm(samples, total=sample_count, desc="生成字典训练样本", disable=quiet):
+            records.append(record)
+    finally:
+        samples.close()
+    texts = [content for record in records for content in build_sample_files(record['code'], layout)[0]]
+    codec = ProgramCodec(train_dictionary(texts))
+    codec.save(base_dir)
+    print(f"字典已保存到 {dictionary_path(base_dir)}（{len(codec.dictionary)} 字节）")
+    return codec, records
+
+
+def _update_progress(pbar, writer, file_count):
+    """更新进度条，后台写入时同时显示等待写入的样本数"""
+    pbar.update(file_count)
+    if isinstance(writer, AsyncSampleWriter):
+        pbar.set_postfix({'写入队列': writer.depth}, refresh=False)
+
+
+def _generate_with_workers(total_count, writer, workers, quiet=False, deduper=None, sample_options=None):
+    """
+    多进程并行生成并显示汇总进度条：工作进程只负责生成样本，
+    主进程去重后将样本交给writer统一分配文件编号并写入，返回已生成的文件数
+    """
+    generated = 0
+    with tqdm(total=total_count, desc=f"生成训练模型（{workers}进程）", disable=quiet) as pbar:
+        # 工作进程中的错误不中断生成，也不等待用户输入（错误数计入指标'sample.error'）
+        if quiet:
+            on_error = lambda message: None
+        else:
+            on_error = lambda message: tqdm.write(f"生成文件时出错（已跳过）：{message}")
+        samples = iter_samples(workers=workers, on_error=on_error, **(sample_options or {}))
+        try:
+            for record in samples:
+                if deduper is not None and deduper.check(record) is not None:
+                    continue  # 重复样本跳过，不计数
+                file_count = writer.submit(record)
+                generated += file_count
+                _update_progress(pbar, writer, file_count)
+                if generated >= total_count:
+                    break
+        except KeyboardInterrupt:
+            print(f"\n\n用户中断！已生成 {generated} 个模型")
+            print(f"可以稍后继续生成（不会覆盖已有文件）")
+        finally:
+            # 停止迭代时取消尚未开始的生成任务
+            samples.close()
+    return generated
+
+
+def _generate_serial(total_count, writer, quiet=False, deduper=None, sample_options=None):
+    """在当前进程中串行生成，返回已生成的文件数"""
+    generated = 0
 
     # 使用 while 循环直到满足数量
-    with tqdm(total=total_count, desc="生成训练模型") as pbar:
+    with tqdm(total=total_count, desc="生成训练模型", disable=quiet) as pbar:
         while generated < total_count:
             try:
-                # 生成单个CAD代码
-                generator = CADCodeGenerator(1, 10)  # 限制操作数在1-10之间
-                cq_code = generator.generate_cq_code()
+                # 生成单个样本
+                record = generate_sample(1, 10, **(sample_options or {}))  # 限制操作数在1-10之间
 
-                # 过滤空代码（loop_count=0的情况）
-                if not cq_code.strip():
+                # 过滤没有任何有效步骤的样本
+                if record is None:
                     continue  # 空代码跳过，不计数
+                if deduper is not None and deduper.check(record) is not None:
+                    continue  # 重复样本跳过，不计数
 
                 # 保存文件序列
-                file_count = save_cq_code_sequence(cq_code, base_dir, batch_size)
+                file_count = writer.submit(record)
                 generated += file_count  # 成功生成才计数
-                pbar.update(file_count)  # 进度条按实际生成文件数更新
+                _update_progress(pbar, writer, file_count)  # 进度条按实际生成文件数更新
 
+            except SampleWriteError:
+                # 写入失败不是单个样本的问题，重新生成也无法写入，停止生成
+                raise
             except (ValueError, RuntimeError, AttributeError) as e:
                 # 可恢复的错误
-                print(f"\n生成文件时出错（可恢复）：{type(e).__name__}: {e}，跳过该文件")
+                get_metrics().count('sample.error')
+                if not quiet:
+                    print(f"\n生成文件时出错（可恢复）：{type(e).__name__}: {e}，跳过该文件")
                 continue
             except KeyboardInterrupt:
                 # 用户中断
@@ -196,7 +372,7 @@ def generate_training_dataset(total_count=1000000, batch_size=10000, clear_exist
                     break
                 continue
 
-    print(f"生成完成！总模型数：{generated}，存放于 {base_dir}")
+    return generated
 
 
 # 执行生成（注意：100万文件会占用大量磁盘空间，建议先测试小批量）
@@ -210,8 +386,63 @@ if __name__ == "__main__":
                         help='每批文件数量（默认10000）')
     parser.add_argument('--clear', action='store_true',
                         help='清空现有目录（需要显式指定）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行生成的进程数（默认1，即串行生成）')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='dir',
+                        help='输出格式：dir为每步一个.py文件（默认），shard为tar分片')
+    parser.add_argument('--shard-size', type=int, default=10000,
+                        help='每个分片最多包含的文件数（默认10000，仅shard格式使用）')
+    parser.add_argument('--layout', choices=LAYOUTS, default='sequence',
+                        help='样本存储方式：sequence为每步一个文件（默认），program为每个样本一个文件并记录步骤边界')
+    parser.add_argument('--sketch-library', default=None,
+                        help='预生成的草图库目录（python -m generators.sketch_library构建），默认在线生成草图')
+    parser.add_argument('--sketch-stratify', choices=STRATIFY_MODES, default=None,
+                        help='从草图库抽样时的分层方式：edges按边数，area按面积（默认均匀抽样）')
+    parser.add_argument('--quiet', action='store_true',
+                        help='安静模式：生成过程中不显示进度条和逐样本信息，只输出错误日志')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='日志级别（默认INFO；DEBUG输出每次循环的验证结果）')
+    parser.add_argument('--metrics-file', default=None,
+                        help='指标文件路径（JSON行），记录各阶段计数和耗时，默认不记录')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help='写入指标文件的间隔秒数（默认10）')
+    parser.add_argument('--no-metadata-index', action='store_true',
+                        help='不写入样本元数据索引（默认写入数据集目录下的metadata.sqlite）')
+    parser.add_argument('--sync-write', action='store_true',
+                        help='在生成循环中同步写入文件（默认在后台线程中批量写入）')
+    parser.add_argument('--write-queue-size', type=int, default=256,
+                        help='后台写入时最多等待写入的样本数（默认256）')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default=None,
+                        help='文件压缩方式：zstd为使用训练字典的zstd压缩（需安装zstandard），默认不压缩')
+    parser.add_argument('--dictionary-samples', type=int, default=300,
+                        help='训练压缩字典使用的样本数（默认300，仅在数据集目录中没有字典时使用）')
+    parser.add_argument('--dedup', action='store_true',
+                        help='丢弃程序或最终几何与已有样本重复的样本（已出现的样本记录在数据集目录下的dedup.bloom）')
+    parser.add_argument('--dedup-capacity', type=int, default=10_000_000,
+                        help='去重过滤器的预计样本数（默认1000万，约48MB内存）')
+    parser.add_argument('--dedup-error-rate', type=float, default=1e-4,
+                        help='去重过滤器的误判率（默认1e-4）')
+    parser.add_argument('--dedup-save-interval', type=float, default=60.0,
+                        help='生成过程中保存去重过滤器的间隔（秒，默认60）')
+    parser.add_argument('--geometry', choices=GEOMETRY_FORMATS, default=None,
+                        help='同时保存验证时得到的最终几何：step、stl或brep（二进制），默认不保存')
+    parser.add_argument('--geometry-steps', action='store_true',
+                        help='同时保存每一步的几何（仅sequence存储方式，需指定--geometry）')
+    parser.add_argument('--point-cloud-points', type=int, default=None,
+                        help='同时为每个样本采样多少个表面点（含法向），保存在数据集目录下的point_clouds，默认不采样')
+    parser.add_argument('--point-cloud-dtype', choices=POINT_CLOUD_DTYPES, default='float32',
+                        help='点云的存储精度（默认float32）')
+    parser.add_argument('--candidates', type=int, default=1,
+                        help='每次循环提出的候选步骤数，大于1时由多个验证进程同时验证（每个生成进程使用该数量的验证进程），默认1')
+    parser.add_argument('--candidate-select', choices=CANDIDATE_SELECTIONS, default='first',
+                        help='候选的选择方式：first为第一个可接受的候选，max_change为体积变化最大的候选（默认first）')
+    parser.add_argument('--adaptive-sampling', action='store_true',
+                        help='按各类平面、布尔运算和拉伸高度的在线接受率调整抽样权重，减少被拒绝的步骤（默认关闭）')
+    parser.add_argument('--adaptive-min-share', type=float, default=DEFAULT_MIN_SHARE,
+                        help=f'自适应抽样的多样性下限：每类选择至少保留该比例的均匀概率（默认{DEFAULT_MIN_SHARE}）')
     
     args = parser.parse_args()
+    configure_logging('ERROR' if args.quiet else args.log_level)
     
     print("=" * 60)
     print("CAD训练数据生成")
@@ -219,11 +450,40 @@ if __name__ == "__main__":
     print(f"目标数量: {args.count}")
     print(f"批次大小: {args.batch_size}")
     print(f"清空现有: {'是' if args.clear else '否'}")
+    print(f"并行进程: {args.workers}")
+    print(f"输出格式: {args.output_format}")
+    print(f"存储方式: {args.layout}")
     print("=" * 60)
     print()
     
     generate_training_dataset(
         total_count=args.count,
         batch_size=args.batch_size,
-        clear_existing=args
+        clear_existing=args.clear,
+        workers=args.workers,
+        output_format=args.output_format,
+        shard_size=args.shard_size,
+        layout=args.layout,
+        sketch_library=args.sketch_library,
+        sketch_stratify=args.sketch_stratify,
+        quiet=args.quiet,
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        metadata_index=not args.no_metadata_index,
+        async_write=not args.sync_write,
+        write_queue_size=args.write_queue_size,
+        compression=args.compression,
+        dictionary_samples=args.dictionary_samples,
+        dedup=args.dedup,
+        dedup_capacity=args.dedup_capacity,
+        dedup_error_rate=args.dedup_error_rate,
+        dedup_save_interval=args.dedup_save_interval,
+        geometry_format=args.geometry,
+        geometry_steps=args.geometry_steps,
+        point_cloud_points=args.point_cloud_points,
+        point_cloud_dtype=args.point_cloud_dtype,
+        candidates=args.candidates,
+        candidate_select=args.candidate_select,
+        adaptive_sampling=args.adaptive_sampling,
+        adaptive_min_share=args.adaptive_min_share
     )
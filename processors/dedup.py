@@ -0,0 +1,272 @@
+"""
+样本去重：草图复用、较粗的网格（decimal_parts）以及草图生成失败时的简单矩形回退都会产生重复或近似重复的样本
+
+每个样本计算两个键：
+- 程序键：规范化后的程序文本的哈希（去掉注释和空行，extrude_N、Extrude.N、Sketch.N 按首次出现的顺序重新编号），
+  只是编号不同的两个程序视为重复
+- 几何键：最终结果的体积、包围盒和面数、实体数量化后的哈希，不同程序得到（近似）相同形状时视为重复
+
+已出现的键保存在布隆过滤器中，内存固定（1000万样本、误判率1e-4时约48MB），
+误判只会多丢弃极少数不重复的样本，不会漏掉已出现过的键。
+过滤器可保存到文件（数据集目录下的dedup.bloom），续写时继续使用。生成过程中每隔save_interval秒保存一次，
+进程被强制终止时最多丢失最近一个间隔内的键（这些样本之后可能再出现一次重复），不会丢失全部键。
+并行生成时样本都回到主进程写入，去重在主进程中进行，所有工作进程共享同一个过滤器。
+
+check()通过的样本的键先记为待写入（之后提交的相同样本仍按重复丢弃），
+样本的文件编号提交后（见processors.sample_writer）才由add_keys()加入过滤器，
+崩溃时被回退的样本不会留在保存的过滤器中，续写时重新生成的相同样本不会被误判为重复。
+"""
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+from generators.metrics import get_metrics
+from processors.index_allocator import atomic_write_bytes
+
+
+DEDUP_FILE_NAME = "dedup.bloom"
+DEDUP_KEYS = ('program', 'geometry')
+
+# 几何键的量化精度：体积保留的有效数字位数，包围盒坐标的量化步长
+VOLUME_SIGNIFICANT_DIGITS = 4
+BBOX_QUANTUM = 0.01
+
+_ID_PATTERN = re.compile(r"(extrude_|Extrude\.|Sketch\.)(\d+)")
+
+_BLOOM_MAGIC = b"CQBLOOM1"
+_BLOOM_HEADER = struct.Struct("<8sQIQ")  # 标识, 位数, 哈希函数个数, 已插入的键数
+
+
+def canonical_program(code):
+    """
+    规范化程序文本：去掉注释和空行、每行首尾空白，编号按首次出现的顺序重新编号
+
+    Returns:
+        str: 规范化后的程序
+    """
+    lines = [line.strip() for line in code.split('\n')]
+    text = '\n'.join(line for line in lines if line and not line.startswith('#'))
+    renumbered = {}
+
+    def renumber(match):
+        prefix, number = match.groups()
+        # extrude_N 与 Extrude.N 指同一个拉伸，共用编号
+        namespace = renumbered.setdefault(prefix.lower().rstrip('_.'), {})
+        return prefix + namespace.setdefault(number, str(len(namespace) + 1))
+
+    return _ID_PATTERN.sub(renumber, text)
+
+
+def program_key(code):
+    """程序键（16字节）"""
+    return hashlib.blake2b(canonical_program(code).encode("utf-8"), digest_size=16).digest()
+
+
+def _quantize_volume(volume):
+    if not volume:
+        return "0"
+    return f"{volume:.{VOLUME_SIGNIFICANT_DIGITS}g}"
+
+
+def geometry_key(steps):
+    """
+    几何键（16字节）：最后一步的体积、包围盒、面数和实体数量化后的哈希
+
+    Args:
+        steps: 样本记录中的'steps'
+    """
+    last_step = steps[-1]
+    bbox = last_step.get('bbox') or ()
+    parts = [
+        _quantize_volume(last_step.get('volume')),
+        *(str(round(value / BBOX_QUANTUM)) for value in bbox),
+        str(last_step.get('face_count')),
+        str(last_step.get('solid_count')),
+    ]
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    布隆过滤器：按容量和误判率确定位数m和哈希函数个数k，
+    每个键的k个位置由键的哈希派生（双重哈希），键本身应已是均匀分布的摘要
+    """
+
+    def __init__(self, capacity, error_rate=1e-4):
+        """
+        Args:
+            capacity: 预计插入的键数，超过后误判率逐渐升高
+            error_rate: 插入capacity个键时的误判率
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key):
+        """
+        插入键
+
+        Returns:
+            bool: 插入前键是否（可能）已存在
+        """
+        bits = self._bits
+        existed = True
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                existed = False
+        if not existed:
+            self.count += 1
+        return existed
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+    def save(self, path):
+        header = _BLOOM_HEADER.pack(_BLOOM_MAGIC, self.size, self.hash_count, self.count)
+        atomic_write_bytes(path, header + bytes(self._bits))
+
+    @classmethod
+    def load(cls, path, capacity, error_rate=1e-4):
+        """
+        读取保存的过滤器（容量和误判率只用于记录，位数和哈希函数个数以文件为准）
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, size, hash_count, count = _BLOOM_HEADER.unpack_from(data)
+        if magic != _BLOOM_MAGIC:
+            raise ValueError(f"{path} 不是布隆过滤器文件")
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.error_rate = error_rate
+        bloom.size = size
+        bloom.hash_count = hash_count
+        bloom.count = count
+        bloom._bits = bytearray(data[_BLOOM_HEADER.size:])
+        if len(bloom._bits) != (size + 7) // 8:
+            raise ValueError(f"{path} 已损坏（长度与位数不符）")
+        return bloom
+
+
+class SampleDeduplicator:
+    """
+    按程序键和几何键检查样本是否重复
+
+    用法：
+        dedup = SampleDeduplicator(path)
+        reason = dedup.check(record)  # 不重复时返回None并将该样本的键记为待写入
+        ...
+        dedup.add_keys(dedup.sample_keys(record))  # 样本写入并提交后记录其键，距上次保存超过save_interval秒时保存
+        ...
+        dedup.close()  # 保存过滤器
+
+    check()在生成循环中调用，add_keys()可在写入线程中调用（AsyncSampleWriter）。
+    """
+
+    def __init__(self, path=None, capacity=10_000_000, error_rate=1e-4, keys=DEDUP_KEYS, save_interval=60.0):
+        """
+        Args:
+            path: 过滤器文件路径，存在时读取，生成过程中定期保存、close()时保存；为None时只在内存中去重
+            capacity: 预计的样本数
+            error_rate: 每种键的误判率（不重复的样本被误判为重复的概率）
+            keys: 使用的键，DEDUP_KEYS的子集
+            save_interval: 有新键时两次保存的最小间隔（秒），为None时只在close()时保存
+        """
+        unknown = set(keys) - set(DEDUP_KEYS)
+        if unknown:
+            raise ValueError(f"未知的去重键: {sorted(unknown)}，可选值为 {DEDUP_KEYS}")
+        self.path = path
+        self.keys = tuple(keys)
+        # 两种键在同一个过滤器中（加前缀区分），每个样本插入len(keys)个键
+        if path is not None and os.path.exists(path):
+            self.bloom = BloomFilter.load(path, capacity * len(self.keys), error_rate)
+        else:
+            self.bloom = BloomFilter(capacity * len(self.keys), error_rate)
+        self.duplicates = {key: 0 for key in self.keys}
+        self.save_interval = save_interval
+        self._pending = set()  # 已通过检查、尚未提交的样本的键
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._unsaved = False
+
+    def sample_keys(self, record):
+        """样本的各个键 {键名: 摘要}"""
+        result = {}
+        if 'program' in self.keys:
+            result['program'] = b"p" + program_key(record['code'])
+        if 'geometry' in self.keys:
+            result['geometry'] = b"g" + geometry_key(record['steps'])
+        return result
+
+    @property
+    def pending_count(self):
+        """已通过检查、尚未提交的键数"""
+        return len(self._pending)
+
+    def check(self, record):
+        """
+        检查样本是否与已提交或待写入的样本重复，不重复时将其键记为待写入（不加入过滤器）
+
+        Returns:
+            str: 重复时返回命中的键名（'program'或'geometry'），否则返回None
+        """
+        sample_keys = self.sample_keys(record)
+        with self._lock:
+            for name, key in sample_keys.items():
+                if key in self._pending or key in self.bloom:
+                    self.duplicates[name] += 1
+                    get_metrics().count(f"sample.duplicate.{name}")
+                    return name
+            self._pending.update(sample_keys.values())
+        return None
+
+    def add_keys(self, sample_keys):
+        """
+        将已提交的样本的键加入过滤器
+
+        Args:
+            sample_keys: sample_keys()的返回值
+        """
+        with self._lock:
+            for key in sample_keys.values():
+                self.bloom.add(key)
+                self._pending.discard(key)
+            self._unsaved = True
+        self.maybe_save()
+
+    def maybe_save(self):
+        """有未保存的键且距上次保存超过save_interval秒时保存"""
+        if (self._unsaved and self.save_interval is not None
+                and time.monotonic() - self._last_save >= self.save_interval):
+            self.save()
+
+    def save(self):
+        """保存过滤器（只包含已提交的样本的键）"""
+        with self._lock:
+            if self.path is not None:
+                self.bloom.save(self.path)
+            self._last_save = time.monotonic()
+            self._unsaved = False
+
+    def close(self):
+        self.save()
@@ -0,0 +1,323 @@
+"""
+输出文件编号分配与断点续传
+
+在数据集根目录下维护两个文件：
+- _index_state.json：当前分配状态（下一个编号、已提交的最大编号、未提交的编号区间），
+  每次分配/提交时原子替换，重启时只需读取该文件即可恢复，无需扫描目录
+- _index_journal.log：已提交样本的追加日志，每行 "样本ID 文件数"，
+  样本ID即该样本第一个文件的编号
+
+提交时先追加日志再替换状态文件。重启时：
+- 日志末尾写了一半的行（追加时崩溃）被截掉，该区间在状态文件中仍未提交，按崩溃的写入处理
+- 状态文件中未提交、但日志中已记录的区间（追加日志后、替换状态文件前崩溃）视为已提交，不删除其文件
+- 状态文件领先于日志（如首次使用时扫描目录得到的编号）时以状态文件为准
+"""
+import json
+import os
+import threading
+
+
+STATE_FILE_NAME = "_index_state.json"
+JOURNAL_FILE_NAME = "_index_journal.log"
+
+
+def _count_existing_files(base_dir, batch_size):
+    """扫描批次目录，统计已有文件数（用于确定下一个文件编号）"""
+    total_files = 0
+    batch_dirs = [d for d in os.listdir(base_dir) if
+                  os.path.isdir(os.path.join(base_dir, d)) and d.startswith("batch_")]
+    if batch_dirs:
+        # 从最大批次目录中统计已有文件数
+        last_batch = max(batch_dirs, key=lambda x: int(x.split("_")[1]))
+        last_batch_path = os.path.join(base_dir, last_batch)
+        total_files = (int(last_batch.split("_")[1]) * batch_size) + len(os.listdir(last_batch_path))
+    return total_files
+
+
+def atomic_write_text(file_path, text):
+    """先写入临时文件再重命名，保证文件要么完整存在要么不存在"""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, file_path)
+
+
+def atomic_write_bytes(file_path, data):
+    """atomic_write_text的二进制版本"""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, file_path)
+
+
+class FileIndexAllocator:
+    """
+    全局文件编号分配器
+
+    编号按"分配 → 写入 → 提交"的流程使用：
+    - allocate()预留连续编号并记为未提交
+    - 文件全部写入后调用commit()，追加到日志
+    - 写入失败时调用release()删除已写入的文件
+
+    重启时若状态文件中存在未提交的区间（上次运行中途崩溃），
+    删除这些区间内残留的文件，并从已提交的最大编号继续分配。
+    首次在已有数据的目录上使用时，扫描一次目录确定起始编号。
+
+    线程安全：多个写入方可共享同一个分配器。
+    """
+
+    def __init__(self, base_dir, batch_size=10000, file_pattern="cad_model_{index}.py", companion_patterns=()):
+        """
+        Args:
+            base_dir: 数据集根目录
+            batch_size: 每批文件数量（必须与该目录已有数据一致）
+            file_pattern: 文件名格式，{index}替换为文件编号
+            companion_patterns: 与文件同编号的附属文件名格式（如几何文件"cad_model_{index}.step"），
+                放弃或恢复未提交的编号区间时一并删除
+        """
+        os.makedirs(base_dir, exist_ok=True)
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+        self.file_pattern = file_pattern
+        self.companion_patterns = tuple(companion_patterns)
+        self.state_path = os.path.join(base_dir, STATE_FILE_NAME)
+        self.journal_path = os.path.join(base_dir, JOURNAL_FILE_NAME)
+        self._lock = threading.Lock()
+        self._created_batch_dirs = set()
+        self._pending = {}  # 起始编号 -> 文件数
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state["batch_size"] != batch_size:
+                raise ValueError(
+                    f"目录 {base_dir} 的批次大小为 {state['batch_size']}，与当前设置 {batch_size} 不一致"
+                )
+            self._next_index = state["next_index"]
+            self._committed_end = state["committed_end"]
+            self._truncate_torn_journal()
+            pending_ranges = [tuple(item) for item in state.get("pending", [])]
+            self.recovered_ranges = self._uncommitted_ranges(pending_ranges)
+            self._recover(self.recovered_ranges)
+        else:
+            # 首次使用：兼容旧数据，扫描一次目录
+            self._next_index = _count_existing_files(base_dir, batch_size)
+            self._committed_end = self._next_index
+            self.recovered_ranges = []
+            self._lost_ranges = []
+            self._save_state()
+
+    def _truncate_torn_journal(self):
+        """截掉日志末尾写了一半的行，之后追加的行不会与之拼接"""
+        try:
+            with open(self.journal_path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return
+                # 从末尾向前找到最后一个换行符
+                position = size
+                while position > 0:
+                    step = min(4096, position)
+                    f.seek(position - step)
+                    chunk = f.read(step)
+                    newline = chunk.rfind(b"\n")
+                    if newline >= 0:
+                        f.truncate(position - step + newline + 1)
+                        return
+                    position -= step
+                f.truncate(0)
+        except FileNotFoundError:
+            pass
+
+    def read_journal(self, min_index=0):
+        """
+        读取日志中已提交的区间（跳过无法解析的行）
+
+        Args:
+            min_index: 只返回起始编号不小于该值的区间
+
+        Returns:
+            list: [(起始编号, 文件数), ...]，按提交顺序
+        """
+        ranges = []
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+                        continue
+                    start_index, count = int(parts[0]), int(parts[1])
+                    if start_index >= min_index:
+                        ranges.append((start_index, count))
+        except FileNotFoundError:
+            pass
+        return ranges
+
+    def _uncommitted_ranges(self, pending_ranges):
+        """
+        从状态文件中未提交的区间里去掉日志中已记录的部分（追加日志后、替换状态文件前崩溃），
+        已记录的部分计入已提交的最大编号
+
+        Returns:
+            list: 确实未提交的区间 [(起始编号, 文件数), ...]
+        """
+        if not pending_ranges:
+            return []
+        journaled = self.read_journal(min(start for start, _ in pending_ranges))
+        uncommitted = []
+        for start, count in pending_ranges:
+            end = start + count
+            position = start
+            for journal_start, journal_count in sorted(journaled):
+                journal_end = journal_start + journal_count
+                if journal_start < start or journal_end > end:
+                    continue
+                if journal_start > position:
+                    uncommitted.append((position, journal_start - position))
+                position = max(position, journal_end)
+                self._committed_end = max(self._committed_end, journal_end)
+            if position < end:
+                uncommitted.append((position, end - position))
+        return uncommitted
+
+    def _recover(self, pending_ranges):
+        """删除上次运行中未提交区间的残留文件，并从已提交的最大编号继续分配"""
+        for start_index, count in pending_ranges:
+            self._remove_files(start_index, count)
+        self._next_index = self._committed_end
+        # 已提交的最大编号之前的未提交区间不会再被分配，始终视为未提交；之后的区间会被重新分配
+        self._lost_ranges = [(start, count) for start, count in pending_ranges if start < self._committed_end]
+        self._save_state()
+
+    def _remove_files(self, start_index, count):
+        for index in range(start_index, start_index + count):
+            file_paths = [self.file_path(index, create_dir=False)]
+            file_paths += [self.companion_path(index, pattern, create_dir=False) for pattern in self.companion_patterns]
+            for file_path in file_paths:
+                for path in (file_path, f"{file_path}.tmp"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _merged_pending_ranges(self):
+        """将相邻的未提交区间合并（如分片布局中同一分片内的样本），保持状态文件很小"""
+        merged = []
+        for start, count in sorted(self._pending.items()):
+            if merged and merged[-1][0] + merged[-1][1] == start:
+                merged[-1][1] += count
+            else:
+                merged.append([start, count])
+        return merged
+
+    def _save_state(self):
+        state = {
+            "batch_size": self.batch_size,
+            "next_index": self._next_index,
+            "committed_end": self._committed_end,
+            "pending": self._merged_pending_ranges(),
+        }
+        atomic_write_text(self.state_path, json.dumps(state))
+
+    @property
+    def next_index(self):
+        """下一个将要分配的文件编号"""
+        return self._next_index
+
+    def batch_dir(self, index, create_dir=True):
+        """文件编号所在的批次目录（已创建过的目录不再重复调用makedirs）"""
+        batch = index // self.batch_size
+        batch_dir = os.path.join(self.base_dir, f"batch_{batch}")
+        if create_dir and batch not in self._created_batch_dirs:
+            os.makedirs(batch_dir, exist_ok=True)
+            self._created_batch_dirs.add(batch)
+        return batch_dir
+
+    def file_path(self, index, create_dir=True):
+        """文件编号对应的文件路径"""
+        return os.path.join(self.batch_dir(index, create_dir), self.file_pattern.format(index=index))
+
+    def companion_path(self, index, pattern, create_dir=True):
+        """文件编号对应的附属文件路径（与该编号的文件位于同一批次目录）"""
+        return os.path.join(self.batch_dir(index, create_dir), pattern.format(index=index))
+
+    def allocate(self, count):
+        """
+        分配count个连续的文件编号
+
+        Returns:
+            int: 第一个文件编号（同时作为该样本的ID）
+        """
+        with self._lock:
+            start_index = self._next_index
+            self._next_index += count
+            self._pending[start_index] = count
+            self._save_state()
+            return start_index
+
+    def commit(self, start_index):
+        """标记以start_index开头的编号区间已全部写入"""
+        self.commit_many([start_index])
+
+    def commit_many(self, start_indices):
+        """
+        一次提交多个编号区间（只追加一次日志、写一次状态文件）
+
+        状态文件原子替换，因此这些区间要么全部已提交，要么全部未提交（如分片布局中同一分片内的样本）。
+        """
+        if not start_indices:
+            return
+        with self._lock:
+            lines = []
+            for start_index in start_indices:
+                count = self._pending.pop(start_index)
+                self._committed_end = max(self._committed_end, start_index + count)
+                lines.append(f"{start_index} {count}\n")
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+            self._save_state()
+
+    def is_committed(self, start_index):
+        """以start_index开头的编号区间是否已提交（重启后判断上次运行中写入的数据是否有效）"""
+        with self._lock:
+            if start_index in self._pending or start_index >= self._committed_end:
+                return False
+            return not any(start <= start_index < start + count for start, count in self._lost_ranges)
+
+    def release(self, start_index):
+        """放弃以start_index开头的编号区间，并删除已写入的文件"""
+        with self._lock:
+            count = self._pending.pop(start_index, None)
+            if count is None:
+                return
+            self._remove_files(start_index, count)
+            self._save_state()
+
+
+# 每个数据集目录共享一个分配器，避免同一进程内重复扫描或重复分配
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_index_allocator(base_dir, batch_size=10000, reset=False, file_pattern="cad_model_{index}.py",
+                        companion_patterns=()):
+    """
+    获取数据集目录对应的共享分配器
+
+    Args:
+        base_dir: 数据集根目录
+        batch_size: 每批文件数量
+        reset: 是否丢弃已缓存的分配器并重新加载（如目录被清空后）
+        file_pattern: 文件名格式（只在创建分配器时使用，如压缩输出的"cad_model_{index}.py.zst"）
+        companion_patterns: 附属文件名格式（只在创建分配器时使用，见FileIndexAllocator）
+    """
+    key = os.path.abspath(base_dir)
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if reset or allocator is None:
+            allocator = FileIndexAllocator(base_dir, batch_size, file_pattern, companion_patterns)
+            _allocators[key] = allocator
+        return allocator
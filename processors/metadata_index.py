@@ -0,0 +1,263 @@
+"""
+样本元数据索引：生成时逐样本写入SQLite数据库（默认为数据集目录下的metadata.sqlite），
+按操作数、体积、平面、布尔运算等条件筛选或分层抽样样本时无需打开任何代码文件
+
+表结构：
+- samples：每个样本一行，sample_id为该样本第一个文件的编号（与FileIndexAllocator.allocate的返回值一致）
+    sample_id, path（第一个文件的相对路径，分片布局为"分片路径#成员名"）, file_count, layout,
+    op_count, union_count, cut_count, final_volume, xmin, ymin, zmin, xmax, ymax, zmax（最终包围盒）,
+    face_count, seed, seed_index（按种子生成时的全局种子和样本编号）, created
+- steps：每个步骤一行
+    sample_id, step（从0开始）, plane, plane_name（XY/YZ/XZ，以面为工作平面时为'face'）,
+    sketch_id, height, boolean_op（首个步骤为NULL）, volume, solid_count, face_count
+
+用法：
+    index = MetadataIndex("data/SyntheticData/metadata.sqlite")
+    rows = index.query(min_ops=6, min_volume=1000.0)
+    ids = index.stratified_sample(100, by='op_count', rng=random.Random(0))
+"""
+import os
+import random
+import sqlite3
+import time
+
+from generators.step_prefilter import parse_plane
+
+
+METADATA_FILE_NAME = "metadata.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    sample_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    file_count INTEGER NOT NULL,
+    layout TEXT NOT NULL,
+    op_count INTEGER NOT NULL,
+    union_count INTEGER NOT NULL,
+    cut_count INTEGER NOT NULL,
+    final_volume REAL,
+    xmin REAL, ymin REAL, zmin REAL, xmax REAL, ymax REAL, zmax REAL,
+    face_count INTEGER,
+    seed INTEGER,
+    seed_index INTEGER,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    sample_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    plane TEXT NOT NULL,
+    plane_name TEXT NOT NULL,
+    sketch_id INTEGER,
+    height REAL,
+    boolean_op TEXT,
+    volume REAL,
+    solid_count INTEGER,
+    face_count INTEGER,
+    PRIMARY KEY (sample_id, step)
+);
+CREATE INDEX IF NOT EXISTS samples_op_count ON samples (op_count);
+CREATE INDEX IF NOT EXISTS samples_final_volume ON samples (final_volume);
+CREATE INDEX IF NOT EXISTS steps_plane_name ON steps (plane_name, sample_id);
+"""
+
+# stratified_sample可用的分层列
+STRATIFY_COLUMNS = ('op_count', 'union_count', 'cut_count', 'face_count', 'layout')
+
+
+def _plane_name(plane):
+    parsed = parse_plane(plane)
+    return parsed[0] if parsed is not None else 'face'
+
+
+class MetadataIndex:
+    """
+    样本元数据索引
+
+    写入按事务批量提交（每commit_every个样本及close()时）。通过SampleWriter写入时，
+    输出后端在每次提交样本编号之前先提交索引的事务（索引行在编号提交前写入），
+    已提交的样本在崩溃后不会缺少索引行；索引中多出的未提交样本在下次打开时由prune()删除
+    （如崩溃时未完成的分片中的样本）。
+    """
+
+    def __init__(self, path, commit_every=100):
+        """
+        Args:
+            path: 数据库文件路径（不存在时创建）
+            commit_every: 每写入多少个样本提交一次事务（另外在输出后端提交编号前提交，见上）
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        # 允许在打开索引的线程之外写入（如AsyncSampleWriter的写入线程），同一时间只能有一个线程使用
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL模式下读取（如训练进程中的查询）不阻塞生成时的写入
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def add_sample(self, record, location, layout='sequence'):
+        """
+        写入一个样本的元数据
+
+        Args:
+            record: 样本记录（见processors.sample_stream），使用其中的'steps'及可选的'seed'、'index'
+            location: 输出后端的last_sample，{'first_index', 'file_count', 'path'}
+            layout: 样本存储方式
+        """
+        steps = record['steps']
+        last_step = steps[-1] if steps else {}
+        bbox = last_step.get('bbox') or (None,) * 6
+        boolean_ops = [step.get('boolean_op') for step in steps]
+        sample_id = location['first_index']
+
+        # 编号可能在崩溃恢复后被重新分配，先删除旧的步骤行
+        self._conn.execute("DELETE FROM steps WHERE sample_id = ?", (sample_id,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                sample_id, location['path'], location['file_count'], layout,
+                len(steps), boolean_ops.count('union'), boolean_ops.count('cut'),
+                last_step.get('volume'), *bbox, last_step.get('face_count'),
+                record.get('seed'), record.get('index'), time.time(),
+            ),
+        )
+        self._conn.executemany(
+            "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    sample_id, step_number, step['plane'], _plane_name(step['plane']),
+                    step.get('sketch_id'), step.get('height'), step.get('boolean_op'),
+                    step.get('volume'), step.get('solid_count'), step.get('face_count'),
+                )
+                for step_number, step in enumerate(steps)
+            ],
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def prune(self, committed_end):
+        """
+        删除第一个文件编号不小于committed_end的样本（这些编号未被提交，对应的文件已不存在）
+
+        Returns:
+            int: 删除的样本数
+        """
+        self._conn.execute("DELETE FROM steps WHERE sample_id >= ?", (committed_end,))
+        deleted = self._conn.execute("DELETE FROM samples WHERE sample_id >= ?", (committed_end,)).rowcount
+        self.commit()
+        return deleted
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.commit()
+        self._conn.close()
+        self._conn = None
+
+    @staticmethod
+    def _where(min_ops=None, max_ops=None, min_volume=None, max_volume=None,
+               planes=None, boolean_op=None, layout=None):
+        """将筛选条件转换为WHERE子句和参数"""
+        clauses = []
+        params = []
+        for column, operator, value in (
+            ('op_count', '>=', min_ops), ('op_count', '<=', max_ops),
+            ('final_volume', '>=', min_volume), ('final_volume', '<=', max_volume),
+            ('layout', '=', layout),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        for plane_name in planes or ():
+            clauses.append("sample_id IN (SELECT sample_id FROM steps WHERE plane_name = ?)")
+            params.append(plane_name)
+        if boolean_op is not None:
+            clauses.append(f"{boolean_op}_count > 0" if boolean_op in ('union', 'cut') else "0")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, limit=None, **filters):
+        """
+        按条件筛选样本
+
+        Args:
+            limit: 最多返回的样本数
+            **filters: min_ops、max_ops（操作数）、min_volume、max_volume（最终体积）、
+                planes（必须用到的平面名称列表，如['XY', 'face']）、boolean_op（'union'或'cut'，至少包含一次）、
+                layout
+
+        Returns:
+            list: 样本行（dict），按sample_id排序
+        """
+        where, params = self._where(**filters)
+        sql = f"SELECT * FROM samples{where} ORDER BY sample_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def count(self, **filters):
+        """满足条件的样本数（筛选条件同query）"""
+        where, params = self._where(**filters)
+        return self._conn.execute(f"SELECT COUNT(*) FROM samples{where}", params).fetchone()[0]
+
+    def steps(self, sample_id):
+        """样本的全部步骤行（dict），按步骤顺序"""
+        return [
+            dict(row) for row in
+            self._conn.execute("SELECT * FROM steps WHERE sample_id = ? ORDER BY step", (sample_id,))
+        ]
+
+    def stratified_sample(self, n, by='op_count', rng=None, **filters):
+        """
+        分层抽样：在满足条件的样本中按列by的取值分层，各层抽取尽量相同的数量
+
+        样本数不足的层全部选取，剩余名额依次分给其他层。
+
+        Args:
+            n: 抽取的样本数
+            by: 分层列（STRATIFY_COLUMNS之一）
+            rng: 随机数生成器，为None时使用全局random模块
+            **filters: 筛选条件（同query）
+
+        Returns:
+            list: 抽中的sample_id，按sample_id排序
+        """
+        if by not in STRATIFY_COLUMNS:
+            raise ValueError(f"不支持的分层列: {by}，可选值为 {STRATIFY_COLUMNS}")
+        if rng is None:
+            rng = random
+        where, params = self._where(**filters)
+        strata = {}
+        for sample_id, value in self._conn.execute(
+                f"SELECT sample_id, {by} FROM samples{where} ORDER BY sample_id", params):
+            strata.setdefault(value, []).append(sample_id)
+
+        # 按层的大小从小到大分配名额，小层选完后剩余名额均分给较大的层
+        selected = []
+        remaining = n
+        groups = sorted(strata.values(), key=len)
+        for position, ids in enumerate(groups):
+            quota = remaining // (len(groups) - position)
+            take = min(quota, len(ids))
+            selected.extend(rng.sample(ids, take))
+            remaining -= take
+        return sorted(selected)
@@ -0,0 +1,472 @@
+"""
+训练数据输出后端
+
+- DirectoryBackend：默认目录布局，batch_N/cad_model_{编号}.py，每一步一个文件
+- ShardBackend：打包布局，将文件追加写入固定大小的tar分片，每个分片附带一个索引文件，
+  避免生成数百万个小文件
+
+两种后端都支持两种样本存储方式（layout）：
+- 'sequence'：每一步保存一个文件，第i个文件包含前i步的完整代码（默认）
+- 'program'：每个样本只保存一个文件，文件中记录每一步结束的行号，
+  读取时通过step_sequence.rebuild_step_code按需重建任意前缀
+
+指定codec（processors.compression.ProgramCodec）时每个文件单独压缩，文件名加 .zst 后缀；
+分片布局下分片不再使用tar，直接依次拼接各文件的zstd帧（shard_{序号}.zst），
+避免tar每个成员512字节的头和对齐占去大部分空间。
+
+样本记录带有验证时导出的几何（见processors.sample_stream中的'geometry'）时，几何文件与对应的程序文件同编号、
+同目录（或同一分片），文件名为 cad_model_{编号}.{格式}（step/stl/brep，不压缩）：
+逐步布局中最终几何对应最后一步的文件，导出每一步几何时每个步骤文件各对应一个几何文件；
+前缀去重布局中最终几何对应样本唯一的文件（该布局不支持每一步的几何）。
+"""
+import io
+import json
+import os
+import re
+import tarfile
+
+from processors.compression import COMPRESSED_SUFFIX, ProgramCodec
+from processors.index_allocator import atomic_write_bytes, atomic_write_text, get_index_allocator
+from processors.step_sequence import build_program_file, build_step_codes
+
+
+DEFAULT_FILE_PATTERN = "cad_model_{index}.py"
+SHARD_NAME_PATTERN = re.compile(r"shard_(\d+)\.")
+GEOMETRY_FILE_PATTERN = "cad_model_{{index}}.{extension}"
+
+
+OUTPUT_FORMATS = ('dir', 'shard')
+LAYOUTS = ('sequence', 'program')
+
+
+def build_sample_files(cq_code, layout='sequence'):
+    """
+    按存储方式生成一个样本需要写入的文件内容
+
+    Returns:
+        tuple: (文件内容列表, 样本步数)
+    """
+    if layout == 'sequence':
+        step_codes = build_step_codes(cq_code)
+        return step_codes, len(step_codes)
+    if layout == 'program':
+        content, step_count = build_program_file(cq_code)
+        return [content], step_count
+    raise ValueError(f"未知的存储方式: {layout}，可选值为 {LAYOUTS}")
+
+
+def geometry_file_pattern(geometry_format):
+    """几何文件名格式，{index}替换为对应程序文件的编号"""
+    return GEOMETRY_FILE_PATTERN.format(extension=geometry_format)
+
+
+def build_geometry_files(geometry, layout, file_count):
+    """
+    确定样本的几何文件各对应哪个程序文件
+
+    Args:
+        geometry: 样本记录中的'geometry'，为None时没有几何文件
+        layout: 样本存储方式
+        file_count: 样本的程序文件数
+
+    Returns:
+        list: [(相对样本第一个文件的序号, 几何文件名格式, 文件内容)]，导出失败的几何被跳过
+    """
+    if not geometry:
+        return []
+    pattern = geometry_file_pattern(geometry['format'])
+    if geometry.get('steps') is not None:
+        if layout != 'sequence':
+            raise ValueError("每一步的几何只能在逐步布局（sequence）中保存")
+        return [(i, pattern, data) for i, data in enumerate(geometry['steps']) if data is not None]
+    if geometry.get('final') is None:
+        return []
+    return [(file_count - 1, pattern, geometry['final'])]
+
+
+def write_step_files(allocator, step_codes, codec=None, geometry_files=(), before_commit=None):
+    """
+    为一个样本分配连续编号并逐个写入步骤文件（临时文件+重命名），全部写入后提交
+
+    Args:
+        allocator: 文件编号分配器
+        step_codes: 文件内容列表
+        codec: ProgramCodec，指定时写入压缩后的内容
+        geometry_files: 与程序文件同编号的几何文件，格式见build_geometry_files
+        before_commit: 全部文件写入后、提交编号前调用，参数为第一个文件的编号；抛出异常时与写入失败相同
+
+    Returns:
+        int: 该样本第一个文件的编号
+    """
+    start_index = allocator.allocate(len(step_codes))
+    try:
+        for i, step_code in enumerate(step_codes):
+            if codec is None:
+                atomic_write_text(allocator.file_path(start_index + i), step_code)
+            else:
+                atomic_write_bytes(allocator.file_path(start_index + i), codec.encode(step_code))
+        for i, pattern, data in geometry_files:
+            atomic_write_bytes(allocator.companion_path(start_index + i, pattern), data)
+        if before_commit is not None:
+            before_commit(start_index)
+    except BaseException:
+        # 写入失败（包括用户中断）时删除该样本已写入的文件
+        allocator.release(start_index)
+        raise
+    allocator.commit(start_index)
+    return start_index
+
+
+def _file_pattern(codec):
+    return DEFAULT_FILE_PATTERN if codec is None else DEFAULT_FILE_PATTERN + COMPRESSED_SUFFIX
+
+
+def _companion_patterns(geometry_format):
+    return () if geometry_format is None else (geometry_file_pattern(geometry_format),)
+
+
+class DirectoryBackend:
+    """
+    默认目录布局：文件保存为 batch_N/cad_model_{编号}.py（压缩时为 .py.zst）
+
+    before_commit为每次提交编号前调用的函数（无参数），如提交元数据索引的事务（见processors.sample_writer），
+    已提交的样本的索引行不会因崩溃而丢失。
+    """
+
+    def __init__(self, base_dir, batch_size=10000, layout='sequence', codec=None, geometry_format=None):
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+        self.layout = layout
+        self.codec = codec
+        self.allocator = get_index_allocator(base_dir, batch_size, reset=True, file_pattern=_file_pattern(codec),
+                                             companion_patterns=_companion_patterns(geometry_format))
+        self.last_sample = None  # 最近写入的样本位置，见write_sample
+        self.before_commit = None
+
+    def write_sample(self, cq_code, geometry=None):
+        """
+        写入一个样本
+
+        写入后last_sample记录该样本的位置：{'first_index': 第一个文件的编号,
+        'file_count': 文件数, 'path': 第一个文件相对于数据集根目录的路径}
+
+        Args:
+            cq_code: 完整程序
+            geometry: 样本记录中的'geometry'，指定时同时写入几何文件
+
+        Returns:
+            int: 样本步数（sequence布局下即写入的文件数）
+        """
+        step_count, _ = self.write_samples([cq_code], [geometry])[0]
+        return step_count
+
+    def write_samples(self, cq_codes, geometries=None, on_written=None):
+        """
+        批量写入多个样本：所有文件使用一段连续编号，只分配、提交一次（状态文件各写一次），
+        任一文件写入失败时整批作废
+
+        Args:
+            cq_codes: 完整程序列表
+            geometries: 与cq_codes对应的样本几何列表（见write_sample），为None时不写入几何文件
+            on_written: 每个样本的文件写入后、编号提交前调用 on_written(样本序号, 位置)，
+                如写入元数据索引行；抛出异常时整批作废
+
+        Returns:
+            list: 每个样本的 (步数, 位置)，位置格式同last_sample
+        """
+        built = [build_sample_files(cq_code, self.layout) for cq_code in cq_codes]
+        geometry_files = []
+        offset = 0
+        for (file_contents, _), geometry in zip(built, geometries or [None] * len(built)):
+            geometry_files += [(offset + i, pattern, data)
+                               for i, pattern, data in build_geometry_files(geometry, self.layout, len(file_contents))]
+            offset += len(file_contents)
+        results = []
+
+        def before_commit(start_index):
+            for i, (file_contents, step_count) in enumerate(built):
+                location = {
+                    'first_index': start_index,
+                    'file_count': len(file_contents),
+                    'path': self._relative_path(start_index),
+                }
+                results.append((step_count, location))
+                if on_written is not None:
+                    on_written(i, location)
+                start_index += len(file_contents)
+            if self.before_commit is not None:
+                self.before_commit()
+
+        write_step_files(self.allocator, [content for contents, _ in built for content in contents],
+                         self.codec, geometry_files, before_commit)
+        if results:
+            self.last_sample = results[-1][1]
+        return results
+
+    def _relative_path(self, index):
+        return os.path.relpath(self.allocator.file_path(index, create_dir=False), self.base_dir)
+
+    def close(self):
+        pass
+
+
+class ShardBackend:
+    """
+    分片布局：shards/shard_{序号}.tar（压缩时为shard_{序号}.zst，即各文件zstd帧的直接拼接）
+
+    每个分片最多包含shard_size个文件（成员名与目录布局中的文件名相同），
+    分片写满后生成索引文件 shard_{序号}.idx.json，记录每个成员在分片中的数据偏移和长度，
+    读取单个文件时可直接定位，无需解析整个分片。
+
+    写入中的分片使用 .tmp 后缀。关闭分片时先写入索引的临时文件，再一次性提交分片中所有样本的编号，
+    最后重命名分片和索引。下次启动时：
+    - 编号已提交但尚未重命名的分片（崩溃发生在提交之后）完成重命名
+    - 其余未完成的分片丢弃，编号分配器同时回退到已提交的位置
+    新分片的序号为已有分片的最大序号加1，缺少个别索引文件时也不会覆盖已有分片。
+
+    before_commit为提交分片中样本的编号前调用的函数（无参数），同DirectoryBackend。
+    """
+
+    def __init__(self, base_dir, batch_size=10000, shard_size=10000, layout='sequence', codec=None,
+                 geometry_format=None):
+        """
+        Args:
+            base_dir: 数据集根目录
+            batch_size: 文件编号分配器使用的批次大小
+            shard_size: 每个分片最多包含的文件数（包括几何文件）
+            layout: 样本存储方式，'sequence'或'program'
+            codec: ProgramCodec，指定时压缩每个文件
+            geometry_format: 样本几何的格式（分片布局中几何文件随分片一起提交，不需要单独清理，仅作记录）
+        """
+        self.base_dir = base_dir
+        self.shard_size = shard_size
+        self.layout = layout
+        self.codec = codec
+        self.geometry_format = geometry_format
+        self.shards_dir = os.path.join(base_dir, "shards")
+        os.makedirs(self.shards_dir, exist_ok=True)
+        self.allocator = get_index_allocator(base_dir, batch_size, reset=True, file_pattern=_file_pattern(codec))
+
+        self._recover_shards()
+        shard_numbers = [int(match.group(1)) for match in map(SHARD_NAME_PATTERN.match, os.listdir(self.shards_dir))
+                         if match]
+        self._next_shard = max(shard_numbers) + 1 if shard_numbers else 0
+
+        self._tar = None
+        self._fileobj = None
+        self._entries = []
+        self._pending_starts = []  # 当前分片中尚未提交的样本起始编号
+        self.last_sample = None  # 最近写入的样本位置，见write_sample
+        self.before_commit = None
+
+    def _recover_shards(self):
+        """完成上次运行中编号已提交但未重命名的分片，丢弃其余未完成的分片"""
+        for name in os.listdir(self.shards_dir):
+            if not name.endswith(".idx.json.tmp"):
+                continue
+            index_tmp_path = os.path.join(self.shards_dir, name)
+            try:
+                with open(index_tmp_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except json.JSONDecodeError:
+                continue  # 索引未写完，分片的编号必然未提交
+            shard_path = os.path.join(self.shards_dir, index["shard"])
+            committed = all(self.allocator.is_committed(start) for start in index["sample_starts"])
+            if committed and (os.path.exists(shard_path + ".tmp") or os.path.exists(shard_path)):
+                if os.path.exists(shard_path + ".tmp"):
+                    os.replace(shard_path + ".tmp", shard_path)
+                os.replace(index_tmp_path, index_tmp_path[:-len(".tmp")])
+        for name in os.listdir(self.shards_dir):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.shards_dir, name))
+
+    def _shard_path(self, shard_number):
+        extension = ".tar" if self.codec is None else COMPRESSED_SUFFIX
+        return os.path.join(self.shards_dir, f"shard_{shard_number:06d}{extension}")
+
+    def _open_shard(self):
+        self._fileobj = open(self._shard_path(self._next_shard) + ".tmp", "wb")
+        if self.codec is None:
+            self._tar = tarfile.open(fileobj=self._fileobj, mode="w", format=tarfile.GNU_FORMAT)
+        self._entries = []
+        self._pending_starts = []
+
+    def _add_entry(self, name, data):
+        if self._tar is None:
+            # 压缩分片：直接追加zstd帧
+            self._entries.append({"name": name, "offset": self._fileobj.tell(), "size": len(data)})
+            self._fileobj.write(data)
+            return
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = len(data)
+        self._tar.addfile(tar_info, io.BytesIO(data))
+        # addfile之后tar.offset指向已按512字节对齐的成员末尾，由此反推数据起始偏移
+        padded_size = (len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+        self._entries.append({
+            "name": name,
+            "offset": self._tar.offset - padded_size,
+            "size": len(data),
+        })
+
+    def _close_shard(self):
+        """
+        完成当前分片：写入索引的临时文件，一次性提交其中样本的编号，再重命名分片和索引
+
+        提交之前崩溃时分片在下次启动时丢弃，提交之后崩溃时由_recover_shards完成重命名，
+        不会出现编号已回退、分片却已发布（编号被重复分配）的情况。
+        """
+        if self._fileobj is None:
+            return
+        if self._tar is not None:
+            self._tar.close()
+        self._fileobj.close()
+        shard_path = self._shard_path(self._next_shard)
+        index_path = os.path.splitext(shard_path)[0] + ".idx.json"
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "shard": os.path.basename(shard_path),
+                "sample_starts": self._pending_starts,
+                "entries": self._entries,
+            }, f)
+        if self.before_commit is not None:
+            self.before_commit()
+        self.allocator.commit_many(self._pending_starts)
+        os.replace(shard_path + ".tmp", shard_path)
+        os.replace(index_path + ".tmp", index_path)
+
+        self._next_shard += 1
+        self._tar = None
+        self._fileobj = None
+        self._entries = []
+        self._pending_starts = []
+
+    def write_sample(self, cq_code, geometry=None):
+        """
+        将一个样本的文件（及几何文件）追加到当前分片
+
+        写入后last_sample记录该样本的位置（格式同DirectoryBackend），
+        path为"shards/分片文件名#第一个文件的成员名"
+
+        Args:
+            cq_code: 完整程序
+            geometry: 样本记录中的'geometry'，指定时同时写入几何文件
+
+        Returns:
+            int: 样本步数（sequence布局下即写入的文件数）
+        """
+        step_count = self._append_sample(cq_code, geometry)
+        self._close_if_full()
+        return step_count
+
+    def _append_sample(self, cq_code, geometry):
+        file_contents, step_count = build_sample_files(cq_code, self.layout)
+        geometry_files = build_geometry_files(geometry, self.layout, len(file_contents))
+        if self._fileobj is None:
+            self._open_shard()
+
+        start_index = self.allocator.allocate(len(file_contents))
+        self._pending_starts.append(start_index)
+        for i, content in enumerate(file_contents):
+            name = self.allocator.file_pattern.format(index=start_index + i)
+            self._add_entry(name, content.encode("utf-8") if self.codec is None else self.codec.encode(content))
+        for i, pattern, data in geometry_files:
+            self._add_entry(pattern.format(index=start_index + i), data)
+        first_name = self.allocator.file_pattern.format(index=start_index)
+        self.last_sample = {
+            'first_index': start_index,
+            'file_count': len(file_contents),
+            'path': f"shards/{os.path.basename(self._shard_path(self._next_shard))}#{first_name}",
+        }
+        return step_count
+
+    def _close_if_full(self):
+        if len(self._entries) >= self.shard_size:
+            self._close_shard()
+
+    def write_samples(self, cq_codes, geometries=None, on_written=None):
+        """
+        依次将多个样本追加到分片（分片本身已按shard_size批量提交）
+
+        Args:
+            cq_codes, geometries: 同DirectoryBackend.write_samples
+            on_written: 每个样本追加到分片后调用 on_written(样本序号, 位置)，在该样本所在分片提交之前
+
+        Returns:
+            list: 每个样本的 (步数, 位置)，位置格式同last_sample
+        """
+        geometries = geometries or [None] * len(cq_codes)
+        results = []
+        for i, (cq_code, geometry) in enumerate(zip(cq_codes, geometries)):
+            step_count = self._append_sample(cq_code, geometry)
+            results.append((step_count, self.last_sample))
+            if on_written is not None:
+                on_written(i, self.last_sample)
+            self._close_if_full()
+        return results
+
+    def close(self):
+        """完成当前未写满的分片"""
+        self._close_shard()
+
+
+def create_output_backend(output_format, base_dir, batch_size=10000, shard_size=10000, layout='sequence',
+                          codec=None, geometry_format=None):
+    """
+    按名称创建输出后端
+
+    Args:
+        output_format: 'dir'（默认目录布局）或 'shard'（tar分片）
+        base_dir: 数据集根目录
+        batch_size: 每批文件数量
+        shard_size: 每个分片最多包含的文件数（仅shard格式使用）
+        layout: 样本存储方式，'sequence'（每步一个文件）或'program'（前缀去重）
+        codec: ProgramCodec，指定时压缩每个文件（见processors.compression）
+        geometry_format: 样本几何的格式（'step'、'stl'或'brep'），样本记录带有几何时需指定，
+            用于清理未提交样本的几何文件
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知的存储方式: {layout}，可选值为 {LAYOUTS}")
+    if output_format == 'dir':
+        return DirectoryBackend(base_dir, batch_size, layout, codec, geometry_format)
+    if output_format == 'shard':
+        return ShardBackend(base_dir, batch_size, shard_size, layout, codec, geometry_format)
+    raise ValueError(f"未知的输出格式: {output_format}，可选值为 {OUTPUT_FORMATS}")
+
+
+def iter_shard_files(base_dir, codec=None, include_geometry=False):
+    """
+    按分片顺序读取打包布局中的所有文件
+
+    Args:
+        base_dir: 数据集根目录
+        codec: ProgramCodec，为None时遇到压缩文件才读取数据集目录中的字典
+        include_geometry: 是否同时给出几何文件（默认跳过）
+
+    Yields:
+        tuple: (文件名, 文件内容)，程序文件内容为str（压缩文件已解压，文件名去掉 .zst 后缀），
+        几何文件内容为bytes
+    """
+    shards_dir = os.path.join(base_dir, "shards")
+    index_names = sorted(name for name in os.listdir(shards_dir) if name.endswith(".idx.json"))
+    for index_name in index_names:
+        with open(os.path.join(shards_dir, index_name), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        with open(os.path.join(shards_dir, index["shard"]), "rb") as shard_file:
+            for entry in index["entries"]:
+                name = entry["name"]
+                is_geometry = not name.endswith((".py", ".py" + COMPRESSED_SUFFIX))
+                if is_geometry and not include_geometry:
+                    continue
+                shard_file.seek(entry["offset"])
+                data = shard_file.read(entry["size"])
+                if is_geometry:
+                    yield name, data
+                    continue
+                if not name.endswith(COMPRESSED_SUFFIX):
+                    yield name, data.decode("utf-8")
+                    continue
+                if codec is None:
+                    codec = ProgramCodec.load(base_dir)
+                    if codec is None:
+                        raise FileNotFoundError(f"数据集 {base_dir} 中有压缩文件，但缺少zstd字典")
+                yield name[:-len(COMPRESSED_SUFFIX)], codec.decode(data)
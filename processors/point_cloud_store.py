@@ -0,0 +1,293 @@
+"""
+点云存储：每个样本一个固定大小的点云（点数 × [x, y, z, nx, ny, nz]），按样本编号读取，数据通过mmap加载
+
+目录结构（默认为数据集目录下的point_clouds）：
+- meta.json：版本、每个点云的点数、dtype（float16或float32）
+- points.bin：(行数, 点数, 6)，坐标已归一化（减去包围盒中心、除以到中心的最大距离，位于单位球内），
+  使float16也有足够的精度；法向为单位向量
+- transforms.bin：(行数, 4) float32，每行的 [中心x, 中心y, 中心z, 缩放]，用于还原原始坐标
+- sample_ids.bin：(行数,) int64，每行对应的样本编号（与元数据索引的sample_id一致）
+
+三个文件只追加写入，sample_ids最后写入：打开时以三个文件中最少的完整行数为准，崩溃时写了一半的行被截掉。
+同一样本编号写入多次时（崩溃恢复后编号被重新分配）以最后一次为准。
+
+点云可以在生成时得到（generate_training_dataset(point_cloud_points=...)，由验证工作进程对已有的result剖分），
+也可以对已有数据集离线补充：
+    python -m processors.point_cloud_store --base-dir ../data/SyntheticData --points 2048 --workers 4
+
+读取：
+    store = PointCloudStore("../data/SyntheticData/point_clouds")
+    points, normals = store.get(sample_id)      # 原始坐标
+    batch = store.batch(sample_ids)             # (批大小, 点数, 6) 归一化坐标，一次索引读取
+"""
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from tqdm import tqdm
+
+from generators.code_validator import ValidatorPool
+from generators.point_cloud import DEFAULT_POINT_COUNT, parse_stl, sample_point_cloud
+from processors.token_export import iter_dataset_programs
+
+
+POINT_CLOUD_DIR_NAME = "point_clouds"
+POINT_CLOUD_DTYPES = ('float16', 'float32')
+STORE_VERSION = 1
+
+_CHANNELS = 6
+_TRANSFORM_DTYPE = np.dtype(np.float32)
+_ID_DTYPE = np.dtype(np.int64)
+
+
+class PointCloudStore:
+    """
+    按样本编号保存固定大小点云的追加式存储（写入与读取可在同一个实例中交替进行，但不是线程安全的）
+    """
+
+    def __init__(self, path, point_count=None, dtype=None):
+        """
+        Args:
+            path: 存储目录，不存在时创建
+            point_count: 每个点云的点数（创建时默认DEFAULT_POINT_COUNT，打开已有存储时必须与其一致或为None）
+            dtype: 'float16'或'float32'（创建时默认float32，打开已有存储时同上）
+        """
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if self.meta["version"] != STORE_VERSION:
+                raise ValueError(f"不支持的点云存储版本: {self.meta['version']}")
+            for key, value in (("point_count", point_count), ("dtype", dtype)):
+                if value is not None and value != self.meta[key]:
+                    raise ValueError(f"点云存储 {path} 的{key}为 {self.meta[key]}，与当前设置 {value} 不一致")
+        else:
+            dtype = dtype or 'float32'
+            if dtype not in POINT_CLOUD_DTYPES:
+                raise ValueError(f"不支持的点云dtype: {dtype}，可选值为 {POINT_CLOUD_DTYPES}")
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"version": STORE_VERSION, "point_count": point_count or DEFAULT_POINT_COUNT, "dtype": dtype}
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(self.meta, f)
+
+        self.point_count = self.meta["point_count"]
+        self.dtype = np.dtype(self.meta["dtype"])
+        self._row_shape = (self.point_count, _CHANNELS)
+        self._row_bytes = self.point_count * _CHANNELS * self.dtype.itemsize
+        self._points_path = os.path.join(path, "points.bin")
+        self._transforms_path = os.path.join(path, "transforms.bin")
+        self._ids_path = os.path.join(path, "sample_ids.bin")
+
+        # 以三个文件中完整的行数为准，截掉崩溃时写了一半的行
+        sizes = [
+            self._file_size(self._points_path) // self._row_bytes,
+            self._file_size(self._transforms_path) // (4 * _TRANSFORM_DTYPE.itemsize),
+            self._file_size(self._ids_path) // _ID_DTYPE.itemsize,
+        ]
+        self._row_count = min(sizes)
+        for file_path, row_bytes in ((self._points_path, self._row_bytes),
+                                     (self._transforms_path, 4 * _TRANSFORM_DTYPE.itemsize),
+                                     (self._ids_path, _ID_DTYPE.itemsize)):
+            with open(file_path, "ab") as f:
+                f.truncate(self._row_count * row_bytes)
+
+        ids = np.fromfile(self._ids_path, dtype=_ID_DTYPE, count=self._row_count)
+        self._rows = {int(sample_id): row for row, sample_id in enumerate(ids)}
+        self._files = None
+        self._mapped_rows = -1  # 当前mmap覆盖的行数
+
+    @staticmethod
+    def _file_size(file_path):
+        return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, sample_id):
+        return int(sample_id) in self._rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def sample_ids(self):
+        """已保存的样本编号（升序）"""
+        return np.array(sorted(self._rows), dtype=_ID_DTYPE)
+
+    def add(self, sample_id, points, normals):
+        """
+        追加一个样本的点云
+
+        Args:
+            sample_id: 样本编号
+            points: (点数, 3) 原始坐标
+            normals: (点数, 3) 单位法向
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.shape != (self.point_count, 3):
+            raise ValueError(f"点云形状应为 ({self.point_count}, 3)，实际为 {points.shape}")
+        center = (points.min(axis=0) + points.max(axis=0)) / 2
+        scale = float(np.sqrt(((points - center) ** 2).sum(axis=1).max())) or 1.0
+        row = np.empty(self._row_shape, dtype=self.dtype)
+        row[:, :3] = (points - center) / scale
+        row[:, 3:] = normals
+
+        if self._files is None:
+            self._files = [open(file_path, "ab") for file_path in
+                           (self._points_path, self._transforms_path, self._ids_path)]
+        points_file, transforms_file, ids_file = self._files
+        points_file.write(row.tobytes())
+        transforms_file.write(np.array([*center, scale], dtype=_TRANSFORM_DTYPE).tobytes())
+        ids_file.write(np.array([sample_id], dtype=_ID_DTYPE).tobytes())
+        self._rows[int(sample_id)] = self._row_count
+        self._row_count += 1
+
+    def flush(self):
+        if self._files is not None:
+            for f in self._files:
+                f.flush()
+
+    def _mapped(self):
+        """写入后首次读取时刷新缓冲区并重新映射文件"""
+        if self._mapped_rows != self._row_count:
+            self.flush()
+            if self._row_count:
+                self._points = np.memmap(self._points_path, dtype=self.dtype, mode='r',
+                                         shape=(self._row_count, *self._row_shape))
+                self._transforms = np.memmap(self._transforms_path, dtype=_TRANSFORM_DTYPE, mode='r',
+                                             shape=(self._row_count, 4))
+            else:
+                self._points = np.zeros((0, *self._row_shape), dtype=self.dtype)
+                self._transforms = np.zeros((0, 4), dtype=_TRANSFORM_DTYPE)
+            self._mapped_rows = self._row_count
+        return self._points, self._transforms
+
+    def _row(self, sample_id):
+        try:
+            return self._rows[int(sample_id)]
+        except KeyError:
+            raise KeyError(f"点云存储中没有样本 {sample_id}") from None
+
+    def get(self, sample_id, normalized=False):
+        """
+        读取一个样本的点云
+
+        Args:
+            sample_id: 样本编号
+            normalized: 为True时返回归一化坐标（存储中的原始值），否则还原为原始坐标
+
+        Returns:
+            tuple: (points (点数, 3) float32, normals (点数, 3) float32)
+        """
+        points, transforms = self._mapped()
+        row = self._row(sample_id)
+        data = np.asarray(points[row], dtype=np.float32)
+        if normalized:
+            return data[:, :3], data[:, 3:]
+        center, scale = transforms[row, :3], transforms[row, 3]
+        return data[:, :3] * scale + center, data[:, 3:]
+
+    def batch(self, sample_ids):
+        """
+        读取一批样本的归一化点云
+
+        Returns:
+            np.ndarray: (批大小, 点数, 6)，dtype与存储一致
+        """
+        points, _ = self._mapped()
+        return points[[self._row(sample_id) for sample_id in sample_ids]]
+
+    def close(self):
+        if self._files is not None:
+            for f in self._files:
+                f.close()
+            self._files = None
+
+
+def _sample_program(pool, code, point_count, rng):
+    """在验证工作进程中执行程序并导出剖分结果，在当前线程中采样"""
+    with pool.session(code) as session:
+        success, data, error_msg = session.export('stl')
+    if not success:
+        raise RuntimeError(error_msg)
+    return sample_point_cloud(parse_stl(data), point_count, rng)
+
+
+def build_point_clouds(base_dir, store_path=None, point_count=None, dtype=None, workers=1, seed=0,
+                       limit=None, quiet=False):
+    """
+    离线为已有数据集补充点云：重新执行每个尚无点云的样本的完整程序，剖分后采样
+
+    Args:
+        base_dir: 数据集根目录
+        store_path: 点云存储目录，默认为数据集目录下的point_clouds
+        point_count, dtype: 见PointCloudStore
+        workers: 并行执行程序的验证工作进程数
+        seed: 采样种子，每个样本使用由(seed, 样本编号)派生的随机数生成器
+        limit: 最多处理的样本数
+        quiet: 不显示进度条
+
+    Returns:
+        tuple: (新增的点云数, 失败的样本数)
+    """
+    store = PointCloudStore(store_path or os.path.join(base_dir, POINT_CLOUD_DIR_NAME), point_count, dtype)
+    added = failed = 0
+    pending = {}
+    with ValidatorPool(size=workers) as pool, ThreadPoolExecutor(max_workers=workers) as executor, \
+            tqdm(desc="采样点云", unit="样本", disable=quiet) as pbar:
+        def collect(done):
+            nonlocal added, failed
+            for future in done:
+                sample_id = pending.pop(future)
+                try:
+                    store.add(sample_id, *future.result())
+                    added += 1
+                except Exception as e:
+                    failed += 1
+                    tqdm.write(f"样本 {sample_id} 采样点云失败（已跳过）：{type(e).__name__}: {e}")
+                pbar.update(1)
+
+        try:
+            for sample_id, lines, _ in iter_dataset_programs(base_dir):
+                if sample_id in store:
+                    continue
+                if limit is not None and added + failed + len(pending) >= limit:
+                    break
+                rng = np.random.default_rng([seed, sample_id])
+                future = executor.submit(_sample_program, pool, "\n".join(lines), store.point_count, rng)
+                pending[future] = sample_id
+                # 在途任务不超过工作进程数的2倍，避免一次读入整个数据集
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(wait(pending).done)
+        finally:
+            store.close()
+    return added, failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from generators.metrics import configure_logging
+
+    parser = argparse.ArgumentParser(description='为已有数据集离线采样表面点云')
+    parser.add_argument('--base-dir', default='../data/SyntheticData', help='数据集目录')
+    parser.add_argument('--output', default=None, help='点云存储目录（默认为数据集目录下的point_clouds）')
+    parser.add_argument('--points', type=int, default=None, help=f'每个点云的点数（默认{DEFAULT_POINT_COUNT}）')
+    parser.add_argument('--dtype', choices=POINT_CLOUD_DTYPES, default=None, help='存储精度（默认float32）')
+    parser.add_argument('--workers', type=int, default=1, help='并行执行程序的进程数（默认1）')
+    parser.add_argument('--seed', type=int, default=0, help='采样种子（默认0）')
+    parser.add_argument('--limit', type=int, default=None, help='最多处理的样本数（默认全部）')
+    parser.add_argument('--quiet', action='store_true', help='不显示进度条')
+    args = parser.parse_args()
+    configure_logging('ERROR' if args.quiet else 'WARNING')
+
+    added, failed = build_point_clouds(args.base_dir, args.output, args.points, args.dtype, args.workers,
+                                       args.seed, args.limit, args.quiet)
+    print(f"新增 {added} 个点云，失败 {failed} 个")
@@ -0,0 +1,288 @@
+"""
+流式样本生成接口：直接产出样本记录，不经过文件系统
+
+样本记录（dict）：
+- 'code'：完整程序（与前缀去重布局中的正文一致）
+- 'step_boundaries'：每一步结束的行号，第i步的代码即code的前step_boundaries[i]行
+- 'steps'：每一步的元数据（平面、草图ID、拉伸高度、布尔运算、体积、包围盒、实体数、面数）
+- 'geometry'（仅指定geometry_format时）：验证工作进程直接导出的几何文件内容
+  {'format': 格式, 'final': 最终result的bytes, 'steps': 每一步的bytes列表（仅geometry_steps时，否则为None）}，
+  导出失败的项为None
+- 'point_cloud'（仅指定point_count且采样成功时）：最终result的表面点云 (points, normals)，均为 (点数, 3) float32
+
+按种子生成时（generate_seeded_sample / iter_samples(seed=...)），记录中还包含：
+- 'index'：样本编号
+- 'seed'：全局种子
+- 'attempt'：得到该样本时的尝试序号（前几次尝试没有任何有效步骤时递增）
+样本内容只由(全局种子, 样本编号)决定，可在任意机器上按编号重新生成。
+"""
+import hashlib
+import logging
+import os
+import random
+import signal
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from generators.code_generator import CADCodeGenerator
+from generators.metrics import configure_logging, get_metrics
+from processors.step_sequence import compute_step_boundaries
+
+
+logger = logging.getLogger(__name__)
+
+
+def sample_seed(global_seed, index, attempt=0):
+    """
+    由全局种子和样本编号派生该样本的随机种子
+
+    使用哈希而不是Python的hash()，结果与进程、平台和PYTHONHASHSEED无关；
+    相邻编号的种子互不相关。
+
+    Returns:
+        int: 64位种子
+    """
+    key = f"{global_seed}:{index}:{attempt}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def generate_sample(min_opera_cnt=1, max_opera_cnt=10, rng=None, geometry_format=None, geometry_steps=False,
+                    point_count=None, candidates=1, candidate_select='first', sampler=None):
+    """
+    生成单个样本记录
+
+    Args:
+        min_opera_cnt, max_opera_cnt: 拉伸次数范围
+        rng: 随机数生成器（random.Random），为None时使用全局random模块
+        geometry_format: 几何导出格式（'step'、'stl'或'brep'），为None时不导出
+        geometry_steps: 是否同时导出每一步的几何
+        point_count: 表面点云的点数，为None时不采样
+        candidates, candidate_select: 每次循环的候选步骤数及选择方式（推测式验证，见CADCodeGenerator）
+        sampler: 自适应抽样器，None为默认抽样器，False为强制均匀抽样（见CADCodeGenerator）
+
+    Returns:
+        dict or None: 样本记录，生成0次拉伸（没有任何步骤）时返回None
+    """
+    metrics = get_metrics()
+    generator = CADCodeGenerator(min_opera_cnt, max_opera_cnt, rng=rng, geometry_format=geometry_format,
+                                 geometry_steps=geometry_steps, point_count=point_count, candidates=candidates,
+                                 candidate_select=candidate_select, sampler=sampler)
+    with metrics.timer('sample'):
+        cq_code = generator.generate_cq_code()
+    if not generator.accepted_steps:
+        metrics.count('sample.empty')
+        return None
+    metrics.count('sample.generated')
+
+    body, step_line_counts = compute_step_boundaries(cq_code)
+    record = {
+        'code': body,
+        'step_boundaries': step_line_counts,
+        'steps': generator.accepted_steps,
+    }
+    if geometry_format is not None:
+        record['geometry'] = {
+            'format': geometry_format,
+            'final': generator.final_geometry,
+            'steps': generator.step_geometries if generator.geometry_steps else None,
+        }
+    if generator.point_cloud is not None:
+        record['point_cloud'] = generator.point_cloud
+    return record
+
+
+def generate_seeded_sample(global_seed, index, min_opera_cnt=1, max_opera_cnt=10, max_attempts=10,
+                           geometry_format=None, geometry_steps=False, point_count=None, candidates=1,
+                           candidate_select='first'):
+    """
+    生成编号为index的样本，结果只由(global_seed, index)决定
+
+    某次尝试没有任何有效步骤时，使用下一个派生种子重新生成，保证每个编号都对应一个样本。
+    始终均匀抽样（不使用自适应抽样器），结果不受进程内之前生成过的样本影响。
+
+    Returns:
+        dict or None: 样本记录（含'index'、'seed'、'attempt'），max_attempts次尝试均失败时返回None
+    """
+    for attempt in range(max_attempts):
+        rng = random.Random(sample_seed(global_seed, index, attempt))
+        record = generate_sample(min_opera_cnt, max_opera_cnt, rng=rng, geometry_format=geometry_format,
+                                 geometry_steps=geometry_steps, point_count=point_count, candidates=candidates,
+                                 candidate_select=candidate_select, sampler=False)
+        if record is not None:
+            record['index'] = index
+            record['seed'] = global_seed
+            record['attempt'] = attempt
+            return record
+    return None
+
+
+def _init_generation_worker():
+    """并行生成工作进程的初始化函数"""
+    # Ctrl+C 由主进程统一处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 每个进程使用独立的随机状态，避免不同进程生成相同的样本
+    random.seed()
+    # 工作进程逐循环的输出会打乱主进程的进度条，错误信息通过返回值交给主进程输出
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    # 日志级别与主进程一致（主进程调用configure_logging时写入环境变量）
+    configure_logging()
+
+
+def _generate_sample_in_worker(min_opera_cnt, max_opera_cnt, global_seed=None, index=None,
+                               geometry_format=None, geometry_steps=False, point_count=None, candidates=1,
+                               candidate_select='first'):
+    """
+    在工作进程中生成单个样本（global_seed为None时不使用种子）
+
+    Returns:
+        tuple: (success: bool, record or error_message, 生成该样本期间的指标snapshot)
+    """
+    metrics = get_metrics()
+    metrics.reset()
+    try:
+        options = {'geometry_format': geometry_format, 'geometry_steps': geometry_steps, 'point_count': point_count,
+                   'candidates': candidates, 'candidate_select': candidate_select}
+        if global_seed is None:
+            return True, generate_sample(min_opera_cnt, max_opera_cnt, **options), metrics.snapshot()
+        record = generate_seeded_sample(global_seed, index, min_opera_cnt, max_opera_cnt, **options)
+        return True, record, metrics.snapshot()
+    except Exception as e:
+        if index is not None:
+            return False, f"样本{index}：{type(e).__name__}: {e}", metrics.snapshot()
+        return False, f"{type(e).__name__}: {e}", metrics.snapshot()
+
+
+def _report_error(message):
+    logger.warning("生成样本时出错（已跳过）：%s", message)
+
+
+def iter_samples(n=None, workers=0, queue_size=None, min_opera_cnt=1, max_opera_cnt=10, on_error=None,
+                 seed=None, start_index=0, geometry_format=None, geometry_steps=False, point_count=None,
+                 candidates=1, candidate_select='first'):
+    """
+    逐个产出样本记录
+
+    Args:
+        n: 产出的样本数，None表示无限产出（由调用者停止迭代）；
+            按种子生成时为样本编号数，即产出编号start_index到start_index+n-1中成功生成的样本
+        workers: 并行生成的进程数，0或1表示在当前进程中按需生成
+        queue_size: 并行模式下最多同时在途（生成中或已完成但尚未被取走）的样本数，
+            默认为workers的2倍；消费者不取样本时不会提交新任务（背压）
+        min_opera_cnt, max_opera_cnt: 每个样本的拉伸次数范围
+        on_error: 生成出错时的回调，参数为错误信息（默认记录为WARNING日志），出错的样本被跳过
+        seed: 全局种子，指定时样本内容只由(seed, 编号)决定；
+            并行模式下按完成顺序产出，可通过记录中的'index'还原顺序
+        start_index: 按种子生成时的起始样本编号
+        geometry_format, geometry_steps, point_count: 几何导出格式、是否导出每一步的几何及点云点数（见generate_sample）
+        candidates, candidate_select: 推测式验证的候选步骤数及选择方式（见generate_sample），
+            并行模式下每个生成进程使用candidates个验证工作进程
+
+    Yields:
+        dict: 样本记录
+    """
+    if on_error is None:
+        on_error = _report_error
+
+    # 按种子生成时只提交指定范围内的编号，使产出的样本集合与并行方式和完成顺序无关
+    end_index = start_index + n if seed is not None and n is not None else None
+
+    if workers <= 1:
+        produced = 0
+        index = start_index
+        while (n is None or produced < n) and (end_index is None or index < end_index):
+            try:
+                if seed is None:
+                    record = generate_sample(min_opera_cnt, max_opera_cnt, geometry_format=geometry_format,
+                                             geometry_steps=geometry_steps, point_count=point_count,
+                                             candidates=candidates, candidate_select=candidate_select)
+                else:
+                    record = generate_seeded_sample(seed, index, min_opera_cnt, max_opera_cnt,
+                                                    geometry_format=geometry_format, geometry_steps=geometry_steps,
+                                                    point_count=point_count, candidates=candidates,
+                                                    candidate_select=candidate_select)
+            except (ValueError, RuntimeError, AttributeError) as e:
+                get_metrics().count('sample.error')
+                on_error(f"{type(e).__name__}: {e}" if seed is None else f"样本{index}：{type(e).__name__}: {e}")
+                continue
+            finally:
+                index += 1
+            if record is None:
+                continue
+            produced += 1
+            yield record
+        return
+
+    yield from _iter_samples_parallel(n, workers, queue_size or workers * 2, min_opera_cnt, max_opera_cnt,
+                                      on_error, seed, start_index, end_index, geometry_format, geometry_steps,
+                                      point_count, candidates, candidate_select)
+
+
+def _iter_samples_parallel(n, workers, queue_size, min_opera_cnt, max_opera_cnt, on_error,
+                           seed, start_index, end_index, geometry_format=None, geometry_steps=False,
+                           point_count=None, candidates=1, candidate_select='first'):
+    """
+    多进程并行产出样本
+
+    每个任务只生成一个样本，空闲的工作进程立即领取下一个任务，
+    使样本耗时差异很大时各进程的负载依然均衡。
+    """
+    context = multiprocessing.get_context('spawn')
+
+    def create_executor():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_generation_worker
+        )
+
+    executor = create_executor()
+    pending = {}  # future -> 样本编号（不使用种子时为None）
+    produced = 0
+    next_index = start_index
+    try:
+        while n is None or produced < n:
+            # 只在消费者取走样本后补充任务，在途样本数不超过queue_size
+            while len(pending) < queue_size and (end_index is None or next_index < end_index):
+                index = None if seed is None else next_index
+                next_index += 1
+                future = executor.submit(_generate_sample_in_worker, min_opera_cnt, max_opera_cnt, seed, index,
+                                         geometry_format, geometry_steps, point_count, candidates,
+                                         candidate_select)
+                pending[future] = index
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    success, payload, worker_metrics = future.result()
+                except BrokenProcessPool:
+                    # 某个工作进程崩溃（如草图生成中的OCC异常），重建进程池后继续；
+                    # 在途的样本全部丢弃（按种子生成时报告其编号）
+                    lost = [i for i in [index, *pending.values()] if i is not None]
+                    message = "生成工作进程异常退出，已重建进程池"
+                    if lost:
+                        message += f"，跳过样本 {sorted(lost)}"
+                    get_metrics().count('sample.lost', len(pending) + 1)
+                    on_error(message)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = create_executor()
+                    pending = {}
+                    break
+                # 工作进程中的指标合并到主进程，与串行生成时一样通过get_metrics()读取
+                get_metrics().merge(worker_metrics)
+                if not success:
+                    # 工作进程中的错误不中断生成，也不等待用户输入
+                    get_metrics().count('sample.error')
+                    on_error(payload)
+                    continue
+                if payload is None or (n is not None and produced >= n):
+                    continue
+                produced += 1
+                yield payload
+    finally:
+        # 达到目标数量、消费者停止迭代或中断时，取消尚未开始的任务
+        executor.shutdown(wait=False, cancel_futures=True)
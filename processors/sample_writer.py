@@ -0,0 +1,215 @@
+"""
+样本写入：生成循环通过submit()提交样本记录，由输出后端写入文件并写入元数据索引
+
+- SampleWriter：在调用线程中逐个同步写入
+- AsyncSampleWriter：后台线程写入，生成循环只把样本放入有界队列，不等待磁盘I/O；
+  写入线程每次取出队列中已有的全部样本（最多batch_size个）批量写入，
+  目录布局下一批样本的文件只分配、提交一次编号（见DirectoryBackend.write_samples）
+
+队列满时submit()阻塞（背压，内存中最多积压queue_size个样本），阻塞时间计入计时器'writer.blocked'；
+写入线程每次取样本时的队列深度记录为gauge'writer.queue_depth'（见generators.metrics），
+I/O跟不上生成速度时可从指标中直接看出。
+
+写入失败（磁盘、输出后端或索引出错）时submit()/close()抛出SampleWriteError（原异常为其__cause__），
+与单个样本的生成错误区分开：生成循环遇到它应停止生成，而不是跳过该样本后继续提交。
+
+元数据索引行在样本编号提交之前写入，索引的事务在输出后端提交编号前提交（见MetadataIndex），
+崩溃后已提交的样本不会缺少索引行。
+
+指定去重器时，样本的去重键在其文件编号提交后才加入过滤器（见processors.dedup）：
+目录布局每批写入后即已提交，分片布局在分片关闭时才提交，关闭后端后调用confirm_committed()记录最后一个分片中的样本。
+"""
+import collections
+import logging
+import queue
+import threading
+import time
+
+from generators.metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # 通知写入线程退出
+
+
+class SampleWriteError(Exception):
+    """写入样本失败，之后的样本无法继续写入"""
+
+
+class SampleWriter:
+    """在调用线程中同步写入样本"""
+
+    def __init__(self, backend, index=None, metrics_writer=None, point_clouds=None, deduper=None):
+        """
+        Args:
+            backend: 输出后端（见processors.output_backends）
+            index: 元数据索引（MetadataIndex），为None时不写入
+            metrics_writer: MetricsWriter，每次提交后检查是否需要写入指标文件
+            point_clouds: 点云存储（PointCloudStore），带'point_cloud'的样本按样本编号写入，为None时不写入
+            deduper: 去重器（SampleDeduplicator），样本提交后记录其键，为None时不记录
+        """
+        self.backend = backend
+        self.index = index
+        self.metrics_writer = metrics_writer
+        self.point_clouds = point_clouds
+        self.deduper = deduper
+        if index is not None:
+            # 索引行在样本编号提交之前写入，事务随编号一起提交，已提交的样本不会缺少索引行
+            backend.before_commit = index.commit
+        self._unconfirmed = collections.deque()  # 已写入、编号尚未提交的样本 (第一个文件的编号, 去重键)
+
+    @property
+    def depth(self):
+        """等待写入的样本数"""
+        return 0
+
+    def submit(self, record):
+        """
+        写入一个样本
+
+        Returns:
+            int: 样本步数
+
+        Raises:
+            SampleWriteError: 写入失败
+        """
+        try:
+            step_count, _ = self._write_batch([record])[0]
+        except Exception as e:
+            raise SampleWriteError(f"写入样本失败：{type(e).__name__}: {e}") from e
+        self._maybe_write_metrics()
+        return step_count
+
+    def _write_batch(self, records):
+        """通过输出后端写入一批样本及其索引行，返回每个样本的 (步数, 位置)"""
+        metrics = get_metrics()
+        with metrics.timer('io'):
+            on_written = None
+            if self.index is not None:
+                def on_written(i, location):
+                    self.index.add_sample(records[i], location, self.backend.layout)
+            results = self.backend.write_samples([record['code'] for record in records],
+                                                 [record.get('geometry') for record in records], on_written)
+            if self.point_clouds is not None:
+                for record, (_, location) in zip(records, results):
+                    if record.get('point_cloud') is not None:
+                        self.point_clouds.add(location['first_index'], *record['point_cloud'])
+        if self.deduper is not None:
+            self._unconfirmed.extend((location['first_index'], self.deduper.sample_keys(record))
+                                     for record, (_, location) in zip(records, results))
+            self.confirm_committed()
+        metrics.count('sample.written', len(records))
+        metrics.count('file.written', sum(step_count for step_count, _ in results))
+        return results
+
+    def confirm_committed(self):
+        """将编号已提交的样本的去重键加入过滤器（编号按写入顺序提交）"""
+        allocator = self.backend.allocator
+        while self._unconfirmed and allocator.is_committed(self._unconfirmed[0][0]):
+            self.deduper.add_keys(self._unconfirmed.popleft()[1])
+
+    def _maybe_write_metrics(self):
+        if self.metrics_writer is not None:
+            self.metrics_writer.maybe_write()
+
+    def close(self):
+        pass
+
+
+class AsyncSampleWriter(SampleWriter):
+    """
+    后台线程批量写入样本
+
+    close()等待队列中的样本全部写入，用户中断（KeyboardInterrupt）后同样调用close()，已生成的样本不会丢失。
+    写入线程出错时停止写入（队列中尚未写入的样本被丢弃），之后的每次submit()在主线程中抛出SampleWriteError，
+    close()在该异常尚未抛出过时抛出。
+
+    元数据索引和点云存储只在写入线程中使用（元数据索引需以check_same_thread=False打开，MetadataIndex默认如此）。
+    """
+
+    def __init__(self, backend, index=None, metrics_writer=None, queue_size=256, batch_size=32, point_clouds=None,
+                 deduper=None):
+        """
+        Args:
+            backend, index, metrics_writer, point_clouds, deduper: 同SampleWriter
+            queue_size: 队列中最多等待写入的样本数
+            batch_size: 写入线程每批最多写入的样本数
+        """
+        super().__init__(backend, index, metrics_writer, point_clouds, deduper)
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._error_raised = False
+        self._thread = threading.Thread(target=self._run, name="sample-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, record):
+        """
+        将样本放入写入队列（队列满时等待）
+
+        Returns:
+            int: 样本步数（由记录中的步骤边界得到，不等待写入完成）
+
+        Raises:
+            SampleWriteError: 写入线程此前写入失败
+        """
+        self._raise_error(always=True)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # 写入跟不上生成速度，等待队列空出位置
+            metrics = get_metrics()
+            metrics.count('writer.full')
+            with metrics.timer('writer.blocked'):
+                while True:
+                    try:
+                        self._queue.put(record, timeout=0.5)
+                        break
+                    except queue.Full:
+                        self._raise_error(always=True)
+        self._maybe_write_metrics()
+        return len(record['step_boundaries'])
+
+    def _run(self):
+        metrics = get_metrics()
+        stopping = False
+        while not stopping:
+            records = [self._queue.get()]
+            metrics.gauge('writer.queue_depth', self._queue.qsize() + 1)
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if records[-1] is _STOP:
+                records.pop()
+                stopping = True
+            if not records or self._error is not None:
+                continue
+            try:
+                self._write_batch(records)
+                metrics.count('writer.batches')
+            except BaseException as e:
+                # 写入失败的批次已由输出后端回退；之后的样本不再写入，错误交给主线程
+                logger.error("写入样本失败：%s: %s", type(e).__name__, e)
+                self._error = e
+
+    def _raise_error(self, always=False):
+        if self._error is not None and (always or not self._error_raised):
+            self._error_raised = True
+            error = self._error
+            raise SampleWriteError(f"写入样本失败：{type(error).__name__}: {error}") from error
+
+    def close(self):
+        """等待队列中的样本全部写入后停止写入线程"""
+        if self._thread.is_alive():
+            start = time.perf_counter()
+            self._queue.put(_STOP)
+            self._thread.join()
+            get_metrics().add_time('writer.drain', time.perf_counter() - start)
+        self._raise_error()
@@ -0,0 +1,185 @@
+"""
+将完整的CAD代码按建模步骤拆分（每个 result = ... 行为一个步骤）
+"""
+import re
+
+from processors.compression import read_program_text
+
+
+def split_cq_code_steps(cq_code):
+    """
+    拆分代码为导入语句、操作代码以及每一步结束的位置
+
+    Args:
+        cq_code (str): 完整的生成CAD模型代码
+
+    Returns:
+        tuple: (header_lines: list, operation_lines: list, result_indices: list)
+        result_indices[i]为第i步的result行在operation_lines中的下标
+    """
+    # 按行分割代码
+    lines = cq_code.split('\n')
+
+    # 分离导入语句和操作代码
+    header_lines = []
+    operation_lines = []
+
+    for line in lines:
+        if line.startswith("import "):
+            header_lines.append(line)
+        else:
+            operation_lines.append(line)
+
+    # 找到所有result=行的索引
+    result_indices = []
+    for i, line in enumerate(operation_lines):
+        if line.strip().startswith("result = "):
+            result_indices.append(i)
+
+    # 如果没有找到result行，将整个代码作为一步
+    if not result_indices:
+        result_indices = [len(operation_lines) - 1]
+
+    return header_lines, operation_lines, result_indices
+
+
+def build_step_file_header(step, step_count):
+    """单步文件的说明注释（step从0开始）"""
+    return (
+        "# 自动生成的CAD模型训练数据\n"
+        f"# 包含随机生成的草图、拉伸及布尔运算（第{step + 1}步，共{step_count}步）\n"
+    )
+
+
+_STEP_FILE_HEADER_PATTERN = re.compile(r"（第(\d+)步，共(\d+)步）")
+
+
+def parse_step_file(content):
+    """
+    解析逐步布局中单步文件的内容（build_step_file_header + 代码）
+
+    Returns:
+        tuple or None: (step: 从0开始的步骤序号, step_count: 样本步数, code: 去掉说明注释的代码)，
+        不是单步文件时返回None
+    """
+    lines = content.split('\n', 2)
+    if len(lines) < 3:
+        return None
+    match = _STEP_FILE_HEADER_PATTERN.search(lines[1])
+    if match is None:
+        return None
+    return int(match.group(1)) - 1, int(match.group(2)), lines[2]
+
+
+def build_step_codes(cq_code):
+    """
+    生成每一步对应的文件内容，第i个文件在第i-1个文件基础上增加一个操作
+
+    Args:
+        cq_code (str): 完整的生成CAD模型代码
+
+    Returns:
+        list: 每一步的文件内容（含说明注释）
+    """
+    header_lines, operation_lines, result_indices = split_cq_code_steps(cq_code)
+
+    step_codes = []
+    for i, result_idx in enumerate(result_indices):
+        # 构建当前步骤的代码：导入语句 + 到当前result行为止的所有行
+        current_code_lines = header_lines + operation_lines[:result_idx + 1]
+        current_code = "\n".join(current_code_lines)
+        step_codes.append(build_step_file_header(i, len(result_indices)) + current_code)
+    return step_codes
+
+
+# ---- 前缀去重布局：每个程序只保存一次，并记录每一步结束的行号 ----
+
+STEP_BOUNDARY_PREFIX = "# cq-steps: "
+
+
+def compute_step_boundaries(cq_code):
+    """
+    将代码整理为与单步文件一致的正文，并计算每一步结束的行号
+
+    Returns:
+        tuple: (body: str, step_line_counts: list)
+        第i步的代码即body的前step_line_counts[i]行
+    """
+    header_lines, operation_lines, result_indices = split_cq_code_steps(cq_code)
+    body = "\n".join(header_lines + operation_lines)
+    step_line_counts = [len(header_lines) + result_idx + 1 for result_idx in result_indices]
+    return body, step_line_counts
+
+
+def build_program_file(cq_code):
+    """
+    生成前缀去重布局的文件内容：说明注释 + 步骤边界行 + 完整程序（仍是可直接执行的代码）
+
+    Args:
+        cq_code (str): 完整的生成CAD模型代码
+
+    Returns:
+        tuple: (文件内容: str, 步数: int)
+    """
+    body, step_line_counts = compute_step_boundaries(cq_code)
+    content = (
+        "# 自动生成的CAD模型训练数据\n"
+        f"# 包含随机生成的草图、拉伸及布尔运算（共{len(step_line_counts)}步）\n"
+        f"{STEP_BOUNDARY_PREFIX}{','.join(str(n) for n in step_line_counts)}\n"
+        f"{body}"
+    )
+    return content, len(step_line_counts)
+
+
+def parse_program_file(content):
+    """
+    解析前缀去重布局的文件内容
+
+    Returns:
+        tuple: (body_lines: list, step_line_counts: list)
+    """
+    lines = content.split('\n')
+    for i, line in enumerate(lines):
+        if line.startswith(STEP_BOUNDARY_PREFIX):
+            step_line_counts = [int(n) for n in line[len(STEP_BOUNDARY_PREFIX):].split(',') if n]
+            return lines[i + 1:], step_line_counts
+    raise ValueError("文件中缺少步骤边界行，不是前缀去重布局的程序文件")
+
+
+def rebuild_step_code(content, step, with_header=True):
+    """
+    从前缀去重布局的文件内容重建第step步（从0开始）的代码
+
+    Args:
+        content (str): 程序文件内容
+        step (int): 步骤序号，支持负数（-1为最后一步）
+        with_header (bool): 是否添加与单步文件相同的说明注释
+
+    Returns:
+        str: 与逐步布局中对应文件内容相同的代码
+    """
+    body_lines, step_line_counts = parse_program_file(content)
+    step_count = len(step_line_counts)
+    if step < 0:
+        step += step_count
+    code = "\n".join(body_lines[:step_line_counts[step]])
+    if with_header:
+        return build_step_file_header(step, step_count) + code
+    return code
+
+
+def iter_step_codes(content, with_header=True):
+    """依次重建前缀去重布局文件中每一步的代码"""
+    body_lines, step_line_counts = parse_program_file(content)
+    step_count = len(step_line_counts)
+    for step, line_count in enumerate(step_line_counts):
+        code = "\n".join(body_lines[:line_count])
+        if with_header:
+            yield build_step_file_header(step, step_count) + code
+        else:
+            yield code
+
+
+def read_step_code(file_path, step, with_header=True, codec=None):
+    """读取前缀去重布局的程序文件并重建第step步的代码（.zst压缩文件需指定codec）"""
+    return rebuild_step_code(read_program_text(file_path, codec), step, with_header)
@@ -0,0 +1,345 @@
+"""
+预分词的训练数据导出：将数据集中的程序一次性分词，写为一个扁平的词元数组和偏移数组，
+训练时通过mmap切片读取，不再每个epoch打开数百万个小文件并重新分词
+
+每个样本只对完整程序（每行末尾带换行符）整体分词一次，第k步的代码是完整程序的前若干行，
+由每个词元结束的字符位置确定各步骤在词元中的结束位置，读取任意步骤都是样本词元的零拷贝切片。
+
+导出目录结构：
+- tokens.bin：(词元数,) 扁平词元数组，dtype见meta.json（按词表大小取uint8/uint16/uint32），用np.memmap加载
+- sample_offsets.npy：(样本数+1,) int64，第i个样本的词元为 tokens[sample_offsets[i]:sample_offsets[i+1]]
+- step_offsets.npy：(样本数+1,) int64，第i个样本各步骤的结束位置为 step_ends[step_offsets[i]:step_offsets[i+1]]
+- step_ends.npy：(总步数,) int64，每一步代码的词元结束位置（tokens中的绝对位置）
+- sample_ids.npy：(样本数,) int64，数据集中的样本编号（第一个文件的编号，与元数据索引的sample_id一致）
+- meta.json：版本、分词器、词表大小、dtype、样本数、词元数、源数据集目录
+
+分词器可替换，通过 "模块:属性" 指定，内置的默认分词器为UTF-8字节。分词器需具有 vocab_size 属性，以及：
+- encode_with_offsets(text) -> (词元序列, 每个词元结束的字符位置)：对整个程序分词，BPE等跨行合并的分词器
+  以及添加BOS/EOS等特殊词元的分词器须提供该方法（例如HuggingFace快速分词器调用时传入
+  return_offsets_mapping=True，取offset_mapping中每项的结束位置）。一个词元跨越步骤边界时（如合并了
+  换行符与下一行开头），该步骤的前缀只包含边界之前完整结束的词元；特殊词元的位置按之前词元的结束位置计算，
+  即开头的BOS属于每一步，末尾的EOS只属于完整程序
+- 或者只有 encode(text) -> 词元序列：此时逐行分词后拼接，只适用于在行边界处可拆分（分词结果不跨行合并）
+  且不添加特殊词元的分词器，如字节级分词器
+
+用法：
+    python -m processors.token_export --base-dir ../data/SyntheticData --output ../data/SyntheticTokens
+
+    dataset = TokenDataset("../data/SyntheticTokens")
+    tokens = dataset[0]                   # 第0个样本的完整程序
+    prefix = dataset.step_prefix(0, 2)    # 前3步的代码
+    batch, lengths = dataset.batch([0, 5, 9], step=-1)
+"""
+import importlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+from tqdm import tqdm
+
+from processors.compression import ProgramCodec, read_program_text
+from processors.output_backends import iter_shard_files
+from processors.step_sequence import (STEP_BOUNDARY_PREFIX, compute_step_boundaries, parse_program_file,
+                                      parse_step_file)
+
+
+EXPORT_VERSION = 1
+
+_FILE_NAME_PATTERN = re.compile(r"cad_model_(\d+)\.py(\.zst)?$")
+_FLUSH_TOKENS = 1 << 20  # 缓冲的词元数达到该值时写入文件
+
+
+class ByteTokenizer:
+    """默认分词器：UTF-8字节，词表大小256，无需词表文件"""
+
+    name = "byte"
+    vocab_size = 256
+
+    def encode(self, text):
+        return text.encode("utf-8")
+
+    def encode_with_offsets(self, text):
+        """返回字节序列及每个字节所属字符的结束位置（多字节字符的各字节结束位置相同）"""
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        # 非延续字节（不是10xxxxxx）是一个字符的开始
+        return data, np.cumsum((data & 0xC0) != 0x80)
+
+    def decode(self, tokens):
+        return bytes(np.asarray(tokens, dtype=np.uint8)).decode("utf-8", errors="replace")
+
+
+TOKENIZERS = {'byte': ByteTokenizer}
+
+
+def _is_tokenizer(obj):
+    return hasattr(obj, 'encode_with_offsets') or hasattr(obj, 'encode')
+
+
+def get_tokenizer(spec=None):
+    """
+    按名称获取分词器
+
+    Args:
+        spec: None或'byte'为内置分词器，"模块:属性"为自定义分词器（属性为类或无参函数时调用它创建实例）
+    """
+    if spec is None:
+        spec = 'byte'
+    if spec in TOKENIZERS:
+        return TOKENIZERS[spec]()
+    if ':' not in spec:
+        raise ValueError(f"未知的分词器: {spec}，可选值为 {tuple(TOKENIZERS)} 或 '模块:属性'")
+    module_name, attr = spec.split(':', 1)
+    tokenizer = getattr(importlib.import_module(module_name), attr)
+    if isinstance(tokenizer, type) or not _is_tokenizer(tokenizer):
+        tokenizer = tokenizer()
+    return tokenizer
+
+
+def _token_dtype(vocab_size):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if vocab_size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    raise ValueError(f"词表过大: {vocab_size}")
+
+
+def _iter_dataset_files(base_dir):
+    """依次给出目录布局和分片布局中的所有文件 (文件编号, 文件内容)，压缩文件已解压"""
+    batch_dirs = sorted((name for name in os.listdir(base_dir) if name.startswith("batch_")
+                         and os.path.isdir(os.path.join(base_dir, name))), key=lambda name: int(name.split("_")[1]))
+    codec = None
+    for batch_dir in batch_dirs:
+        batch_path = os.path.join(base_dir, batch_dir)
+        files = []
+        for name in os.listdir(batch_path):
+            match = _FILE_NAME_PATTERN.match(name)
+            if match:
+                files.append((int(match.group(1)), name, match.group(2) is not None))
+        for index, name, compressed in sorted(files):
+            if compressed and codec is None:
+                codec = ProgramCodec.load(base_dir)
+                if codec is None:
+                    raise FileNotFoundError(f"数据集 {base_dir} 中有压缩文件，但缺少zstd字典")
+            yield index, read_program_text(os.path.join(batch_path, name), codec)
+
+    if os.path.isdir(os.path.join(base_dir, "shards")):
+        for name, content in iter_shard_files(base_dir):
+            match = _FILE_NAME_PATTERN.match(name)
+            if match:
+                yield int(match.group(1)), content
+
+
+def _encode_with_offsets(tokenizer, lines):
+    """
+    对完整程序分词
+
+    Returns:
+        tuple: (词元序列, 每个词元结束的字符位置，单调不减)
+    """
+    if hasattr(tokenizer, 'encode_with_offsets'):
+        tokens, char_ends = tokenizer.encode_with_offsets("".join(line + "\n" for line in lines))
+        # 特殊词元的位置（通常为(0, 0)）取之前词元的结束位置
+        return tokens, np.maximum.accumulate(np.asarray(char_ends, dtype=np.int64))
+    # 只有encode的分词器视为在行边界处可拆分，逐行分词，每行的词元都在该行末尾结束
+    tokens = []
+    char_ends = []
+    char_count = 0
+    for line in lines:
+        line_tokens = tokenizer.encode(line + "\n")
+        char_count += len(line) + 1
+        tokens.extend(line_tokens)
+        char_ends.extend([char_count] * len(line_tokens))
+    return tokens, np.asarray(char_ends, dtype=np.int64)
+
+
+def iter_dataset_programs(base_dir):
+    """
+    依次读取数据集中每个样本的完整程序（目录/分片布局、逐步/前缀去重存储方式、压缩与否均可）
+
+    逐步存储方式只读取每个样本的最后一步文件（上次运行中未写完最后一步的样本被跳过）。
+
+    Yields:
+        tuple: (sample_id, lines, step_line_counts)，第k步的代码为 "\\n".join(lines[:step_line_counts[k]])
+    """
+    for index, content in _iter_dataset_files(base_dir):
+        if STEP_BOUNDARY_PREFIX in content:
+            lines, step_line_counts = parse_program_file(content)
+            yield index, lines[:step_line_counts[-1]], step_line_counts
+            continue
+        parsed = parse_step_file(content)
+        if parsed is None:
+            continue
+        step, step_count, code = parsed
+        if step != step_count - 1:
+            continue
+        body, step_line_counts = compute_step_boundaries(code)
+        yield index - step, body.split('\n')[:step_line_counts[-1]], step_line_counts
+
+
+def export_tokens(base_dir, output_dir, tokenizer=None, limit=None, quiet=False):
+    """
+    将数据集分词并导出为mmap数组（先写入临时目录，完成后替换output_dir）
+
+    Args:
+        base_dir: 数据集根目录
+        output_dir: 导出目录
+        tokenizer: 分词器对象或名称（见get_tokenizer），为None时使用字节分词器
+        limit: 最多导出的样本数，为None时导出全部样本
+        quiet: 不显示进度条
+
+    Returns:
+        TokenDataset: 导出的数据集
+    """
+    tokenizer_spec = tokenizer if isinstance(tokenizer, str) or tokenizer is None else None
+    if not _is_tokenizer(tokenizer):
+        tokenizer = get_tokenizer(tokenizer)
+    dtype = _token_dtype(tokenizer.vocab_size)
+
+    temp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    sample_offsets = [0]
+    step_offsets = [0]
+    step_ends = []
+    sample_ids = []
+    buffer = []  # 待写入的各样本词元数组
+    buffered = 0
+    token_count = 0
+    with open(os.path.join(temp_dir, "tokens.bin"), "wb") as tokens_file:
+        programs = iter_dataset_programs(base_dir)
+        for sample_id, lines, step_line_counts in tqdm(programs, desc="导出词元", unit="样本", disable=quiet):
+            tokens, char_ends = _encode_with_offsets(tokenizer, lines)
+            # 第k步代码的字符数为前step_line_counts[k]行（含换行符）的长度之和
+            line_char_ends = np.cumsum([len(line) + 1 for line in lines])
+            step_char_ends = line_char_ends[np.asarray(step_line_counts) - 1]
+            # 每一步的词元结束位置：结束字符位置不超过该步骤末尾的词元数
+            sample_start = token_count + buffered
+            step_ends.extend((sample_start + np.searchsorted(char_ends, step_char_ends, side='right')).tolist())
+            buffer.append(np.asarray(tokens, dtype=dtype))
+            buffered += len(tokens)
+            step_offsets.append(len(step_ends))
+            sample_offsets.append(token_count + buffered)
+            sample_ids.append(sample_id)
+            if buffered >= _FLUSH_TOKENS:
+                np.concatenate(buffer).tofile(tokens_file)
+                token_count += buffered
+                buffer = []
+                buffered = 0
+            if limit is not None and len(sample_ids) >= limit:
+                break
+        np.concatenate(buffer or [np.zeros(0, dtype=dtype)]).tofile(tokens_file)
+        token_count += buffered
+
+    np.save(os.path.join(temp_dir, "sample_offsets.npy"), np.asarray(sample_offsets, dtype=np.int64))
+    np.save(os.path.join(temp_dir, "step_offsets.npy"), np.asarray(step_offsets, dtype=np.int64))
+    np.save(os.path.join(temp_dir, "step_ends.npy"), np.asarray(step_ends, dtype=np.int64))
+    np.save(os.path.join(temp_dir, "sample_ids.npy"), np.asarray(sample_ids, dtype=np.int64))
+    with open(os.path.join(temp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": EXPORT_VERSION,
+            "tokenizer": tokenizer_spec or getattr(tokenizer, 'name', type(tokenizer).__name__),
+            "vocab_size": tokenizer.vocab_size,
+            "dtype": dtype.name,
+            "sample_count": len(sample_ids),
+            "token_count": token_count,
+            "source": os.path.abspath(base_dir),
+        }, f, ensure_ascii=False)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(temp_dir, output_dir)
+    return TokenDataset(output_dir)
+
+
+class TokenDataset:
+    """
+    只读的预分词数据集（数组通过mmap加载，多个数据加载进程共享页缓存）
+
+    所有读取方法返回tokens的切片视图，不复制数据。
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != EXPORT_VERSION:
+            raise ValueError(f"不支持的词元导出版本: {self.meta['version']}")
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+
+        self.path = path
+        dtype = np.dtype(self.meta["dtype"])
+        if self.meta["token_count"]:
+            self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=dtype, mode='r',
+                                    shape=(self.meta["token_count"],))
+        else:
+            self.tokens = np.zeros(0, dtype=dtype)  # 空文件无法mmap
+        self.sample_offsets = load("sample_offsets")
+        self.step_offsets = load("step_offsets")
+        self.step_ends = load("step_ends")
+        self.sample_ids = load("sample_ids")
+
+    def __len__(self):
+        return self.meta["sample_count"]
+
+    def __getitem__(self, i):
+        """第i个样本完整程序的词元"""
+        return self.tokens[self.sample_offsets[i]:self.sample_offsets[i + 1]]
+
+    def step_count(self, i):
+        return int(self.step_offsets[i + 1] - self.step_offsets[i])
+
+    def step_prefix(self, i, step):
+        """
+        第i个样本前step+1步代码的词元（step从0开始，支持负数，-1为完整程序）
+        """
+        step_count = self.step_count(i)
+        if step < 0:
+            step += step_count
+        if not 0 <= step < step_count:
+            raise IndexError(f"样本 {i} 共 {step_count} 步，步骤序号 {step} 超出范围")
+        return self.tokens[self.sample_offsets[i]:self.step_ends[self.step_offsets[i] + step]]
+
+    def batch(self, indices, step=-1, pad_id=0, max_length=None):
+        """
+        读取一批样本（或各样本相同步骤的前缀）并右侧填充为二维数组
+
+        Args:
+            indices: 样本序号列表
+            step: 步骤序号（见step_prefix），或与indices等长的各样本步骤序号列表，为None时使用完整程序
+            pad_id: 填充值
+            max_length: 最大长度，超出部分截断
+
+        Returns:
+            tuple: (词元数组 (批大小, 最大长度), 各样本的长度 (批大小,))
+        """
+        if step is None:
+            sequences = [self[i] for i in indices]
+        elif isinstance(step, int):
+            sequences = [self.step_prefix(i, step) for i in indices]
+        else:
+            sequences = [self.step_prefix(i, sample_step) for i, sample_step in zip(indices, step)]
+        lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+        if max_length is not None:
+            lengths = np.minimum(lengths, max_length)
+        batch = np.full((len(sequences), int(lengths.max(initial=0))), pad_id, dtype=self.tokens.dtype)
+        for row, (sequence, length) in enumerate(zip(sequences, lengths)):
+            batch[row, :length] = sequence[:length]
+        return batch, lengths
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='将数据集中的程序分词并导出为mmap数组')
+    parser.add_argument('--base-dir', default='../data/SyntheticData', help='数据集目录')
+    parser.add_argument('--output', required=True, help='导出目录（已存在时替换）')
+    parser.add_argument('--tokenizer', default=None,
+                        help=f"分词器：{'、'.join(TOKENIZERS)}（默认byte）或 '模块:属性'")
+    parser.add_argument('--limit', type=int, default=None, help='最多导出的样本数（默认全部）')
+    parser.add_argument('--quiet', action='store_true', help='不显示进度条')
+    args = parser.parse_args()
+
+    dataset = export_tokens(args.base_dir, args.output, args.tokenizer, args.limit, args.quiet)
+    print(f"已导出到 {args.output}：{len(dataset)} 个样本，{dataset.meta['token_count']} 个词元"
+          f"（{dataset.meta['dtype']}）")
@@ -0,0 +1,212 @@
+"""
+按种子索引的虚拟数据集：样本i只由(全局种子, i)决定，访问时才生成
+
+只需保存一个很小的清单文件（种子、样本数、生成参数），即可在任意机器上
+重建全部或部分样本，例如重新生成出错的几个样本用于调试。
+
+样本还取决于默认草图库（CQ_SKETCH_LIBRARY / CQ_SKETCH_LIBRARY_STRATIFY），清单中记录库的路径、
+meta.json的哈希和分层方式，重建时恢复同一个库；自适应抽样（CQ_ADAPTIVE_SAMPLING）不影响虚拟数据集，
+generate_seeded_sample始终均匀抽样。
+
+已生成的样本缓存在内存（LRU）中，可选地缓存到磁盘目录 cache_dir/{生成参数哈希}/{编号//1000}/{编号}.json
+（从磁盘缓存读取的记录中，包围盒等元组字段为列表）。生成参数哈希由种子、拉伸次数范围、尝试次数和草图库
+（meta.json哈希与分层方式，不含路径）确定，同一个cache_dir可供不同参数的数据集共用，不会读到其他参数的样本。
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from generators.sketch_library import configure_sketch_library, get_sketch_library
+from processors.index_allocator import atomic_write_text
+from processors.sample_stream import generate_seeded_sample
+
+
+MANIFEST_VERSION = 2
+# 版本1的清单没有记录草图库，按在线生成草图处理
+SUPPORTED_MANIFEST_VERSIONS = (1, 2)
+
+
+def _sketch_library_manifest(library):
+    """草图库在清单中的记录，未使用草图库时为None"""
+    if library is None:
+        return None
+    return {
+        "path": os.path.abspath(library.path),
+        "meta_hash": library.meta_hash,
+        "stratify": library.stratify,
+    }
+
+
+class VirtualCADDataset:
+    """
+    虚拟数据集
+
+    用法：
+        dataset = VirtualCADDataset(global_seed=42, size=1000000)
+        record = dataset[123]          # 与 iter_samples(seed=42) 中编号123的样本相同
+        dataset.save_manifest("manifest.json")
+        dataset = VirtualCADDataset.from_manifest("manifest.json", cache_dir="cache")
+    """
+
+    def __init__(self, global_seed, size, min_opera_cnt=1, max_opera_cnt=10,
+                 cache_size=128, cache_dir=None, max_attempts=10):
+        """
+        Args:
+            global_seed: 全局种子
+            size: 样本数
+            min_opera_cnt, max_opera_cnt: 每个样本的拉伸次数范围
+            cache_size: 内存中缓存的样本数（0表示不缓存）
+            cache_dir: 磁盘缓存目录，为None时不缓存到磁盘
+            max_attempts: 单个编号没有任何有效步骤时最多尝试的派生种子数
+        """
+        self.global_seed = global_seed
+        self.size = size
+        self.min_opera_cnt = min_opera_cnt
+        self.max_opera_cnt = max_opera_cnt
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.max_attempts = max_attempts
+        # 构造时的默认草图库，之后生成样本时须保持不变
+        self.sketch_library = _sketch_library_manifest(get_sketch_library())
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        """
+        获取编号为index的样本（支持负数编号）
+
+        Raises:
+            IndexError: 编号超出范围
+            RuntimeError: 所有尝试均未生成有效样本
+        """
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(f"样本编号 {index} 超出范围 [0, {self.size})")
+
+        record = self._cache.get(index)
+        if record is not None:
+            self._cache.move_to_end(index)
+            return record
+
+        record = self._load_cached(index)
+        if record is None:
+            record = self.materialize(index)
+            self._save_cached(index, record)
+        self._remember(index, record)
+        return record
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self[index]
+
+    def materialize(self, index):
+        """
+        不经过缓存，直接生成编号为index的样本
+
+        Raises:
+            RuntimeError: 默认草图库与构造时不同，或所有尝试均未生成有效样本
+        """
+        if _sketch_library_manifest(get_sketch_library()) != self.sketch_library:
+            raise RuntimeError("默认草图库与创建数据集时不同，生成的样本与清单不一致")
+        record = generate_seeded_sample(
+            self.global_seed, index, self.min_opera_cnt, self.max_opera_cnt, self.max_attempts
+        )
+        if record is None:
+            raise RuntimeError(f"样本{index}在{self.max_attempts}次尝试中均未生成有效步骤")
+        return record
+
+    def _remember(self, index, record):
+        if self.cache_size <= 0:
+            return
+        self._cache[index] = record
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def cache_key(self):
+        """决定样本内容的生成参数的哈希（不含样本数和草图库路径），作为磁盘缓存的子目录名"""
+        library = self.sketch_library
+        params = {
+            "version": MANIFEST_VERSION,
+            "global_seed": self.global_seed,
+            "min_opera_cnt": self.min_opera_cnt,
+            "max_opera_cnt": self.max_opera_cnt,
+            "max_attempts": self.max_attempts,
+            "sketch_library": None if library is None else [library["meta_hash"], library["stratify"]],
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _cache_path(self, index):
+        return os.path.join(self.cache_dir, self.cache_key(), str(index // 1000), f"{index}.json")
+
+    def _load_cached(self, index):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(index), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_cached(self, index, record):
+        if self.cache_dir is None:
+            return
+        cache_path = self._cache_path(index)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        atomic_write_text(cache_path, json.dumps(record, ensure_ascii=False))
+
+    def manifest(self):
+        """重建该数据集所需的全部参数"""
+        return {
+            "version": MANIFEST_VERSION,
+            "global_seed": self.global_seed,
+            "size": self.size,
+            "min_opera_cnt": self.min_opera_cnt,
+            "max_opera_cnt": self.max_opera_cnt,
+            "max_attempts": self.max_attempts,
+            "sketch_library": self.sketch_library,
+        }
+
+    def save_manifest(self, path):
+        """保存清单文件"""
+        atomic_write_text(path, json.dumps(self.manifest(), indent=2))
+
+    @classmethod
+    def from_manifest(cls, path, cache_size=128, cache_dir=None, sketch_library_path=None):
+        """
+        从清单文件重建数据集
+
+        同时将默认草图库设置为清单中记录的库（未记录时恢复为在线生成草图）。
+
+        Args:
+            path: 清单文件路径
+            cache_size, cache_dir: 同构造函数
+            sketch_library_path: 草图库所在目录，为None时使用清单中记录的路径（库被移动或在其他机器上重建时指定）
+
+        Raises:
+            ValueError: 清单版本不支持，或草图库的meta.json哈希与清单不一致
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") not in SUPPORTED_MANIFEST_VERSIONS:
+            raise ValueError(f"不支持的清单版本: {manifest.get('version')}")
+        recorded = manifest.get("sketch_library")
+        if recorded is None:
+            configure_sketch_library(None)
+        else:
+            library = configure_sketch_library(sketch_library_path or recorded["path"], recorded["stratify"])
+            if library.meta_hash != recorded["meta_hash"]:
+                configure_sketch_library(None)
+                raise ValueError(f"草图库 {library.path} 的meta.json哈希与清单不一致，不是生成该数据集时使用的库")
+        return cls(
+            manifest["global_seed"],
+            manifest["size"],
+            min_opera_cnt=manifest["min_opera_cnt"],
+            max_opera_cnt=manifest["max_opera_cnt"],
+            cache_size=cache_size,
+            cache_dir=cache_dir,
+            max_attempts=manifest["max_attempts"],
+        )
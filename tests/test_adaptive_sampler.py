@@ -0,0 +1,55 @@
+import random
+from collections import Counter
+
+import pytest
+
+from generators.adaptive_sampler import AdaptiveSampler
+
+# 3个基准平面、2个包围盒偏移平面、7个面选择器平面，与生成时合并后的候选列表类似
+PLANES = (
+    ["'XY'", "'YZ'", "'XZ'"]
+    + [f"'XY', origin=(0.0, 0.0, {z}.0)" for z in (1, 2)]
+    + [f"Face:{selector}" for selector in ('>Z', '<Z', '>X', '<X', '>Y', '<Y', '>Z[1]')]
+)
+
+
+def _skewed_sampler(min_share):
+    """面选择器平面总被拒绝、基准平面总被接受的抽样器"""
+    sampler = AdaptiveSampler(min_share)
+    for _ in range(50):
+        sampler.record("'XY'", 'cut', 50.0, True)
+        sampler.record("Face:>Z", 'union', -50.0, False)
+    return sampler
+
+
+@pytest.mark.parametrize("sampler", [AdaptiveSampler(1.0), AdaptiveSampler(0.5), _skewed_sampler(1.0)])
+def test_plane_probabilities_match_uniform_choice(sampler):
+    probabilities = sampler.plane_probabilities(PLANES)
+    assert set(probabilities) == set(PLANES)
+    for probability in probabilities.values():
+        assert probability == pytest.approx(1 / len(PLANES))
+
+
+def test_choose_plane_frequencies_match_uniform_choice():
+    sampler = _skewed_sampler(1.0)
+    rng = random.Random(0)
+    draws = 60000
+    counts = Counter(sampler.choose_plane(rng, PLANES) for _ in range(draws))
+    for plane in PLANES:
+        assert counts[plane] / draws == pytest.approx(1 / len(PLANES), abs=0.01)
+
+
+def test_min_share_one_keeps_boolean_and_height_uniform():
+    sampler = _skewed_sampler(1.0)
+    assert sampler.weights('boolean') == pytest.approx([0.5, 0.5])
+    assert sampler.weights('height') == pytest.approx([0.1] * 10)
+
+
+def test_rejected_kind_loses_mass_but_keeps_floor():
+    sampler = _skewed_sampler(0.5)
+    probabilities = sampler.plane_probabilities(PLANES)
+    face_share = sum(probabilities[plane] for plane in PLANES if plane.startswith("Face:"))
+    uniform_face_share = 7 / len(PLANES)
+    assert face_share < uniform_face_share
+    assert face_share >= 0.5 * uniform_face_share
+    assert sum(probabilities.values()) == pytest.approx(1.0)
@@ -0,0 +1,198 @@
+"""
+样本去重：程序编号规范化、几何键量化、布隆过滤器的保存与读取，以及键只在样本提交后加入过滤器（不需要CadQuery）
+"""
+import hashlib
+
+import pytest
+
+from processors.dedup import (BloomFilter, SampleDeduplicator, canonical_program, geometry_key, program_key)
+from processors.output_backends import DirectoryBackend, ShardBackend
+from processors.sample_writer import AsyncSampleWriter, SampleWriteError, SampleWriter
+
+
+def _program(tag, first_id=1):
+    return "\n".join([
+        "import cadquery as cq",
+        "",
+        f"# 样本 {tag}",
+        f"extrude_{first_id} = cq.Workplane('XY').box({tag}, 1, 1)",
+        f"result = extrude_{first_id}",
+        f"extrude_{first_id + 1} = cq.Workplane('XY').box(1, {tag}, 1)",
+        f"result = result.union(extrude_{first_id + 1})",
+    ]) + "\n"
+
+
+def _step(volume=1000.0, bbox=(0.0, 0.0, 0.0, 10.0, 10.0, 10.0), face_count=6, solid_count=1):
+    return {'extrude_id': 1, 'sketch_id': 1, 'plane': "'XY'", 'height': 1.0, 'boolean_op': None,
+            'volume': volume, 'bbox': bbox, 'solid_count': solid_count, 'face_count': face_count}
+
+
+def _record(tag, **step):
+    return {'code': _program(tag), 'step_boundaries': [0, 1], 'steps': [_step(volume=1000.0 + tag, **step)]}
+
+
+def test_canonical_program_renumbers_ids():
+    # 只是编号、注释和空行不同的程序视为重复
+    assert canonical_program(_program(3, first_id=7)) == canonical_program(_program(3))
+    assert program_key(_program(3, first_id=7)) == program_key(_program(3))
+    assert "# 样本" not in canonical_program(_program(3))
+    assert program_key(_program(3)) != program_key(_program(4))
+
+
+def test_canonical_program_shares_extrude_namespace():
+    code = "\n".join([
+        "extrude_5 = cq.Workplane('XY').placeSketch(Sketch.9).extrude(1)",
+        "extrude_2 = extrude_5.faces(Extrude.5).workplane()",
+        "  sketch = Sketch.4  ",
+    ])
+    # extrude_N 与 Extrude.N 共用编号，Sketch.N 单独编号
+    assert canonical_program(code) == "\n".join([
+        "extrude_1 = cq.Workplane('XY').placeSketch(Sketch.1).extrude(1)",
+        "extrude_2 = extrude_1.faces(Extrude.1).workplane()",
+        "sketch = Sketch.2",
+    ])
+    # 编号的首次出现顺序不同时不是同一个程序
+    swapped = "extrude_1 = extrude_2\nresult = extrude_2"
+    assert canonical_program(swapped) == "extrude_1 = extrude_2\nresult = extrude_2"
+    assert program_key(swapped) != program_key("extrude_2 = extrude_1\nresult = extrude_2")
+
+
+def test_geometry_key_quantization():
+    base = geometry_key([_step()])
+    # 只比较最后一步
+    assert geometry_key([_step(volume=5.0), _step()]) == base
+    # 体积保留4位有效数字，包围盒按0.01量化
+    assert geometry_key([_step(volume=1000.4)]) == base
+    assert geometry_key([_step(volume=1001.0)]) != base
+    assert geometry_key([_step(bbox=(0.0, 0.0, 0.0, 10.004, 10.0, 9.996))]) == base
+    assert geometry_key([_step(bbox=(0.0, 0.0, 0.0, 10.01, 10.0, 10.0))]) != base
+    assert geometry_key([_step(face_count=7)]) != base
+    assert geometry_key([_step(solid_count=2)]) != base
+    assert geometry_key([_step(volume=0.0)]) == geometry_key([_step(volume=None)])
+
+
+def _keys(start, count):
+    return [hashlib.blake2b(str(i).encode(), digest_size=16).digest() for i in range(start, start + count)]
+
+
+def test_bloom_filter_save_and_load(tmp_path):
+    bloom = BloomFilter(1000, error_rate=1e-3)
+    inserted = _keys(0, 1000)
+    assert not any(bloom.add(key) for key in inserted)
+    assert bloom.add(inserted[0])  # 已存在
+    path = str(tmp_path / "dedup.bloom")
+    bloom.save(path)
+
+    loaded = BloomFilter.load(path, 1000, error_rate=1e-3)
+    assert (loaded.size, loaded.hash_count, loaded.count) == (bloom.size, bloom.hash_count, 1000)
+    assert all(key in loaded for key in inserted)
+    false_positives = sum(key in loaded for key in _keys(1000, 10000))
+    assert false_positives < 50  # 期望约10个
+
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-1])
+    with pytest.raises(ValueError):
+        BloomFilter.load(path, 1000)
+    with open(path, "wb") as f:
+        f.write(b"X" * len(data))
+    with pytest.raises(ValueError):
+        BloomFilter.load(path, 1000)
+
+
+def test_pending_keys_catch_duplicates_before_commit(tmp_path):
+    path = str(tmp_path / "dedup.bloom")
+    deduper = SampleDeduplicator(path, capacity=1000, save_interval=None)
+    record = _record(1)
+    assert deduper.check(record) is None
+    # 尚未提交时不在过滤器中，但同一个样本再次出现仍按重复丢弃
+    assert deduper.bloom.count == 0
+    assert deduper.check(record) == 'program'
+    renamed = dict(record, code=_program(1, first_id=4))
+    assert deduper.check(renamed) == 'program'
+    assert deduper.check(dict(_record(2), steps=record['steps'])) == 'geometry'
+    assert deduper.duplicates == {'program': 2, 'geometry': 1}
+
+    deduper.add_keys(deduper.sample_keys(record))
+    assert deduper.pending_count == 0
+    assert deduper.bloom.count == 2
+    deduper.close()
+    # 重新读取保存的过滤器后仍判为重复
+    assert SampleDeduplicator(path, capacity=1000).check(record) == 'program'
+
+
+def test_directory_writer_adds_keys_after_each_batch(tmp_path):
+    deduper = SampleDeduplicator(capacity=1000, save_interval=None)
+    writer = SampleWriter(DirectoryBackend(str(tmp_path), batch_size=10), deduper=deduper)
+    record = _record(1)
+    assert deduper.check(record) is None
+    writer.submit(record)
+    assert deduper.pending_count == 0
+    assert all(key in deduper.bloom for key in deduper.sample_keys(record).values())
+
+
+def test_failed_write_does_not_add_keys(tmp_path, monkeypatch):
+    deduper = SampleDeduplicator(capacity=1000, save_interval=None)
+    writer = SampleWriter(DirectoryBackend(str(tmp_path), batch_size=10), deduper=deduper)
+
+    def fail(file_path, text):
+        raise OSError("磁盘已满")
+    monkeypatch.setattr("processors.output_backends.atomic_write_text", fail)
+    record = _record(1)
+    assert deduper.check(record) is None
+    with pytest.raises(SampleWriteError):
+        writer.submit(record)
+    assert deduper.bloom.count == 0
+
+
+def test_rolled_back_shard_keys_are_not_saved(tmp_path):
+    base_dir = str(tmp_path)
+    path = str(tmp_path / "dedup.bloom")
+    records = [_record(i) for i in range(3)]
+
+    deduper = SampleDeduplicator(path, capacity=1000, save_interval=0)
+    writer = SampleWriter(ShardBackend(base_dir, batch_size=100, shard_size=100), deduper=deduper)
+    for record in records:
+        assert deduper.check(record) is None
+        writer.submit(record)
+    # 分片未关闭，样本的编号未提交
+    writer.confirm_committed()
+    assert deduper.bloom.count == 0
+    deduper.save()
+    # 崩溃：不关闭分片，只留下保存的过滤器
+
+    backend = ShardBackend(base_dir, batch_size=100, shard_size=100)
+    assert backend.allocator.next_index == 0
+    deduper = SampleDeduplicator(path, capacity=1000, save_interval=0)
+    writer = SampleWriter(backend, deduper=deduper)
+    # 被回退的样本重新生成时不是重复样本
+    for record in records:
+        assert deduper.check(record) is None
+        writer.submit(record)
+    writer.close()
+    backend.close()
+    writer.confirm_committed()
+    deduper.close()
+
+    deduper = SampleDeduplicator(path, capacity=1000)
+    assert [deduper.check(record) for record in records] == ['program'] * 3
+
+
+def test_async_writer_adds_keys_after_commit(tmp_path):
+    base_dir = str(tmp_path)
+    deduper = SampleDeduplicator(capacity=1000, save_interval=None)
+    backend = ShardBackend(base_dir, batch_size=100, shard_size=4)
+    writer = AsyncSampleWriter(backend, deduper=deduper)
+    records = [_record(i) for i in range(5)]
+    for record in records:
+        assert deduper.check(record) is None
+        writer.submit(record)
+    writer.close()
+    # 每个样本2个文件，前4个样本所在的两个分片已提交，最后一个样本在关闭后端时提交
+    assert deduper.pending_count == 2
+    assert deduper.bloom.count == 8
+    backend.close()
+    writer.confirm_committed()
+    assert deduper.pending_count == 0
+    assert deduper.bloom.count == 10
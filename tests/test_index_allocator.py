@@ -0,0 +1,129 @@
+"""
+文件编号分配器的断点续传：重新打开、崩溃恢复、日志与状态文件不一致
+"""
+import json
+import os
+
+import pytest
+
+from processors.index_allocator import JOURNAL_FILE_NAME, STATE_FILE_NAME, FileIndexAllocator
+
+
+def _write_sample(allocator, count):
+    start_index = allocator.allocate(count)
+    for index in range(start_index, start_index + count):
+        with open(allocator.file_path(index), "w", encoding="utf-8") as f:
+            f.write(f"# {index}\n")
+    return start_index
+
+
+def _crash():
+    raise KeyboardInterrupt
+
+
+def _existing(allocator, start_index, count):
+    return [os.path.exists(allocator.file_path(index, create_dir=False))
+            for index in range(start_index, start_index + count)]
+
+
+def test_allocate_commit_reopen(tmp_path):
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    first = _write_sample(allocator, 3)
+    allocator.commit(first)
+    second = _write_sample(allocator, 2)
+    allocator.commit(second)
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == []
+    assert reopened.next_index == 5
+    assert all(_existing(reopened, 0, 5))
+    assert reopened.read_journal() == [(0, 3), (3, 2)]
+    assert reopened.allocate(1) == 5
+
+
+def test_uncommitted_range_is_removed_on_reopen(tmp_path):
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    allocator.commit(_write_sample(allocator, 2))
+    _write_sample(allocator, 3)  # 崩溃：未提交
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == [(2, 3)]
+    assert _existing(reopened, 0, 5) == [True, True, False, False, False]
+    assert not reopened.is_committed(2)
+    assert reopened.allocate(1) == 2
+    # 回退的编号被重新分配并提交后视为已提交
+    reopened.commit(2)
+    assert reopened.is_committed(2)
+
+
+def test_batch_size_mismatch_is_rejected(tmp_path):
+    FileIndexAllocator(str(tmp_path), batch_size=4)
+    with pytest.raises(ValueError):
+        FileIndexAllocator(str(tmp_path), batch_size=8)
+
+
+def test_torn_journal_line_is_truncated(tmp_path):
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    allocator.commit(_write_sample(allocator, 2))
+    _write_sample(allocator, 2)
+    # 追加日志时崩溃：只写了半行，状态文件中该区间仍未提交
+    with open(tmp_path / JOURNAL_FILE_NAME, "a", encoding="utf-8") as f:
+        f.write("2 ")
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == [(2, 2)]
+    assert _existing(reopened, 0, 4) == [True, True, False, False]
+    reopened.commit(_write_sample(reopened, 1))
+    assert (tmp_path / JOURNAL_FILE_NAME).read_text(encoding="utf-8") == "0 2\n2 1\n"
+    assert reopened.read_journal() == [(0, 2), (2, 1)]
+
+
+def test_journaled_range_survives_crash_before_state_save(tmp_path, monkeypatch):
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    allocator.commit(_write_sample(allocator, 2))
+    start_index = _write_sample(allocator, 3)
+
+    # 日志已追加、状态文件尚未替换时崩溃
+    monkeypatch.setattr(allocator, "_save_state", _crash)
+    with pytest.raises(KeyboardInterrupt):
+        allocator.commit(start_index)
+    state = json.loads((tmp_path / STATE_FILE_NAME).read_text(encoding="utf-8"))
+    assert state["pending"] == [[2, 3]]
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == []
+    assert all(_existing(reopened, 0, 5))
+    assert reopened.is_committed(start_index)
+    assert reopened.allocate(1) == 5
+
+
+def test_partially_journaled_merged_range(tmp_path, monkeypatch):
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    first = _write_sample(allocator, 2)
+    second = _write_sample(allocator, 2)  # 状态文件中与first合并为一个区间
+    monkeypatch.setattr(allocator, "_save_state", _crash)
+    with pytest.raises(KeyboardInterrupt):
+        allocator.commit(first)
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == [(second, 2)]
+    assert _existing(reopened, 0, 4) == [True, True, False, False]
+    assert reopened.is_committed(first) and not reopened.is_committed(second)
+    assert reopened.allocate(1) == 2
+
+
+def test_state_ahead_of_journal(tmp_path):
+    # 已有数据的目录首次使用时扫描得到起始编号，日志中没有这些样本
+    batch_dir = tmp_path / "batch_0"
+    batch_dir.mkdir()
+    for index in range(3):
+        (batch_dir / f"cad_model_{index}.py").write_text("# old\n", encoding="utf-8")
+    allocator = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert allocator.next_index == 3
+    assert allocator.read_journal() == []
+
+    reopened = FileIndexAllocator(str(tmp_path), batch_size=4)
+    assert reopened.recovered_ranges == []
+    assert reopened.next_index == 3
+    assert all(_existing(reopened, 0, 3))
+    assert reopened.is_committed(0)
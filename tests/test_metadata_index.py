@@ -0,0 +1,117 @@
+"""
+元数据索引：写入与查询、崩溃后已提交的样本不缺少索引行、未提交的样本被删除（只写入字符串程序，不需要CadQuery）
+"""
+import os
+
+import pytest
+
+from processors.metadata_index import MetadataIndex
+from processors.output_backends import DirectoryBackend, ShardBackend
+from processors.sample_writer import AsyncSampleWriter, SampleWriter
+
+
+def _record(tag):
+    code = "\n".join([
+        "import cadquery as cq",
+        f"extrude_1 = cq.Workplane('XY').box({tag}, 1, 1)",
+        "result = extrude_1",
+        f"extrude_2 = cq.Workplane('XZ', origin=(0.0, 1.50, 0.0)).box(1, {tag}, 1)",
+        "result = result.cut(extrude_2)",
+    ]) + "\n"
+    steps = [
+        {'extrude_id': 1, 'sketch_id': 1, 'plane': "'XY'", 'height': 1.0, 'boolean_op': None,
+         'volume': float(tag), 'bbox': (0.0, 0.0, 0.0, tag, 1.0, 1.0), 'solid_count': 1, 'face_count': 6},
+        {'extrude_id': 2, 'sketch_id': 2, 'plane': "'XZ', origin=(0.0, 1.50, 0.0)", 'height': 1.0,
+         'boolean_op': 'cut', 'volume': tag - 0.5, 'bbox': (0.0, 0.0, 0.0, tag, 1.0, 1.0), 'solid_count': 1,
+         'face_count': 8},
+    ]
+    return {'code': code, 'step_boundaries': [0, 1], 'steps': steps, 'seed': 3, 'index': tag}
+
+
+def _crash(index):
+    # 进程被强制终止：未提交的事务丢失
+    index._conn.close()
+    index._conn = None
+
+
+def _sample_ids(path):
+    with MetadataIndex(path) as index:
+        return [row['sample_id'] for row in index.query()]
+
+
+def test_add_and_query(tmp_path):
+    path = str(tmp_path / "metadata.sqlite")
+    backend = DirectoryBackend(str(tmp_path), batch_size=10)
+    with MetadataIndex(path) as index:
+        writer = SampleWriter(backend, index)
+        for tag in (1, 2, 3):
+            writer.submit(_record(tag))
+        rows = index.query(min_volume=1.5)
+        assert [row['sample_id'] for row in rows] == [2, 4]
+        assert rows[0]['path'] == os.path.join("batch_0", "cad_model_2.py")
+        assert (rows[0]['op_count'], rows[0]['union_count'], rows[0]['cut_count']) == (2, 0, 1)
+        assert (rows[0]['final_volume'], rows[0]['xmax'], rows[0]['seed'], rows[0]['seed_index']) == (1.5, 2, 3, 2)
+        assert [step['plane_name'] for step in index.steps(2)] == ['XY', 'XZ']
+        assert index.count(planes=['XZ'], boolean_op='cut') == 3
+        assert index.count(boolean_op='union') == 0
+
+
+@pytest.mark.parametrize("async_write", [False, True], ids=["sync", "async"])
+def test_directory_samples_keep_rows_after_crash(tmp_path, async_write):
+    base_dir = str(tmp_path)
+    path = str(tmp_path / "metadata.sqlite")
+    backend = DirectoryBackend(base_dir, batch_size=10)
+    index = MetadataIndex(path, commit_every=100)
+    writer = AsyncSampleWriter(backend, index) if async_write else SampleWriter(backend, index)
+    for tag in range(1, 4):
+        writer.submit(_record(tag))
+    writer.close()
+    _crash(index)
+
+    # 远少于commit_every个样本，但每个已提交的样本都有索引行
+    backend = DirectoryBackend(base_dir, batch_size=10)
+    assert backend.allocator.next_index == 6
+    with MetadataIndex(path) as index:
+        assert index.prune(backend.allocator.next_index) == 0
+    assert _sample_ids(path) == [0, 2, 4]
+
+
+def test_shard_samples_keep_rows_after_crash(tmp_path):
+    base_dir = str(tmp_path)
+    path = str(tmp_path / "metadata.sqlite")
+    index = MetadataIndex(path, commit_every=100)
+    # 每个样本2个文件，每个分片2个样本
+    writer = SampleWriter(ShardBackend(base_dir, batch_size=100, shard_size=4), index)
+    for tag in range(1, 6):
+        writer.submit(_record(tag))
+    _crash(index)  # 最后一个分片未关闭
+
+    backend = ShardBackend(base_dir, batch_size=100, shard_size=4)
+    assert backend.allocator.next_index == 8
+    with MetadataIndex(path) as index:
+        assert index.prune(backend.allocator.next_index) == 0
+    assert _sample_ids(path) == [0, 2, 4, 6]
+
+
+def test_rows_committed_before_numbers_are_pruned(tmp_path, monkeypatch):
+    base_dir = str(tmp_path)
+    path = str(tmp_path / "metadata.sqlite")
+    index = MetadataIndex(path, commit_every=100)
+    backend = ShardBackend(base_dir, batch_size=100, shard_size=4)
+    writer = SampleWriter(backend, index)
+    writer.submit(_record(1))
+
+    def crash(start_indices):
+        raise KeyboardInterrupt
+    # 索引的事务已提交，编号提交前崩溃
+    monkeypatch.setattr(backend.allocator, "commit_many", crash)
+    with pytest.raises(KeyboardInterrupt):
+        writer.submit(_record(2))
+    _crash(index)
+    assert _sample_ids(path) == [0, 2]
+
+    backend = ShardBackend(base_dir, batch_size=100, shard_size=4)
+    assert backend.allocator.next_index == 0
+    with MetadataIndex(path) as index:
+        assert index.prune(backend.allocator.next_index) == 2
+    assert _sample_ids(path) == []
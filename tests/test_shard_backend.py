@@ -0,0 +1,158 @@
+"""
+分片布局的读写往返与崩溃恢复（只写入字符串程序，不需要CadQuery）
+"""
+import json
+import os
+
+import pytest
+
+from processors.index_allocator import FileIndexAllocator
+from processors.output_backends import ShardBackend, build_sample_files, iter_shard_files
+
+
+def _program(tag, step_count=2):
+    lines = ["import cadquery as cq", ""]
+    for step in range(step_count):
+        lines.append(f"extrude_{step + 1} = cq.Workplane('XY').box({tag}, {step + 1}, 1)")
+        lines.append(f"result = extrude_{step + 1}")
+    return "\n".join(lines) + "\n"
+
+
+def _codec(compressed):
+    if not compressed:
+        return None
+    pytest.importorskip("zstandard")
+    from processors.compression import ProgramCodec
+    # 原始内容字典（不需要训练）
+    return ProgramCodec(b"import cadquery as cq\nextrude_1 = cq.Workplane('XY').box(\nresult = ")
+
+
+def _expected_files(programs, layout, pattern="cad_model_{index}.py"):
+    expected = []
+    for code in programs:
+        for content in build_sample_files(code, layout)[0]:
+            expected.append((pattern.format(index=len(expected)), content))
+    return expected
+
+
+def _shard_names(base_dir):
+    return sorted(os.listdir(os.path.join(base_dir, "shards")))
+
+
+@pytest.mark.parametrize("compressed", [False, True], ids=["tar", "zstd"])
+@pytest.mark.parametrize("layout", ["sequence", "program"])
+def test_round_trip(tmp_path, layout, compressed):
+    codec = _codec(compressed)
+    base_dir = str(tmp_path)
+    programs = [_program(i, step_count=1 + i % 3) for i in range(7)]
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=3, layout=layout, codec=codec)
+    locations = backend.write_samples(programs)
+    backend.close()
+
+    assert list(iter_shard_files(base_dir, codec)) == _expected_files(programs, layout)
+    extension = ".zst" if compressed else ".tar"
+    assert all(name.endswith((extension, ".idx.json")) for name in _shard_names(base_dir))
+    # 每个样本的位置指向其第一个文件所在的分片
+    for _, location in locations:
+        shard_name, member = location['path'][len("shards/"):].split("#")
+        index_path = os.path.join(base_dir, "shards", shard_name.rsplit(".", 1)[0] + ".idx.json")
+        with open(index_path, "r", encoding="utf-8") as f:
+            names = [entry["name"] for entry in json.load(f)["entries"]]
+        assert member in names
+        assert member.startswith(f"cad_model_{location['first_index']}.py")
+    assert FileIndexAllocator(base_dir, batch_size=4).recovered_ranges == []
+
+
+def test_numbering_continues_after_restart_and_missing_index(tmp_path):
+    base_dir = str(tmp_path)
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    backend.write_samples([_program(i) for i in range(4)])
+    backend.close()
+    assert _shard_names(base_dir) == ['shard_000000.idx.json', 'shard_000000.tar',
+                                      'shard_000001.idx.json', 'shard_000001.tar']
+
+    # 缺少一个索引文件时，新分片也不会覆盖已有分片
+    os.remove(os.path.join(base_dir, "shards", "shard_000001.idx.json"))
+    with open(os.path.join(base_dir, "shards", "shard_000001.tar"), "rb") as f:
+        orphan = f.read()
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    assert backend._next_shard == 2
+    backend.write_samples([_program(4), _program(5)])
+    backend.close()
+    with open(os.path.join(base_dir, "shards", "shard_000001.tar"), "rb") as f:
+        assert f.read() == orphan
+    assert [name for name, _ in iter_shard_files(base_dir)] == [
+        "cad_model_0.py", "cad_model_1.py", "cad_model_4.py", "cad_model_5.py"]
+
+
+def test_unfinished_shard_is_discarded(tmp_path):
+    base_dir = str(tmp_path)
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    backend.write_samples([_program(0), _program(1)])
+    backend.write_sample(_program(2))  # 崩溃：分片尚未写满，只有 .tmp
+    assert "shard_000001.tar.tmp" in _shard_names(base_dir)
+
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    assert _shard_names(base_dir) == ['shard_000000.idx.json', 'shard_000000.tar']
+    assert backend.allocator.recovered_ranges == [(2, 1)]
+    backend.write_samples([_program(3), _program(4)])
+    backend.close()
+    contents = dict(iter_shard_files(base_dir))
+    assert sorted(contents) == ["cad_model_0.py", "cad_model_1.py", "cad_model_2.py", "cad_model_3.py"]
+    assert contents["cad_model_2.py"] == build_sample_files(_program(3), 'program')[0][0]
+
+
+def test_shard_crashed_before_commit_is_discarded(tmp_path, monkeypatch):
+    base_dir = str(tmp_path)
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    backend.write_sample(_program(0))
+
+    def crash(start_indices):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(backend.allocator, "commit_many", crash)
+    with pytest.raises(KeyboardInterrupt):
+        backend.write_sample(_program(1))
+    assert _shard_names(base_dir) == ['shard_000000.idx.json.tmp', 'shard_000000.tar.tmp']
+
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    assert _shard_names(base_dir) == []
+    assert backend._next_shard == 0
+    assert backend.allocator.next_index == 0
+
+
+def test_shard_crashed_after_commit_is_published(tmp_path, monkeypatch):
+    base_dir = str(tmp_path)
+    programs = [_program(0), _program(1)]
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    backend.write_sample(programs[0])
+
+    real_replace = os.replace
+
+    def crash_on_shard_rename(source, target):
+        if source.endswith(".tar.tmp"):
+            raise KeyboardInterrupt
+        return real_replace(source, target)
+    monkeypatch.setattr("processors.output_backends.os.replace", crash_on_shard_rename)
+    with pytest.raises(KeyboardInterrupt):
+        backend.write_sample(programs[1])
+    monkeypatch.undo()
+
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    assert _shard_names(base_dir) == ['shard_000000.idx.json', 'shard_000000.tar']
+    assert backend._next_shard == 1
+    assert backend.allocator.next_index == 2
+    assert list(iter_shard_files(base_dir)) == _expected_files(programs, 'program')
+
+
+def test_half_written_index_is_discarded(tmp_path):
+    base_dir = str(tmp_path)
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    backend.write_sample(_program(0))
+    backend._fileobj.flush()
+    # 写索引的临时文件时崩溃（分片的编号必然未提交）
+    with open(os.path.join(base_dir, "shards", "shard_000000.idx.json.tmp"), "w", encoding="utf-8") as f:
+        f.write('{"shard": "shard_000000.tar", "sample_st')
+
+    backend = ShardBackend(base_dir, batch_size=4, shard_size=2, layout='program')
+    assert _shard_names(base_dir) == []
+    assert backend.allocator.recovered_ranges == [(0, 1)]
@@ -0,0 +1,126 @@
+"""
+草图代码生成中按端点连接边：网格哈希索引与原来的逐条扫描得到完全相同的连接顺序
+"""
+import math
+import random
+from array import array
+
+import pytest
+
+pytest.importorskip("cadquery")
+
+from generators import sketch_code_generator
+from generators.sketch_code_generator import CONNECT_TOLERANCE, _EndpointIndex, generate_sketch_code
+from generators.sketch_record import EDGE_CIRCLE, EDGE_LINE, SketchRecord
+
+
+class LinearScanIndex:
+    """原实现：每一步扫描所有未使用的边，按 (距离, 边序号, 起点优先) 选择，距离超过容差时不连接"""
+
+    def __init__(self, edge_info_list, tolerance=CONNECT_TOLERANCE):
+        self.edge_info_list = edge_info_list
+        self.tolerance = tolerance
+
+    def take_nearest(self, last_pt):
+        next_edge_info = None
+        min_dist = float('inf')
+        reverse_next = False
+        for edge_info in self.edge_info_list:
+            if edge_info['used']:
+                continue
+            dist_to_start = math.sqrt((edge_info['start'][0] - last_pt[0])**2 +
+                                      (edge_info['start'][1] - last_pt[1])**2)
+            dist_to_end = math.sqrt((edge_info['end'][0] - last_pt[0])**2 +
+                                    (edge_info['end'][1] - last_pt[1])**2)
+            if dist_to_start < min_dist:
+                min_dist = dist_to_start
+                next_edge_info = edge_info
+                reverse_next = False
+            if dist_to_end < min_dist:
+                min_dist = dist_to_end
+                next_edge_info = edge_info
+                reverse_next = True
+        if next_edge_info is None or min_dist > self.tolerance:
+            return None, False
+        return next_edge_info, reverse_next
+
+
+# 端点相对于网格点的偏移：重合、容差内、恰好在容差上、略超出容差
+_OFFSETS = [0.0, 0.3 * CONNECT_TOLERANCE, CONNECT_TOLERANCE, CONNECT_TOLERANCE * (1 - 1e-12),
+            CONNECT_TOLERANCE * (1 + 1e-12), 1.5 * CONNECT_TOLERANCE, 2 * CONNECT_TOLERANCE]
+
+
+def _random_point(rng, grid):
+    x, y = rng.choice(grid)
+    angle = rng.choice([0.0, math.pi / 2, math.pi, math.pi / 4, rng.uniform(0, 2 * math.pi)])
+    offset = rng.choice(_OFFSETS)
+    return x + offset * math.cos(angle), y + offset * math.sin(angle)
+
+
+def _random_edge_infos(rng, edge_count):
+    # 端点集中在少数网格点附近，制造大量距离相同或接近容差的候选
+    grid = [(rng.randint(-3, 3) * 0.5 + 1000 * rng.choice([0, 1]) * CONNECT_TOLERANCE, rng.randint(-3, 3) * 0.5)
+            for _ in range(max(3, edge_count // 3))]
+    return [{'start': _random_point(rng, grid), 'mid': (0.0, 0.0), 'end': _random_point(rng, grid),
+             'curve_type': EDGE_LINE, 'used': False} for _ in range(edge_count)]
+
+
+def _chain(index_class, edge_infos, start_pt):
+    edge_infos = [dict(edge_info) for edge_info in edge_infos]
+    index = index_class(edge_infos)
+    order = []
+    last_pt = start_pt
+    for _ in range(len(edge_infos)):
+        edge_info, reverse = index.take_nearest(last_pt)
+        if edge_info is None:
+            break
+        edge_info['used'] = True
+        order.append((edge_infos.index(edge_info), reverse))
+        last_pt = edge_info['start'] if reverse else edge_info['end']
+    return order
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_grid_index_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    edge_infos = _random_edge_infos(rng, rng.randint(2, 40))
+    for start_pt in (edge_infos[0]['end'], edge_infos[-1]['start']):
+        assert _chain(_EndpointIndex, edge_infos, start_pt) == _chain(LinearScanIndex, edge_infos, start_pt)
+
+
+def _record_from_edges(edge_infos, rng):
+    points = array('d')
+    edge_types = array('b')
+    for edge_info in edge_infos:
+        (sx, sy), (ex, ey) = edge_info['start'], edge_info['end']
+        edge_type = rng.choice([EDGE_LINE, EDGE_CIRCLE])
+        mx, my = (sx + ex) / 2, (sy + ey) / 2
+        if edge_type == EDGE_CIRCLE:
+            mx, my = mx + 0.1 * (ey - sy), my - 0.1 * (ex - sx)
+        points.extend((sx, sy, mx, my, ex, ey))
+        edge_types.append(edge_type)
+    circles = array('d', [0.0, 0.0, -1.0] * len(edge_infos))
+    return SketchRecord(edge_types, points, circles, array('i', [len(edge_infos)]))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_generate_sketch_code_identical(seed, monkeypatch):
+    rng = random.Random(seed)
+    sketch = _record_from_edges(_random_edge_infos(rng, rng.randint(2, 40)), rng)
+    indexed_code = generate_sketch_code(sketch)
+    monkeypatch.setattr(sketch_code_generator, "_EndpointIndex", LinearScanIndex)
+    assert generate_sketch_code(sketch) == indexed_code
+
+
+def test_equal_distance_after_rounding_prefers_lower_edge():
+    # 两个端点的平方距离相差1ulp，开方后相同：原实现按边序号选择第0条边
+    near = (0.0004958545045947026, 6.425192816672493e-05)
+    far = (-0.0004999999378131211, -2.493729636284422e-07)
+    assert far[0] ** 2 + far[1] ** 2 > near[0] ** 2 + near[1] ** 2
+    assert math.sqrt(far[0] ** 2 + far[1] ** 2) == math.sqrt(near[0] ** 2 + near[1] ** 2)
+    edge_infos = [
+        {'start': far, 'mid': (0.0, 0.0), 'end': (1.0, 0.0), 'curve_type': EDGE_LINE, 'used': False},
+        {'start': near, 'mid': (0.0, 0.0), 'end': (0.0, 1.0), 'curve_type': EDGE_LINE, 'used': False},
+    ]
+    assert _chain(LinearScanIndex, edge_infos, (0.0, 0.0))[0] == (0, False)
+    assert _chain(_EndpointIndex, edge_infos, (0.0, 0.0))[0] == (0, False)
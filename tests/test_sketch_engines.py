@@ -0,0 +1,49 @@
+"""
+两种草图布尔运算方式（'face'与参考实现'solid'）在一段种子上的一致性
+
+退化或极薄的情况下两者可能不同，已知的差异记录在ACCEPTED_DISCREPANCIES中；
+新出现或消失的差异都会使测试失败，需要确认后更新记录。
+"""
+import random
+
+import pytest
+
+cq = pytest.importorskip("cadquery")
+
+from generators.sketch_generator import generate_2d_sketch
+
+
+SEEDS = range(60)
+# 种子 -> (face的区域面积, solid的区域面积)
+ACCEPTED_DISCREPANCIES = {
+    30: ([2.625, 2.625], [0.031]),  # solid只得到一个极薄的区域
+    51: ([9.375, 9.375], [0.0]),
+}
+
+
+def _region_areas(seed, engine):
+    areas = []
+    for wires in generate_2d_sketch(rng=random.Random(seed), engine=engine):
+        outer = max(wires, key=lambda w: w.BoundingBox().DiagonalLength)
+        inners = [w for w in wires if w is not outer]
+        areas.append(cq.Face.makeFromWires(outer, inners).Area())
+    return sorted(areas)
+
+
+def _same_areas(a, b):
+    return len(a) == len(b) and all(x == pytest.approx(y, abs=1e-3) for x, y in zip(a, b))
+
+
+def test_face_engine_matches_solid_engine_except_known_cases():
+    discrepancies = {}
+    for seed in SEEDS:
+        face_areas = _region_areas(seed, 'face')
+        solid_areas = _region_areas(seed, 'solid')
+        if not _same_areas(face_areas, solid_areas):
+            discrepancies[seed] = (face_areas, solid_areas)
+
+    assert set(discrepancies) == set(ACCEPTED_DISCREPANCIES)
+    for seed, (face_areas, solid_areas) in discrepancies.items():
+        expected_face, expected_solid = ACCEPTED_DISCREPANCIES[seed]
+        assert face_areas == pytest.approx(expected_face, abs=1e-3)
+        assert solid_areas == pytest.approx(expected_solid, abs=1e-3)
@@ -0,0 +1,107 @@
+"""
+步骤预筛选：拉伸体包围盒与CadQuery一致（各平面的方向和符号），以及每种排除规则和余量
+"""
+import pytest
+
+cq = pytest.importorskip("cadquery")
+
+from generators.sketch_record import SketchRecord
+from generators.step_prefilter import PREFILTER_MARGIN, StepPrefilter, parse_plane, tool_bbox
+
+
+# 不以原点为中心的草图，u方向 [1, 3]，v方向 [-2, 0.5]
+POLYGON = [(1.0, -2.0), (3.0, -2.0), (3.0, 0.5), (1.0, 0.5)]
+SKETCH = SketchRecord.from_polygons([POLYGON])
+PLANES = ["'XY'", "'YZ'", "'XZ'", "'XY', origin=(0.0, 0.0, 2.5)", "'YZ', origin=(-1.0, 0.0, 0.0)",
+          "'XZ', origin=(0.0, 1.50, 0.0)", "'XZ', origin=(0.5, -3.0, 1.0)"]
+
+
+def _extrude(plane, height):
+    workplane = eval(f"cq.Workplane({plane})")
+    return workplane.polyline(POLYGON).close().extrude(height)
+
+
+def _bbox(shape):
+    box = shape.val().BoundingBox()
+    return box.xmin, box.ymin, box.zmin, box.xmax, box.ymax, box.zmax
+
+
+@pytest.mark.parametrize("height", [2.0, -1.5])
+@pytest.mark.parametrize("plane", PLANES)
+def test_tool_bbox_matches_cadquery(plane, height):
+    assert tool_bbox(SKETCH.bounds(), plane, height) == pytest.approx(_bbox(_extrude(plane, height)), abs=1e-6)
+
+
+def test_xz_normal_points_to_negative_y():
+    # XZ平面的法向为 -Y：正高度向 -Y 方向拉伸
+    assert tool_bbox((0, 0, 1, 1), "'XZ'", 2.0)[1::3] == (-2.0, 0.0)
+    assert tool_bbox((0, 0, 1, 1), "'XZ'", -2.0)[1::3] == (0.0, 2.0)
+
+
+def test_parse_plane():
+    assert parse_plane("'XZ', origin=(0.0, 1.50, 0.0)") == ('XZ', (0.0, 1.5, 0.0))
+    assert parse_plane("XY") == ('XY', (0.0, 0.0, 0.0))
+    assert parse_plane("Face:>Z") is None
+    assert tool_bbox(SKETCH.bounds(), "Face:>Z", 1.0) is None
+
+
+# 当前结果：XY平面上以原点为角的 [0, 10]³ 立方体
+RESULT_BBOX = (0.0, 0.0, 0.0, 10.0, 10.0, 10.0)
+
+
+def _square(x0, y0, size=1.0):
+    return SketchRecord.from_polygons([[(x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size)]])
+
+
+def test_zero_height():
+    prefilter = StepPrefilter()
+    assert prefilter.check(_square(0, 0), "'XY'", 0, 'union', RESULT_BBOX) == 'zero_height'
+    assert prefilter.rejections['zero_height'] == 1
+
+
+def test_degenerate_sketch():
+    flat = SketchRecord.from_polygons([[(0.0, 0.0), (2.0, 0.0), (1.0, 0.0)]])
+    assert StepPrefilter().check(flat, "'XY'", 1.0, None, None) == 'degenerate_sketch'
+
+
+@pytest.mark.parametrize("boolean_op, reason", [('cut', 'disjoint_cut'), ('union', 'disjoint_union')])
+def test_disjoint_tool_is_rejected(boolean_op, reason):
+    prefilter = StepPrefilter()
+    # 位于立方体上方 z ∈ [11, 12]
+    assert prefilter.check(_square(2, 2), "'XY', origin=(0.0, 0.0, 11.0)", 1.0, boolean_op, RESULT_BBOX) == reason
+    # XZ平面正高度向 -Y 拉伸，与立方体（y ≥ 0）不相交
+    assert prefilter.check(_square(2, 2), "'XZ', origin=(0.0, -0.5, 0.0)", 3.0, boolean_op, RESULT_BBOX) == reason
+    assert prefilter.rejections[reason] == 2
+
+
+def test_overlapping_and_first_step_are_accepted():
+    prefilter = StepPrefilter()
+    # XZ平面负高度向 +Y 拉伸，进入立方体
+    assert prefilter.check(_square(2, 2), "'XZ', origin=(0.0, -0.5, 0.0)", -3.0, 'cut', RESULT_BBOX) is None
+    assert prefilter.check(_square(2, 2), "'XY'", 1.0, 'union', RESULT_BBOX) is None
+    # 首个步骤、结果包围盒未知、面工作平面时不排除
+    assert prefilter.check(_square(20, 20), "'XY'", 1.0, None, None) is None
+    assert prefilter.check(_square(20, 20), "'XY'", 1.0, 'cut', None) is None
+    assert prefilter.check(_square(20, 20), "Face:>Z", 1.0, 'cut', RESULT_BBOX) is None
+    assert prefilter.total_rejections == 0
+
+
+@pytest.mark.parametrize("boolean_op", ['cut', 'union'])
+def test_margin(boolean_op):
+    prefilter = StepPrefilter()
+    inside_margin = 10.0 + PREFILTER_MARGIN * 0.8
+    outside_margin = 10.0 + PREFILTER_MARGIN * 1.2
+    # 间隔小于余量（如坐标保留两位小数的误差）时保留给OCC验证
+    assert prefilter.check(_square(inside_margin, 2), "'XY'", 1.0, boolean_op, RESULT_BBOX) is None
+    assert prefilter.check(_square(outside_margin, 2), "'XY'", 1.0, boolean_op, RESULT_BBOX) is not None
+    # 恰好接触的拉伸体也保留
+    assert prefilter.check(_square(10.0, 2), "'XY'", 1.0, boolean_op, RESULT_BBOX) is None
+
+
+def test_disjoint_union_really_gives_two_solids():
+    # 被排除的合并步骤在CadQuery中确实产生多个实体（与验证的拒绝条件一致）
+    base = cq.Workplane('XY').box(10, 10, 10, centered=False)
+    tool = cq.Workplane('XY', origin=(0.0, 0.0, 11.0)).rect(1, 1).extrude(1)
+    assert StepPrefilter().check(_square(-0.5, -0.5), "'XY', origin=(0.0, 0.0, 11.0)", 1.0, 'union',
+                                 _bbox(base)) == 'disjoint_union'
+    assert len(base.union(tool).solids().vals()) == 2
@@ -0,0 +1,80 @@
+"""
+前缀去重布局（# cq-steps: 步骤边界行）与逐步布局（每步一个文件）重建出相同的每步代码
+"""
+import pytest
+
+from processors.output_backends import DirectoryBackend, ShardBackend
+from processors.step_sequence import (build_program_file, build_step_codes, compute_step_boundaries,
+                                      iter_step_codes, parse_program_file, parse_step_file, rebuild_step_code)
+from processors.token_export import iter_dataset_programs
+
+
+GENERATED = (
+    "import cadquery as cq\n"
+    "from cadquery_tracker import create_tracker\n"
+    "\n"
+    "# 创建追踪器实例\n"
+    "tracker = create_tracker()\n"
+    "\n"
+    "extrude_1 = (\n"
+    "    cq.Workplane('XY')\n"
+    "    .rect(2, 1)\n"
+    "    .extrude(3)\n"
+    ")\n"
+    "result = extrude_1\n"
+    "\n"
+    "extrude_2 = cq.Workplane('XZ').circle(0.5).extrude(-1)\n"
+    "result = result.cut(extrude_2)\n"
+    "\n"
+    "extrude_3 = cq.Workplane(result.faces('>Z').workplane()).rect(1, 1).extrude(1)\n"
+    "result = result.union(extrude_3)\n"
+)
+PROGRAMS = [
+    GENERATED,
+    GENERATED.rstrip("\n"),  # 末尾没有换行符
+    "import cadquery as cq\nresult = cq.Workplane('XY').box(1, 1, 1)\n",  # 单步
+    "import cadquery as cq\nx = 1\nimport math\nresult = x\n    result = x + 1\nresult = x + 2",  # 导入语句在中间
+    "import cadquery as cq\nshape = cq.Workplane('XY').box(1, 1, 1)\n",  # 没有result行
+]
+
+
+@pytest.mark.parametrize("code", PROGRAMS)
+def test_program_file_rebuilds_step_files(code):
+    step_codes = build_step_codes(code)
+    content, step_count = build_program_file(code)
+    assert step_count == len(step_codes)
+    for step, step_code in enumerate(step_codes):
+        assert rebuild_step_code(content, step) == step_code
+        assert rebuild_step_code(content, step - step_count) == step_code
+    assert list(iter_step_codes(content)) == step_codes
+    assert list(iter_step_codes(content, with_header=False)) == [
+        parse_step_file(step_code)[2] for step_code in step_codes]
+
+
+@pytest.mark.parametrize("code", PROGRAMS)
+def test_step_boundaries_match_last_step_file(code):
+    # iter_dataset_programs对逐步布局的最后一步文件调用compute_step_boundaries，对前缀去重布局调用parse_program_file
+    step_codes = build_step_codes(code)
+    step, step_count, last_code = parse_step_file(step_codes[-1])
+    assert (step, step_count) == (len(step_codes) - 1, len(step_codes))
+    body, step_line_counts = compute_step_boundaries(last_code)
+    body_lines, program_line_counts = parse_program_file(build_program_file(code)[0])
+    assert step_line_counts == program_line_counts
+    assert body.split('\n')[:step_line_counts[-1]] == body_lines[:program_line_counts[-1]]
+
+
+@pytest.mark.parametrize("backend_class", [DirectoryBackend, ShardBackend])
+def test_dataset_programs_identical_for_both_layouts(tmp_path, backend_class):
+    programs = {}
+    for layout in ('sequence', 'program'):
+        base_dir = str(tmp_path / layout)
+        backend = backend_class(base_dir, batch_size=4, layout=layout)
+        backend.write_samples(PROGRAMS)
+        backend.close()
+        programs[layout] = list(iter_dataset_programs(base_dir))
+    assert len(programs['program']) == len(PROGRAMS)
+    # 样本ID为各自布局中第一个文件的编号，其余内容相同
+    assert [item[1:] for item in programs['sequence']] == [item[1:] for item in programs['program']]
+    for (_, lines, step_line_counts), code in zip(programs['program'], PROGRAMS):
+        expected = [parse_step_file(step_code)[2] for step_code in build_step_codes(code)]
+        assert ["\n".join(lines[:line_count]) for line_count in step_line_counts] == expected
@@ -0,0 +1,99 @@
+"""
+增量验证会话的状态隔离：被回滚的候选步骤不能影响之后的步骤
+"""
+import pytest
+
+pytest.importorskip("cadquery")
+
+from generators.code_validator import ValidatorPool
+
+
+# 追踪器按名称记录面，第一次记录的面生效（与按拉伸编号命名的面标识一致：被拒绝的步骤与之后的步骤使用相同编号）
+BASE_CODE = (
+    "import cadquery as cq\n"
+    "\n"
+    "class Tracker:\n"
+    "    def __init__(self):\n"
+    "        self.faces = {}\n"
+    "\n"
+    "    def record(self, name, selector):\n"
+    "        self.faces.setdefault(name, selector)\n"
+    "\n"
+    "tracker = Tracker()\n"
+)
+REJECTED_STEP = (
+    "tracker.record('Extrude.1', '>X')\n"
+    "result = cq.Workplane('XY').box(2, 1, 1).cut(cq.Workplane('XY').box(3, 3, 3))\n"
+)
+ACCEPTED_STEP = (
+    "tracker.record('Extrude.1', '>Z')\n"
+    "result = cq.Workplane('XY').box(2, 1, 1)\n"
+)
+FACE_STEP = (
+    "face = result.faces(tracker.faces['Extrude.1']).val()\n"
+    "plane = cq.Plane(origin=face.Center(), normal=face.normalAt())\n"
+    "extrude_2 = cq.Workplane(plane).rect(0.5, 0.5).extrude(1)\n"
+    "result = result.union(extrude_2)\n"
+)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ValidatorPool(size=1) as validator_pool:
+        yield validator_pool
+
+
+def test_rolled_back_step_does_not_change_later_face_step(pool):
+    with pool.session(BASE_CODE) as session:
+        success, metrics, error_msg = session.try_fragment(REJECTED_STEP)
+        assert success, error_msg
+        session.rollback()
+        success, _, error_msg = session.try_fragment(ACCEPTED_STEP)
+        assert success, error_msg
+        session.commit()
+        success, session_metrics, error_msg = session.try_fragment(FACE_STEP)
+        assert success, error_msg
+        code = session.code + FACE_STEP
+
+    # 与在新命名空间中执行保存下来的完整程序得到相同的结果
+    success, fresh_metrics, error_msg = pool.run(code)
+    assert success, error_msg
+    assert session_metrics['bbox'] == pytest.approx(fresh_metrics['bbox'])
+    assert session_metrics['volume'] == pytest.approx(fresh_metrics['volume'])
+    # 面选择使用被接受步骤记录的顶面（>Z），而不是被回滚步骤记录的侧面（>X）
+    assert session_metrics['bbox'][5] == pytest.approx(1.5)
+
+
+def test_failed_fragment_cannot_be_committed(pool):
+    with pool.session(BASE_CODE) as session:
+        success, _, error_msg = session.try_fragment(ACCEPTED_STEP)
+        assert success, error_msg
+        session.commit()
+        success, _, _ = session.try_fragment("result = result.faces('>Q').workplane()\n")
+        assert not success
+        with pytest.raises(RuntimeError):
+            session.commit()
+        assert session.code == BASE_CODE + ACCEPTED_STEP
+
+        # 重放恢复时只执行有效的已提交代码
+        session._release()
+        success, metrics, error_msg = session.try_fragment(FACE_STEP)
+        assert success, error_msg
+        assert session.replay_count == 1
+        assert metrics['bbox'][5] == pytest.approx(1.5)
+
+
+def test_queued_apply_does_not_use_next_request_timeout():
+    slow_step = "import time\ntime.sleep(1.2)\n" + ACCEPTED_STEP
+    with ValidatorPool(size=1, timeout=60) as slow_pool:
+        with slow_pool.session(BASE_CODE) as session:
+            # 工作进程启动（导入cadquery）较慢，启动后再缩短超时时间
+            assert session.try_fragment(ACCEPTED_STEP)[0]
+            session.commit()
+            slow_pool.timeout = 2
+            session.apply(slow_step)
+            # apply与该请求共需约2.4秒，超过单个任务的超时时间，但各自都在超时之内
+            success, metrics, error_msg = session.try_fragment("time.sleep(1.2)\n" + FACE_STEP)
+            assert success, error_msg
+            assert metrics['bbox'][5] == pytest.approx(1.5)
+        assert slow_pool.restart_count == 0
@@ -0,0 +1,25 @@
+from processors.virtual_dataset import VirtualCADDataset
+
+
+def test_disk_cache_is_keyed_by_generation_params(tmp_path):
+    dataset = VirtualCADDataset(global_seed=1, size=10, cache_dir=str(tmp_path))
+    record = {'code': "result = None\n", 'step_boundaries': [1], 'steps': [], 'index': 3, 'seed': 1}
+    dataset._save_cached(3, record)
+    assert dataset._load_cached(3) == record
+
+    # 只有样本数不同时共用缓存
+    assert VirtualCADDataset(global_seed=1, size=100, cache_dir=str(tmp_path))._load_cached(3) == record
+    # 种子或生成参数不同时不会读到该样本
+    assert VirtualCADDataset(global_seed=2, size=10, cache_dir=str(tmp_path))._load_cached(3) is None
+    assert VirtualCADDataset(global_seed=1, size=10, max_opera_cnt=5, cache_dir=str(tmp_path))._load_cached(3) is None
+
+
+def test_cache_key_depends_on_sketch_library():
+    dataset = VirtualCADDataset(global_seed=1, size=10)
+    key = dataset.cache_key()
+    dataset.sketch_library = {"path": "/a", "meta_hash": "abc", "stratify": None}
+    with_library = dataset.cache_key()
+    dataset.sketch_library = {"path": "/b", "meta_hash": "abc", "stratify": None}
+    assert dataset.cache_key() == with_library  # 路径不同但是同一个库
+    dataset.sketch_library = {"path": "/a", "meta_hash": "abc", "stratify": "edges"}
+    assert len({key, with_library, dataset.cache_key()}) == 3